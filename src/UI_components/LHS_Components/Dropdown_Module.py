@@ -1,7 +1,7 @@
 from PyQt6.QtWidgets import QWidget, QHBoxLayout, QComboBox
 from PyQt6.QtCore import pyqtSignal
 from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
-from utils.file_reader.File_Reader import loadFileData
+from utils.file_reader.File_Load_Scheduler import FileLoadScheduler
 
 class DropdownWidget(QWidget):
     channelChanged = pyqtSignal(str)  # Signal to emit when channel changes
@@ -12,6 +12,7 @@ class DropdownWidget(QWidget):
     
     def build_dropdown_widgets(self):
         self.media_data_manager = MediaDataManager()
+        self.file_load_scheduler = FileLoadScheduler()
 
         dropdown_layout = QHBoxLayout()
 
@@ -41,7 +42,8 @@ class DropdownWidget(QWidget):
         pass
 
     def on_channels_dropdown_index_changed(self):
-        loadFileData(self.media_data_manager.get_file_path(), self.channels_dropdown.currentText())
+        self.file_load_scheduler.request_load(self.media_data_manager.get_file_path(),
+                                              self.channels_dropdown.currentText(), debounce=False)
         
     def on_dropdown3_index_changed(self):
         pass
@@ -4,8 +4,9 @@ from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTr
 from PyQt6.QtGui import QFileSystemModel
 from PyQt6.QtCore import Qt, QSortFilterProxyModel
 from utils.Folder_Opener_Module.Folder_Opener import FolderOpener
-from utils.file_reader.File_Reader import loadFileData
+from utils.file_reader.File_Load_Scheduler import FileLoadScheduler
 import os
+import numpy as np
 from utils.constants import FILE_EXTS
 from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
 
@@ -85,6 +86,7 @@ class FileDetailingSystemWidget(QWidget):
 
     def buildFileDetailingSystem(self):
         self.media_data_manager = MediaDataManager()
+        self.file_load_scheduler = FileLoadScheduler()
         fileDetailingLayout = QHBoxLayout(self)
 
         self.fileTreeView = QTreeView(self)
@@ -138,6 +140,7 @@ class FileDetailingSystemWidget(QWidget):
         self.setLayout(fileDetailingLayout)
         self.folderOpener.folderReceived.connect(self.populateFileTree)
         self.media_data_manager.new_file_loaded.connect(self.load_table_data)
+        self.file_load_scheduler.metadata_probed.connect(self.load_probed_table_data)
 
 
     ###     DATA TABLE RELATED FUNCTIONS    ###
@@ -152,6 +155,24 @@ class FileDetailingSystemWidget(QWidget):
         self.fileDetailsWidget.setItem(7, 1, QTableWidgetItem(str(self.media_data_manager.get_cw_channel())))
         self.adjustTableSize()
 
+    def load_probed_table_data(self, file_path, probed_data):
+        # Fill the table from the file headers, probed by the file load scheduler while the file is still loading
+        metadata, _ = probed_data
+        self.fileDetailsWidget.setItem(0, 1, QTableWidgetItem(str(metadata["Frames"])))
+        self.fileDetailsWidget.setItem(1, 1, QTableWidgetItem(str(round(self._first_value(metadata["X Range (nm)"]), 4))))
+        self.fileDetailsWidget.setItem(2, 1, QTableWidgetItem(str(round(metadata["Speed (FPS)"], 4))))
+        self.fileDetailsWidget.setItem(3, 1, QTableWidgetItem(str(round(metadata["Line/s (Hz)"], 4))))
+        self.fileDetailsWidget.setItem(4, 1, QTableWidgetItem(str(metadata["Y Pixel Dimensions"])))
+        self.fileDetailsWidget.setItem(5, 1, QTableWidgetItem(str(metadata["X Pixel Dimensions"])))
+        self.fileDetailsWidget.setItem(6, 1, QTableWidgetItem(str(round(self._first_value(metadata["Pixel/nm Scaling Factor"]), 4))))
+        self.fileDetailsWidget.setItem(7, 1, QTableWidgetItem(str(metadata["Current channel"])))
+        self.adjustTableSize()
+
+    @staticmethod
+    def _first_value(value):
+        # Per frame metadata is stored as a list, the table shows the value of the first frame
+        return value[0] if isinstance(value, (list, tuple, np.ndarray)) else value
+
     def update_table_data(self, frame_no):
         frame_metadata = self.media_data_manager.get_frames_metadata_per_frame(frame_no=frame_no)
         self.fileDetailsWidget.setItem(1, 1, QTableWidgetItem(str(round(frame_metadata["X Range (nm)"], 4))))
@@ -189,12 +210,15 @@ class FileDetailingSystemWidget(QWidget):
     def onFileClicked(self, index):
         file_path = self.fileSystemModel.filePath(self.fileFilterProxyModel.mapToSource(index))
         # Open the file when it is single-clicked
-        loadFileData(file_path)
+        self.file_load_scheduler.request_load(file_path, debounce=False)
 
     def onSelectionChanged(self, selected, deselected):
         indexes = selected.indexes()
         if indexes:
-            self.onFileClicked(indexes[0])  # Open the file when it is highlighted with arrow keys
+            # Open the file when it is highlighted with arrow keys. Loads are debounced, so holding an arrow key
+            # only decodes the file the selection stops on
+            file_path = self.fileSystemModel.filePath(self.fileFilterProxyModel.mapToSource(indexes[0]))
+            self.file_load_scheduler.request_load(file_path)
 
 
 if __name__ == '__main__':
@@ -1,18 +1,24 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QHBoxLayout, QComboBox, QSpinBox, QCheckBox, QPushButton, 
-    QSlider, QGridLayout, QRadioButton, QButtonGroup, QScrollArea, QSizePolicy
+    QSlider, QGridLayout, QRadioButton, QButtonGroup, QScrollArea, QSizePolicy, QProgressBar
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QFont
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
 import numpy as np
-from numpy.polynomial import Polynomial
 from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
+from core.Image_Processing_Module.Levelling import level_frames, auto_level_frames, AUTO_LEVELLING_MODES, PREVIEW_MAX_FIT_PIXELS
+from core.Image_Processing_Module.Filtering import (filter_frames, filter_preview_frame, preview_frame_indices,
+                                                   FILTER_FUNCTIONS, TEMPORAL_FILTERS)
+from core.Image_Processing_Module.Frame_Parallel_Executor import FrameParallelExecutor, ProcessingStage
 
-AUTO_LIST = ["Off", "Iterative 1nm High", "Iterative -1nm Low", "Iterative High Low", "High-Low x2 (Fit)", "Iterative Fit Holes", "Iterative Fit Peaks"]
-FILTER_LIST = ["Off", "Gaussian", "Median", "Mean", "Non-local mean", "High-pass", "Top Hat", "Sliding Mean Frames", "Sphere Deconvolution", "Mean All", "Median all", "Fill Mask", "Scar Fill"]
+AUTO_LIST = ["Off", *AUTO_LEVELLING_MODES]
+FILTER_LIST = ["Off", *FILTER_FUNCTIONS]
 MASK_METHOD_LIST = ["histogram", "otsu", "2 level otsu", "step detection", "adaptive"]
+# The preview follows the displayed frame once it has stayed on one frame this long, so it is not levelled again on
+# every frame while playing or scrubbing
+PREVIEW_SETTLE_MS = 200
 
 class LevelingWidget(QWidget):
 
@@ -22,9 +28,16 @@ class LevelingWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.media_data_manager = MediaDataManager()  # Initialize the MediaDataManager
+        self.frame_executor = FrameParallelExecutor()
         self.build_leveling_module()
         self.current_image = None  # Initialize with None
         self.imgt = None
+        self.current_frame_no = 0
+        self.previewed_frame_no = None
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.timeout.connect(self.preview_current_frame)
+        self.media_data_manager.new_file_loaded.connect(self.on_new_file_loaded)
 
     class CustomSpinBox(QSpinBox):
         def wheelEvent(self, event):
@@ -46,6 +59,22 @@ class LevelingWidget(QWidget):
         button_layout.addWidget(self.zero_all_button)
         button_layout.addWidget(self.restore_button)
 
+        # Progress of levelling and filtering jobs running over every frame
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setFixedSize(self.cancel_button.sizeHint())
+        self.cancel_button.setEnabled(False)
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_button)
+
+        self.cancel_button.clicked.connect(self.frame_executor.cancel)
+        self.frame_executor.progress.connect(self.on_processing_progress)
+        self.frame_executor.finished.connect(self.on_processing_stopped)
+        self.frame_executor.cancelled.connect(self.on_processing_stopped)
+        self.frame_executor.failed.connect(self.on_processing_stopped)
+
         lhs_layout = QVBoxLayout()
         container_layout = QHBoxLayout()
         
@@ -54,6 +83,7 @@ class LevelingWidget(QWidget):
         lhs_layout.addLayout(self.filtering_layout)
         lhs_layout.addStretch(1)
         lhs_layout.addLayout(button_layout)
+        lhs_layout.addLayout(progress_layout)
 
         container_layout.addLayout(lhs_layout)
         container_layout.addWidget(self.graph_widget)
@@ -85,6 +115,7 @@ class LevelingWidget(QWidget):
         self.auto_label = QLabel("Auto:")
         self.auto_dropdown = QComboBox()
         self.auto_dropdown.addItems(AUTO_LIST)
+        self.auto_dropdown.currentTextChanged.connect(self.update_image)
         auto_dropdown_layout.addWidget(self.auto_label)
         auto_dropdown_layout.addWidget(self.auto_dropdown)
         leveling_layout.addLayout(auto_dropdown_layout)
@@ -163,29 +194,87 @@ class LevelingWidget(QWidget):
         return leveling_layout
 
     def update_image(self):
-        polyx = self.x_plane_spinbox.value()
-        polyy = self.y_plane_spinbox.value()
-        line_plane = "plane" if self.plane_label.text() == "Plane" else "line"
-
-        frames = self.media_data_manager.get_frames()
+        frames = self.media_data_manager.storage["Target"].get_frames()
 
         if frames is None:
             print("Error: No frames loaded in MediaDataManager.")
             return
 
-        leveled_image = apply_levelling(frames, polyx, polyy, line_plane, self.imgt)
-
-        # If there are multiple frames, display them as an animation or loop
-        if leveled_image.ndim == 3:
-            for i in range(leveled_image.shape[0]):
-                plt.imshow(leveled_image[i], cmap='rainbow')
-                plt.title(f"Updated Image {i+1}/{leveled_image.shape[0]}: {line_plane.capitalize()} X: {polyx}, Y: {polyy}")
-                plt.show()
+        operation, kwargs = self.get_levelling_operation()
+        filter_kwargs = self.get_filter_kwargs()
+
+        # Only the displayed frame is levelled and filtered straight away, with the backgrounds fitted on a small proxy
+        # so it keeps up with the spinboxes. Filters along the frame axis also need the frames around it. Processing
+        # every frame is deferred until the preview is accepted
+        frame_no = min(self.current_frame_no, len(frames) - 1)
+        indices = preview_frame_indices(frame_no, len(frames), filter_kwargs["filter_name"], filter_kwargs["size"])
+        per_frame_mask = self.imgt is not None and np.ndim(self.imgt) == 3
+        imgt = self.imgt[indices] if per_frame_mask else self.imgt
+        levelled = operation(np.stack([frames[index] for index in indices]), imgt=imgt,
+                             max_fit_pixels=PREVIEW_MAX_FIT_PIXELS, **kwargs)
+        frame_imgt = self.imgt[frame_no] if per_frame_mask else self.imgt
+        preview_frame = filter_preview_frame(levelled, frame_no, indices, imgt=frame_imgt, **filter_kwargs)
+        self.previewed_frame_no = frame_no
+
+        # Per frame masks are split between the workers with the frames, a single mask is sent to each of them
+        if per_frame_mask:
+            mask_kwargs, mask_frame_kwargs = {}, {"imgt": self.imgt}
         else:
-            plt.imshow(leveled_image, cmap='rainbow')
-            plt.title(f"Updated Image: {line_plane.capitalize()} X: {polyx}, Y: {polyy}")
-            plt.show()
-
+            mask_kwargs, mask_frame_kwargs = {"imgt": self.imgt}, {}
+        stages = [ProcessingStage(operation, {**kwargs, **mask_kwargs}, mask_frame_kwargs)]
+        if filter_kwargs["filter_name"] in TEMPORAL_FILTERS:
+            # Every pixel is filtered along the frame axis on its own, so the workers are given rows of every frame
+            stages.append(ProcessingStage(filter_frames, filter_kwargs, chunk_axis=1))
+        elif filter_kwargs["filter_name"] != "Off":
+            stages.append(ProcessingStage(filter_frames, {**filter_kwargs, **mask_kwargs}, mask_frame_kwargs))
+        self.frame_executor.defer_stages(stages)
+
+        self.media_data_manager.write_frames(frame_no, preview_frame[None])
+
+    def get_levelling_operation(self):
+        # The levelling function for the current settings and its keyword arguments, apart from the mask
+        kwargs = {
+            "polyx": self.x_plane_spinbox.value(),
+            "polyy": self.y_plane_spinbox.value(),
+            "line_plane": "plane" if self.plane_label.text() == "Plane" else "line",
+        }
+        auto_mode = self.auto_dropdown.currentText()
+        if auto_mode in AUTO_LEVELLING_MODES:
+            return auto_level_frames, {**kwargs, "mode": auto_mode}
+        return level_frames, kwargs
+
+    def get_filter_kwargs(self):
+        # The keyword arguments of filter_frames for the current settings, apart from the mask
+        return {
+            "filter_name": self.filter_dropdown.currentText(),
+            "size": self.filter_spinbox.value(),
+            "subtract": self.subtract_mode_checkbox.isChecked(),
+        }
+
+    def set_current_frame(self, frame_no):
+        # Keep previewing the levelling and filtering on whichever frame is displayed until the preview is accepted.
+        # Every displayed frame restarts the timer, so during playback the preview waits until it is paused
+        self.current_frame_no = frame_no
+        if self.frame_executor.has_deferred_job() and frame_no != self.previewed_frame_no:
+            self.preview_timer.start(PREVIEW_SETTLE_MS)
+
+    def preview_current_frame(self):
+        # Writing the preview redisplays the same frame, which does not level it again
+        if self.frame_executor.has_deferred_job() and self.current_frame_no != self.previewed_frame_no:
+            self.update_image()
+
+    def on_new_file_loaded(self):
+        self.preview_timer.stop()
+        self.current_frame_no = 0
+        self.previewed_frame_no = None
+
+    def on_processing_progress(self, frames_done, total_frames):
+        self.progress_bar.setRange(0, total_frames)
+        self.progress_bar.setValue(frames_done)
+        self.cancel_button.setEnabled(True)
+
+    def on_processing_stopped(self, *args):
+        self.cancel_button.setEnabled(False)
 
 
     def build_filtering_layout(self):
@@ -201,6 +290,7 @@ class LevelingWidget(QWidget):
         self.filter_label = QLabel("Filter:")
         self.filter_dropdown = QComboBox()
         self.filter_dropdown.addItems(FILTER_LIST)
+        self.filter_dropdown.currentTextChanged.connect(self.update_image)
         filter_dropdown_layout.addWidget(self.filter_label)
         filter_dropdown_layout.addWidget(self.filter_dropdown)
         filtering_layout.addLayout(filter_dropdown_layout)
@@ -210,12 +300,15 @@ class LevelingWidget(QWidget):
         self.filter_spinbox_label = QLabel("Spinbox:")
         self.filter_spinbox = self.CustomSpinBox()
         self.filter_spinbox.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Preferred)
+        self.filter_spinbox.setValue(3)
+        self.filter_spinbox.valueChanged.connect(self.update_image)
         filter_spinbox_layout.addWidget(self.filter_spinbox_label)
         filter_spinbox_layout.addWidget(self.filter_spinbox)
         filtering_layout.addLayout(filter_spinbox_layout)
 
         # Subtract Mode Checkbox
         self.subtract_mode_checkbox = QCheckBox("Subtract mode")
+        self.subtract_mode_checkbox.toggled.connect(self.update_image)
         filtering_layout.addWidget(self.subtract_mode_checkbox)
 
         return filtering_layout
@@ -319,109 +412,13 @@ class LevelingWidget(QWidget):
     
 
 def apply_levelling(img, polyx, polyy, line_plane, imgt):
-    # Convert the image to float64 to ensure the operations are compatible
-    r = img.astype(np.float64).copy()
+    """
+    Level the frames with polynomial backgrounds, see level_frames.
 
-    # Initialize an empty list to hold the processed frames
-    processed_frames = []
-
-    # Iterate over each frame if there are multiple frames
-    for frame in range(r.shape[0]):
-        img_frame = r[frame, :, :]  # Extract the current frame
-
-        if imgt is None:
-            imgt_frame = img_frame > -np.inf
-        else:
-            imgt_frame = imgt[frame, :, :] if imgt.ndim == 3 else imgt  # Adjust imgt for the current frame
-
-        if line_plane == 'plane':
-            xp = np.nanmean(imgt_frame * img_frame, axis=1)
-            print(f"[DEBUG] Shape of xp after np.nanmean: {xp.shape}")
-
-            # Ensure xp is 1D by squeezing the array
-            xp = np.squeeze(xp)
-            print(f"[DEBUG] Shape of xp after squeezing: {xp.shape}")
-
-            # Ensure xp is 1D
-            if xp.ndim != 1:
-                raise ValueError(f"Unexpected array shape for xp, expected 1D array but got {xp.shape}.")
-
-            valid_xp = ~np.isnan(xp)
-            xf = xp[valid_xp]
-            xl = np.arange(len(xp))[valid_xp]
-
-            if polyx > 0 and len(xl) > 0:
-                p = np.polyfit(xl, xf, polyx)
-                img_frame -= np.polyval(p, np.arange(img_frame.shape[0]))[:, None]  # Correct broadcasting
-                print(f"[DEBUG] Shape of img_frame after polyx subtraction: {img_frame.shape}")
-
-            yp = np.nanmean(img_frame, axis=1)
-            print(f"[DEBUG] Shape of yp after np.nanmean: {yp.shape}")
-
-            # Ensure yp is 1D by squeezing the array
-            yp = np.squeeze(yp)
-            print(f"[DEBUG] Shape of yp after squeezing: {yp.shape}")
-
-            # Ensure yp is 1D
-            if yp.ndim != 1:
-                raise ValueError(f"Unexpected array shape for yp, expected 1D array but got {yp.shape}.")
-
-            valid_yp = ~np.isnan(yp)
-            yf = yp[valid_yp]
-            yl = np.arange(len(yp))[valid_yp]
-
-            if polyy > 0 and len(yl) > 0:
-                p = np.polyfit(yl, yf, polyy)
-                img_frame -= np.polyval(p, np.arange(img_frame.shape[1]))
-                print(f"[DEBUG] Shape of img_frame after polyy subtraction: {img_frame.shape}")
-
-        elif line_plane == 'line':
-            if polyx > 0:
-                xl = np.arange(img_frame.shape[1])
-                y2 = np.zeros_like(img_frame)
-                mask_line = []
-
-                for i in range(img_frame.shape[0]):
-                    pos = imgt_frame[i, :] > 0
-                    if np.sum(pos) > polyx + 8:
-                        y1 = img_frame[i, pos]
-                        x1 = xl[pos]
-                        p = np.polyfit(x1, y1, polyx)
-                        y2[i, :] = np.polyval(p, np.arange(img_frame.shape[1]))
-                        img_frame[i, :] -= y2[i, :]
-                    else:
-                        mask_line.append(i)
-
-                for i in mask_line:
-                    img_frame[i, :] = img_frame[i, :] - np.nanmedian(y2)
-
-            if polyy > 0:
-                for i in range(img_frame.shape[1]):
-                    yp = np.nanmean(img_frame[:, i])
-                    print(f"[DEBUG] Shape of yp before squeezing in line: {yp.shape}")
-
-                    # Ensure yp is 1D by squeezing the array
-                    yp = np.squeeze(yp)
-                    print(f"[DEBUG] Shape of yp after squeezing in line: {yp.shape}")
-
-                    # Ensure yp is 1D
-                    if yp.ndim != 1:
-                        print(f"yp in line is not 1D, shape is: {yp.shape}")
-                        raise ValueError("Unexpected array shape for yp in line, expected 1D array.")
-
-                    valid_yp = ~np.isnan(yp)
-                    yf = yp[valid_yp]
-                    yl = np.arange(img_frame.shape[0])[valid_yp]
-
-                    if len(yl) >= polyy:
-                        p = np.polyfit(yl, yf, polyy)
-                        img_frame[:, i] -= np.polyval(p, np.arange(img_frame.shape[0]))
-
-        # Append the processed frame to the list
-        processed_frames.append(np.squeeze(img_frame))  # Ensure the frame is squeezed to remove any singleton dimensions
-
-    # Stack all processed frames back into a 3D array if there are multiple frames
-    return np.stack(processed_frames, axis=0) if len(processed_frames) > 1 else np.squeeze(processed_frames[0])
+    Returns the levelled frames as float32 (N x H x W), or a single H x W frame if only one frame was given.
+    """
+    levelled = level_frames(img, polyx, polyy, line_plane, imgt)
+    return levelled if levelled.shape[0] > 1 else levelled[0]
 
 
 
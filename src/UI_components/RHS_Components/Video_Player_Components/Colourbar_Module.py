@@ -59,11 +59,15 @@ class MatplotlibColourBarWidget(QWidget):
         else:
             raise ValueError("You must provide either a tuple (min, max) or two individual arguments min and max.")
         
+        # Called for every frame during playback. Redraw only when the limits change (never with the whole movie or
+        # manual depth controls), and coalesce redraws rather than blocking playback on them
+        if (min_val, max_val) == (self.norm.vmin, self.norm.vmax):
+            return
         self.norm.vmax = max_val
         self.norm.vmin = min_val
 
         self.cbar.ax.yaxis.set_major_locator(ticker.MaxNLocator(nbins=5))
-        self.canvas.draw()
+        self.canvas.draw_idle()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
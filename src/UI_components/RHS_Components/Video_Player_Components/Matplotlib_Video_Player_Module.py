@@ -1,4 +1,7 @@
 import sys
+import time
+import threading
+from collections import deque
 import numpy as np
 from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QSizePolicy, QLayout
 from PyQt6.QtCore import pyqtSignal, QSize, QRect, QPoint, QThread
@@ -6,10 +9,14 @@ from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from mpl_toolkits.axes_grid1.anchored_artists import AnchoredSizeBar
 from matplotlib.offsetbox import AnchoredText
+from matplotlib.artist import Artist
 import matplotlib.font_manager as fm
 from core.Colormaps_Module.Colormaps import CMAPS, DEFAULT_CMAP_NAME
 import warnings
 from core.Image_Storage_Module.Depth_Control_Manager import DepthControlManager
+from core.Image_Storage_Module.Frame_Statistics import FrameStatistics
+from core.Image_Storage_Module.Frame_Source import is_lazy_frame_source
+from .Render_Ahead_Buffer_Module import RenderAheadBuffer
 
 # Try to import cupy for GPU acceleration
 try:
@@ -20,6 +27,13 @@ except ImportError:
     warnings.warn("CuPy not available. GPU acceleration will not be used.")
 
 DEFAULT_FPS = 20
+# Presented frames the achieved frame rate is measured over
+PLAYBACK_FPS_WINDOW_FRAMES = 60
+# Bin edges in milliseconds of the histogram of frame render times
+RENDER_TIME_BIN_EDGES_MS = (0, 2, 4, 8, 16, 33, 50, 100, 200, np.inf)
+# When playback falls further behind than this, e.g. after the machine was suspended, it carries on from the current
+# time instead of skipping frames to catch up
+PLAYBACK_RESYNC_SECONDS = 1.0
 
 class AspectRatioLayout(QLayout):
     def __init__(self, parent=None):
@@ -83,52 +97,174 @@ class AspectRatioLayout(QLayout):
         return QSize()
     
 
+class PrerenderedFrameImage(Artist):
+    """Draws an RGBA frame already colour mapped and resampled to the size of its axes in pixels.
+
+    Unlike an AxesImage the frame is drawn as it is, without being normalised, colour mapped or resampled again.
+    """
+
+    def __init__(self, ax):
+        super().__init__()
+        self.ax = ax
+        self.frame = None
+
+    def set_data(self, frame: np.ndarray):
+        self.frame = frame
+
+    def draw(self, renderer):
+        if self.frame is None or not self.get_visible():
+            return
+        # The renderer takes the rows bottom up
+        gc = renderer.new_gc()
+        renderer.draw_image(gc, round(self.ax.bbox.x0), round(self.ax.bbox.y0), self.frame[::-1])
+        gc.restore()
+
+
+class PlaybackStatistics:
+    """Instrumentation of playback: the achieved frame rate, dropped frames and a histogram of frame render times."""
+
+    def __init__(self):
+        self.presentation_times = deque(maxlen=PLAYBACK_FPS_WINDOW_FRAMES)
+        self.render_time_bin_edges = np.array(RENDER_TIME_BIN_EDGES_MS, dtype=float)
+        self.reset()
+
+    def reset(self):
+        self.presentation_times.clear()
+        self.render_time_counts = np.zeros(len(self.render_time_bin_edges) - 1, dtype=np.int64)
+        self.presented_frames = 0
+        self.dropped_frames = 0
+
+    def record_presented(self, render_seconds: float):
+        self.presentation_times.append(time.perf_counter())
+        bin_no = np.searchsorted(self.render_time_bin_edges, render_seconds * 1000, side="right") - 1
+        self.render_time_counts[min(bin_no, len(self.render_time_counts) - 1)] += 1
+        self.presented_frames += 1
+
+    def record_dropped(self, n_frames: int = 1):
+        self.dropped_frames += n_frames
+
+    @property
+    def achieved_fps(self) -> float:
+        # Over the most recently presented frames, so it follows changes of the requested frame rate
+        if len(self.presentation_times) < 2:
+            return 0.0
+        return (len(self.presentation_times) - 1) / (self.presentation_times[-1] - self.presentation_times[0])
+
+    def get_statistics(self) -> dict:
+        """Get the playback statistics since playback last started.
+
+        Returns
+        -------
+        dict
+            "Achieved FPS", "Presented frames", "Dropped frames", and "Render time histogram", a tuple of the counts and
+            the bin edges in milliseconds.
+        """
+        return {
+            "Achieved FPS": self.achieved_fps,
+            "Presented frames": self.presented_frames,
+            "Dropped frames": self.dropped_frames,
+            "Render time histogram": (self.render_time_counts.copy(), self.render_time_bin_edges.copy()),
+        }
+
+
 class FrameProcessor(QThread):
     frame_ready = pyqtSignal(object, int, float, float, float)
     update_scale_bar = pyqtSignal(int, int)
 
-    def __init__(self, video_frames, video_frames_metadata, depth_control_manager: DepthControlManager):
+    def __init__(self, video_frames, video_frames_metadata, depth_control_manager: DepthControlManager,
+                 emit_frames: bool = True):
         super().__init__()
         self.depth_control_manager = depth_control_manager
-        if HAS_GPU:
-            self.video_frames = cp.asarray(video_frames)
-        else:
-            self.video_frames = video_frames
-        self.video_frames_metadata = video_frames_metadata
+        # Players that draw frames from a render buffer only need the frame index and timestamp, so the frame is not
+        # decoded and its depth bounds are not calculated a second time here
+        self.emit_frames = emit_frames
+        self.set_video_frames(video_frames, video_frames_metadata)
         self.current_frame_index = 0
         self.running = False
         self.fps = DEFAULT_FPS
+        # Frames are spaced by their "Timestamp" metadata rather than by the fps when playing in real time
+        self.real_time = False
         self.nm_value = 0
         self.pix_length = 0
+        # Set while an emitted frame has not been drawn yet, so frames are dropped rather than queued behind it
+        self.frame_pending = threading.Event()
+        self.playback_statistics = PlaybackStatistics()
+
+    def set_video_frames(self, video_frames, video_frames_metadata):
+        # Lazy frame sources stay on the host so only the frames being shown are decoded
+        self.frames_on_gpu = self.emit_frames and HAS_GPU and not is_lazy_frame_source(video_frames)
+        if self.frames_on_gpu:
+            self.video_frames = cp.asarray(video_frames)
+        else:
+            self.video_frames = video_frames
+        self.video_frames_metadata = video_frames_metadata
 
     def run(self):
+        # Each frame is due at an absolute deadline on the monotonic clock, one frame interval after the previous
+        # deadline, so the time spent emitting and drawing frames does not add up and the frame rate does not drift.
+        # Frames that are already late when the next one is due are skipped, and frames due while the GUI is still
+        # drawing are dropped, so playback keeps to time when drawing cannot keep up
+        self.playback_statistics.reset()
+        self.frame_pending.clear()
+        deadline = time.perf_counter()
         while self.running:
-            frame = self.video_frames[self.current_frame_index]
-            if HAS_GPU:
-                processed_frame = cp.asnumpy(frame)
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.perf_counter()
+            if now - deadline > PLAYBACK_RESYNC_SECONDS:
+                deadline = now
+
+            frame_index = self.current_frame_index
+            while now >= deadline + (interval := self._frame_interval(frame_index)):
+                deadline += interval
+                frame_index = (frame_index + 1) % len(self.video_frames)
+                self.playback_statistics.record_dropped()
+
+            if self.frame_pending.is_set():
+                self.playback_statistics.record_dropped()
             else:
-                processed_frame = frame
-            vmin, vmax = self.depth_control_manager.get_min_max_depths_per_frame(self.current_frame_index)
-            timestamp = self.video_frames_metadata[self.current_frame_index].get("Timestamp", 0.0)  # Get timestamp from metadata
-            self.frame_ready.emit(processed_frame, self.current_frame_index, vmin, vmax, timestamp)
-            self._check_for_scale_bar_change(self.video_frames_metadata[self.current_frame_index]["Scale Bar nm Value"], self.video_frames_metadata[self.current_frame_index]["Scale Bar Pixel Length"])
+                self._emit_frame(frame_index)
 
-            self.current_frame_index = (self.current_frame_index + 1) % len(self.video_frames)
-            QThread.msleep(int(1000 / self.fps))
+            deadline += self._frame_interval(frame_index)
+            self.current_frame_index = (frame_index + 1) % len(self.video_frames)
 
     def seek_to_frame(self, frame_no):
         if 0 <= frame_no < len(self.video_frames):
             self.current_frame_index = frame_no
-            frame = self.video_frames[self.current_frame_index]
-            if HAS_GPU:
+            self._emit_frame(frame_no)
+
+    def frame_presented(self, render_seconds: float):
+        """Called once an emitted frame has been drawn, taking render_seconds, so the next frame can be emitted."""
+        self.playback_statistics.record_presented(render_seconds)
+        self.frame_pending.clear()
+
+    def _emit_frame(self, frame_index: int):
+        if self.emit_frames:
+            frame = self.video_frames[frame_index]
+            if self.frames_on_gpu:
                 processed_frame = cp.asnumpy(frame)
             else:
                 processed_frame = frame
-            vmin, vmax = self.depth_control_manager.get_min_max_depths_per_frame(self.current_frame_index)
-            timestamp = self.video_frames_metadata[self.current_frame_index].get("Timestamp", 0.0)  # Get timestamp from metadata
-            
-            self.frame_ready.emit(processed_frame, self.current_frame_index, vmin, vmax, timestamp)
-            self._check_for_scale_bar_change(self.video_frames_metadata[self.current_frame_index]["Scale Bar nm Value"], self.video_frames_metadata[self.current_frame_index]["Scale Bar Pixel Length"])
+            vmin, vmax = self.depth_control_manager.get_min_max_depths_per_frame(frame_index)
+        else:
+            processed_frame, vmin, vmax = None, np.nan, np.nan
+        timestamp = self.video_frames_metadata[frame_index].get("Timestamp", 0.0)  # Get timestamp from metadata
+
+        self.frame_pending.set()
+        self.frame_ready.emit(processed_frame, frame_index, vmin, vmax, timestamp)
+        self._check_for_scale_bar_change(self.video_frames_metadata[frame_index]["Scale Bar nm Value"], self.video_frames_metadata[frame_index]["Scale Bar Pixel Length"])
+
+    def _frame_interval(self, frame_index: int) -> float:
+        # Seconds from showing this frame to showing the next. In real time this is the difference of their timestamps,
+        # falling back to the fps where that is not positive, such as when playback loops back to the first frame
+        if self.real_time:
+            next_frame_index = (frame_index + 1) % len(self.video_frames)
+            interval = (self.video_frames_metadata[next_frame_index].get("Timestamp", 0.0)
+                        - self.video_frames_metadata[frame_index].get("Timestamp", 0.0))
+            if interval > 0:
+                return interval
+        return 1 / self.fps
 
 
     def _check_for_scale_bar_change(self, nm_value: int, pix_length: int):
@@ -161,6 +297,7 @@ class MatplotlibVideoPlayerWidget(QWidget):
         self.current_frame_index = 0
         self.aspect_ratio = 1.0
         self.fps = DEFAULT_FPS
+        self.real_time = False
         self.cmap_name = DEFAULT_CMAP_NAME
         self.scale_bar = None
         self.scale_bar_shown = False
@@ -168,23 +305,34 @@ class MatplotlibVideoPlayerWidget(QWidget):
         self.timestamp_shown = False
         self.has_content = False
         self.frame_processor = None
+        self.render_buffer = None
         self.is_playing = False
         self.timestamp_format = "{:.1f}s"  # Format for timestamp display
         self.scale_bar_color = "white"
         self.timestamp_color = "white"
+        # Everything except the image and timestamp, copied after each full draw so frames only redraw those two
+        self.background = None
+        self.draw_event_connection = None
 
-    def load_video_frames(self, video_frames: np.ndarray, video_frames_metadata: dict):
+        # Connect the depth control manager to update image if needed.
+        self.depth_control_manager.update_widgets.connect(self._on_depth_controls_changed)
+
+    def load_video_frames(self, video_frames: np.ndarray, video_frames_metadata: dict,
+                          frame_statistics: FrameStatistics | None = None):
         self.setContentsMargins(0, 0, 0, 0)
         self.reset()
 
         self.has_content = True
 
-        self.depth_control_manager.load_depth_control_data(video_frames, video_frames_metadata)
+        self.depth_control_manager.load_depth_control_data(video_frames, video_frames_metadata, frame_statistics)
 
         # Create and start the frame processor
-        self.frame_processor = FrameProcessor(video_frames, video_frames_metadata, self.depth_control_manager)
+        # Frames are drawn from the render buffer, so the frame processor only emits which frame is due
+        self.frame_processor = FrameProcessor(video_frames, video_frames_metadata, self.depth_control_manager,
+                                              emit_frames=False)
         self.frame_processor.frame_ready.connect(self._update_frame)
         self.frame_processor.update_scale_bar.connect(self._update_scale_bar)
+        self.frame_processor.real_time = self.real_time
 
         # Create a layout for the widget
         if self.layout is None:
@@ -204,15 +352,30 @@ class MatplotlibVideoPlayerWidget(QWidget):
             self.ax = self.fig.add_subplot(111)
         self.ax.axis('off')
 
-        # Display the first frame
-        self.image = self.ax.imshow(video_frames[0], cmap=CMAPS[self.cmap_name])
-        # self.enable_cbar_autoscale(True)
-
         # Get image dimensions and calculate aspect ratio
         self.image_height, self.image_width = video_frames[0].shape[:2]
         self.aspect_ratio = self.image_width / self.image_height
         self.layout.setAspectRatio(self.aspect_ratio)
 
+        # Frames are colour mapped and resampled to the canvas ahead of time by the render buffer's worker thread, so
+        # showing a frame only draws an RGBA image. The axes fill the canvas and span the image pixels, as they would
+        # with imshow, so the scale bar is still placed in image pixels
+        self.render_buffer = RenderAheadBuffer(video_frames, self.depth_control_manager)
+        self.render_buffer.set_colormap(CMAPS[self.cmap_name])
+        self.fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+        self.ax.set_xlim(-0.5, self.image_width - 0.5)
+        self.ax.set_ylim(self.image_height - 0.5, -0.5)
+        self.ax.set_aspect('auto')
+        self._set_render_size()
+        self.render_buffer.start()
+
+        # The image, scale bar and timestamp are animated, they are left out of full draws and blitted over the cached
+        # background instead
+        self.image = PrerenderedFrameImage(self.ax)
+        self.image.set_animated(True)
+        self.ax.add_artist(self.image)
+        self.background = None
+
         # Add a scale bar to the image
         self._add_scale_bar()
 
@@ -224,17 +387,40 @@ class MatplotlibVideoPlayerWidget(QWidget):
 
         # Connect the resize event
         self.canvas.mpl_connect('resize_event', self.on_resize)
+        if self.draw_event_connection is None:
+            self.draw_event_connection = self.canvas.mpl_connect('draw_event', self._on_draw)
 
         # Load first frame
         self.go_to_frame_no(0)
 
-        # Connect the depth control manager to update image if needed.
-        self.depth_control_manager.update_widgets.connect(lambda: self.go_to_frame_no(frame_no=self.current_frame_index))
         self.reset_widgets.connect(self.depth_control_manager.reset)
 
         self.updateGeometry()
 
 
+    def replace_video_frames(self, video_frames: np.ndarray, video_frames_metadata: dict,
+                             frame_statistics: FrameStatistics | None = None, start: int = 0, stop: int | None = None):
+        """
+        Show processed frames of the same shape in place of the current ones, keeping the current frame.
+
+        Only frames start to stop - 1 were changed, the other frames rendered ahead are kept unless their depth bounds
+        depend on the changed frames.
+        """
+        if self.frame_processor is None:
+            return
+        self.depth_control_manager.load_depth_control_data(video_frames, video_frames_metadata, frame_statistics)
+        self.frame_processor.set_video_frames(video_frames, video_frames_metadata)
+        self.render_buffer.set_frames(video_frames, start, stop)
+        if self.depth_control_manager.bounds_depend_on_other_frames():
+            self.render_buffer.invalidate()
+        self._redraw_current_frame()
+
+    def _redraw_current_frame(self):
+        # Only the displayed frame is drawn again. The frame processor is not seeked, so playback carries on from
+        # where it is
+        self.image.set_data(self.render_buffer.get_frame(self.current_frame_index))
+        self._blit()
+
     def reset(self):
         if not self.has_content:
             return
@@ -242,9 +428,14 @@ class MatplotlibVideoPlayerWidget(QWidget):
             self.frame_processor.stop()
             self.frame_processor.wait()
             self.frame_processor = None
+        if self.render_buffer:
+            self.render_buffer.stop()
+            self.render_buffer = None
         self.layout.setAspectRatio(1.0)
         self.ax.clear()
         self.ax.axis('off')
+        self.image = None
+        self.background = None
         self.canvas.draw()
         self.fps = DEFAULT_FPS
 
@@ -259,10 +450,19 @@ class MatplotlibVideoPlayerWidget(QWidget):
         
         # Update the image aspect ratio
         self.ax.set_aspect('auto')
+
+        # Frames rendered for the old size are rendered again, starting with the current one
+        if self.render_buffer:
+            self._set_render_size()
+            self.image.set_data(self.render_buffer.get_frame(self.current_frame_index))
         
         # Redraw the canvas
         self.canvas.draw()
 
+    def _set_render_size(self):
+        # Frames are resampled to the size of the axes in canvas pixels
+        self.render_buffer.set_output_size(round(self.ax.bbox.height), round(self.ax.bbox.width))
+
     def resizeEvent(self, event):
         super().resizeEvent(event)
         self.updateGeometry()
@@ -275,16 +475,47 @@ class MatplotlibVideoPlayerWidget(QWidget):
 
     ### Matplotlib video player functions ###
     def _update_frame(self, frame, current_frame_index, vmin, vmax, timestamp):
-        self.current_frame_index = current_frame_index
-        self.image.set_data(frame)
-        self.image.set_clim(vmin, vmax)
-
-        # Update timestamp
-        if self.timestamp_shown:
-            self._update_timestamp(timestamp)
-        
-        self.canvas.draw()
-        self.update_widgets.emit()
+        # Frames still queued by the frame processor of the previous file index frames that may no longer exist
+        if self.sender() is not self.frame_processor:
+            return
+        render_start = time.perf_counter()
+        try:
+            self.current_frame_index = current_frame_index
+            # Only the frame index and timestamp are emitted, the frame is usually ready in the render buffer already
+            # colour mapped with its depth bounds
+            self.image.set_data(self.render_buffer.get_frame(current_frame_index))
+
+            # Update timestamp
+            if self.timestamp_shown:
+                self._update_timestamp(timestamp)
+
+            self._blit()
+            self.update_widgets.emit()
+        finally:
+            # The frame processor holds back the next frame until this one is drawn
+            if self.frame_processor:
+                self.frame_processor.frame_presented(time.perf_counter() - render_start)
+
+    def _on_draw(self, event):
+        # A full draw leaves out the animated artists. Cache what was drawn as the background, then draw the animated
+        # artists over it so the full draw still shows them
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated_artists()
+
+    def _draw_animated_artists(self):
+        # The scale bar is drawn over the image, so it is animated too even though it rarely changes
+        for artist in (self.image, self.scale_bar, self.timestamp):
+            if artist is not None and artist.get_visible():
+                self.fig.draw_artist(artist)
+
+    def _blit(self):
+        # Restore the cached background and redraw only the image and timestamp, instead of the whole figure
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated_artists()
+        self.canvas.blit(self.fig.bbox)
 
     def _go_to_next_frame(self):
         if self.frame_processor:
@@ -310,6 +541,14 @@ class MatplotlibVideoPlayerWidget(QWidget):
     def get_fps(self):
         return self.fps
 
+    def set_real_time(self, real_time: bool):
+        self.real_time = real_time
+        if self.frame_processor:
+            self.frame_processor.real_time = real_time
+
+    def get_playback_statistics(self) -> dict:
+        return self.frame_processor.playback_statistics.get_statistics() if self.frame_processor else {}
+
     def skip_forward(self):
         if self.frame_processor:
             self.frame_processor.current_frame_index = min(
@@ -345,7 +584,8 @@ class MatplotlibVideoPlayerWidget(QWidget):
                                     color=self.scale_bar_color,
                                     frameon=False,
                                     size_vertical=1,
-                                    fontproperties=fontprops)
+                                    fontproperties=fontprops,
+                                    animated=True)
         self.ax.add_artist(self.scale_bar)
         if self.scale_bar_shown:
             self.show_scale_bar()
@@ -354,34 +594,18 @@ class MatplotlibVideoPlayerWidget(QWidget):
 
     def _update_scale_bar(self, nm_value: int, pixel_length: int):
         if self.scale_bar:
-            # Remove the old scale bar
-            self.scale_bar.remove()
-
             if nm_value < 1000:
                 scale_bar_text =  f'{nm_value} nm'
             elif nm_value < 1000000:
                 scale_bar_text =  f'{nm_value/1000:.1f} µm'
             else:
                 scale_bar_text = f'{nm_value/1000000:.2f} mm'
-            
-            # Create a new scale bar with updated values
-            fontprops = fm.FontProperties(size=10, weight='bold')
-            self.scale_bar = AnchoredSizeBar(self.ax.transData,
-                                            pixel_length, scale_bar_text, 'lower right', 
-                                            pad=0.1,
-                                            color=self.scale_bar_color,
-                                            frameon=False,
-                                            size_vertical=1,
-                                            fontproperties=fontprops)
-            
-            # Add the new scale bar to the axes
-            self.ax.add_artist(self.scale_bar)
-            
-            # Set visibility based on current state
-            self.scale_bar.set_visible(self.scale_bar_shown)
-            
-            # Redraw the canvas to show the updated scale bar
-            self.canvas.draw()
+
+            # Resize the bar and relabel it in place rather than building a new scale bar
+            self.scale_bar.size_bar.get_children()[0].set_width(pixel_length)
+            self.scale_bar.txt_label.set_text(scale_bar_text)
+
+            # Shown with the next frame, which is blitted straight after this
 
     def _add_timestamp(self):
         self.timestamp = AnchoredText(
@@ -390,6 +614,8 @@ class MatplotlibVideoPlayerWidget(QWidget):
             prop={'size': 10, 'weight': 'bold', 'color': 'white'},  # Set color to white
             frameon=False
         )
+        # Animated like the image, as it changes with every frame
+        self.timestamp.set_animated(True)
         self.ax.add_artist(self.timestamp)
         if self.scale_bar_shown:
             self.show_timescale()
@@ -400,32 +626,37 @@ class MatplotlibVideoPlayerWidget(QWidget):
         if self.timestamp:
             self.timestamp.txt.set_text(self.timestamp_format.format(timestamp))
     
-    def set_cmap(self, cmap_name: str):
-        if self.image:
-            self.image.set_cmap(CMAPS[cmap_name])
-            self.canvas.draw()
+    def _on_depth_controls_changed(self):
+        # Frames in the render buffer were colour mapped with the old depth bounds
+        if self.render_buffer:
+            self.render_buffer.invalidate()
+        self.go_to_frame_no(frame_no=self.current_frame_index)
 
+    def set_cmap(self, cmap_name: str):
         self.cmap_name = cmap_name
+        if self.render_buffer:
+            self.render_buffer.set_colormap(CMAPS[cmap_name])
+            self.go_to_frame_no(self.current_frame_index)
 
     def show_scale_bar(self):
         self.scale_bar.set_visible(True)
         self.scale_bar_shown = True
-        self.canvas.draw()
+        self._blit()
 
     def hide_scale_bar(self):
         self.scale_bar.set_visible(False)
         self.scale_bar_shown = False
-        self.canvas.draw()
+        self._blit()
 
     def show_timescale(self):
         self.timestamp.set_visible(True)
         self.timestamp_shown = True
-        self.canvas.draw()
+        self._blit()
 
     def hide_timescale(self):
         self.timestamp.set_visible(False)
         self.timestamp_shown = True
-        self.canvas.draw()
+        self._blit()
 
 if __name__ == '__main__':
     # Generate a random video using NumPy (100 frames of 100x100 RGB images)
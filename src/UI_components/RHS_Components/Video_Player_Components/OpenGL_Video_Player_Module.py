@@ -0,0 +1,615 @@
+import sys
+import time
+import ctypes
+import numpy as np
+from PyQt6.QtWidgets import QApplication, QWidget, QVBoxLayout, QSizePolicy
+from PyQt6.QtCore import pyqtSignal, Qt, QRectF
+from PyQt6.QtGui import QSurfaceFormat, QOpenGLContext, QPainter, QColor, QFont, QFontMetricsF, QPalette
+from PyQt6.QtOpenGLWidgets import QOpenGLWidget
+from matplotlib.colors import Colormap
+from core.Colormaps_Module.Colormaps import CMAPS, DEFAULT_CMAP_NAME
+import warnings
+from core.Image_Storage_Module.Depth_Control_Manager import DepthControlManager
+from core.Image_Storage_Module.Frame_Statistics import FrameStatistics
+from .Matplotlib_Video_Player_Module import AspectRatioLayout, FrameProcessor, DEFAULT_FPS
+
+# Try to import PyOpenGL for the OpenGL video player
+try:
+    from OpenGL import GL
+    from OpenGL.GL import shaders
+    HAS_OPENGL = True
+except ImportError:
+    HAS_OPENGL = False
+    warnings.warn("PyOpenGL not available. The Matplotlib video player will be used.")
+
+# OpenGL 3.3 core is the oldest version with everything the shaders need (float textures, texelFetch, isnan) and is
+# provided by Mesa's llvmpipe software renderer, so the player also runs on machines without a GPU
+OPENGL_VERSION = (3, 3)
+
+VERTEX_SHADER_SOURCE = """
+#version 330 core
+layout(location = 0) in vec2 position;
+layout(location = 1) in vec2 texcoord;
+out vec2 frame_texcoord;
+void main() {
+    frame_texcoord = texcoord;
+    gl_Position = vec4(position, 0.0, 1.0);
+}
+"""
+
+# Colour scaling is done per pixel here rather than on the CPU. The value is normalised with the depth limits and
+# looked up in the colormap in the same way as matplotlib, so both players show the same colours
+FRAGMENT_SHADER_SOURCE = """
+#version 330 core
+in vec2 frame_texcoord;
+out vec4 colour;
+uniform sampler2D frame;
+uniform sampler1D lut;
+uniform float vmin;
+uniform float scale;
+uniform vec4 bad_colour;
+void main() {
+    float value = texture(frame, frame_texcoord).r;
+    if (isnan(value) || isinf(value)) {
+        colour = bad_colour;
+        return;
+    }
+    int lut_size = textureSize(lut, 0);
+    float normalised = clamp((value - vmin) * scale, 0.0, 1.0);
+    colour = texelFetch(lut, min(int(normalised * float(lut_size)), lut_size - 1), 0);
+}
+"""
+
+# Quad covering the viewport as a triangle strip. Texture row 0 is the first image row, so it is mapped to the top
+# like an image shown by matplotlib and frames are uploaded without flipping
+QUAD_VERTICES = np.array([
+    # Positions    # Texture coords
+    -1.0,  1.0,    0.0, 0.0,
+    -1.0, -1.0,    0.0, 1.0,
+     1.0,  1.0,    1.0, 0.0,
+     1.0, -1.0,    1.0, 1.0,
+], dtype=np.float32)
+
+
+def opengl_surface_format() -> QSurfaceFormat:
+    """Surface format of the OpenGL video player, an OpenGL 3.3 core profile context."""
+    surface_format = QSurfaceFormat()
+    surface_format.setVersion(*OPENGL_VERSION)
+    surface_format.setProfile(QSurfaceFormat.OpenGLContextProfile.CoreProfile)
+    return surface_format
+
+
+def opengl_is_available() -> bool:
+    """Check whether an OpenGL context able to run the OpenGL video player can be created.
+
+    Returns
+    -------
+    bool
+        True if PyOpenGL is installed and an OpenGL 3.3 core profile context can be created, in hardware or in software
+        through Mesa's llvmpipe.
+    """
+    if not HAS_OPENGL:
+        return False
+    context = QOpenGLContext()
+    context.setFormat(opengl_surface_format())
+    if not context.create():
+        return False
+    context_format = context.format()
+    return (context_format.majorVersion(), context_format.minorVersion()) >= OPENGL_VERSION
+
+
+class FrameTextureRenderer:
+    """Draws float frames colour mapped on the GPU.
+
+    Frames are uploaded as single channel float textures and the colormap as a 1-D lookup texture, and the fragment
+    shader normalises each pixel with the depth limits and looks up its colour. Changing the depth limits only sets two
+    uniforms and changing the colormap only uploads the lookup table, neither touches the frame.
+
+    The setters only store what has changed, the OpenGL work is done by `draw`, which must be called with the OpenGL
+    context current. `initialize` and `cleanup` must also be called with the context current.
+    """
+
+    def __init__(self):
+        self.program = None
+        self.vao = None
+        self.vbo = None
+        self.frame_texture = None
+        self.lut_texture = None
+        self.uniform_locations = {}
+        self.frame = None
+        self.frame_shape = None
+        self.frame_changed = False
+        self.lut = None
+        self.lut_changed = False
+        self.bad_colour = (0.0, 0.0, 0.0, 0.0)
+        self.vmin = 0.0
+        self.scale = 1.0
+
+    def initialize(self):
+        # Validation is skipped, it runs before the two samplers are assigned their texture units and would fail
+        # because both still refer to unit 0
+        self.program = shaders.compileProgram(
+            shaders.compileShader(VERTEX_SHADER_SOURCE, GL.GL_VERTEX_SHADER),
+            shaders.compileShader(FRAGMENT_SHADER_SOURCE, GL.GL_FRAGMENT_SHADER),
+            validate=False
+        )
+        self.uniform_locations = {name: GL.glGetUniformLocation(self.program, name)
+                                  for name in ("frame", "lut", "vmin", "scale", "bad_colour")}
+        GL.glUseProgram(self.program)
+        GL.glUniform1i(self.uniform_locations["frame"], 0)
+        GL.glUniform1i(self.uniform_locations["lut"], 1)
+        GL.glUseProgram(0)
+
+        self.vao = GL.glGenVertexArrays(1)
+        self.vbo = GL.glGenBuffers(1)
+        GL.glBindVertexArray(self.vao)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vbo)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, QUAD_VERTICES.nbytes, QUAD_VERTICES, GL.GL_STATIC_DRAW)
+        stride = 4 * QUAD_VERTICES.itemsize
+        GL.glEnableVertexAttribArray(0)
+        GL.glVertexAttribPointer(0, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(0))
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(2 * QUAD_VERTICES.itemsize))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindVertexArray(0)
+
+        # Pixels are shown as blocks rather than interpolated, like the matplotlib player
+        self.frame_texture = self._create_texture(GL.GL_TEXTURE_2D)
+        self.lut_texture = self._create_texture(GL.GL_TEXTURE_1D)
+
+        # Everything has to be uploaded to the new textures
+        self.frame_shape = None
+        self.frame_changed = self.frame is not None
+        self.lut_changed = self.lut is not None
+
+    def cleanup(self):
+        if self.program is None:
+            return
+        GL.glDeleteTextures(2, [self.frame_texture, self.lut_texture])
+        GL.glDeleteBuffers(1, [self.vbo])
+        GL.glDeleteVertexArrays(1, [self.vao])
+        GL.glDeleteProgram(self.program)
+        self.program = None
+
+    def set_frame(self, frame: np.ndarray):
+        # Frames of other types are converted once here, frames that are already float32 are uploaded as they are
+        self.frame = np.ascontiguousarray(frame, dtype=np.float32)
+        self.frame_changed = True
+
+    def set_limits(self, vmin: float, vmax: float):
+        # Like matplotlib, every pixel takes the lowest colour when both limits are the same
+        self.vmin = float(vmin)
+        self.scale = 1.0 / (vmax - vmin) if vmax > vmin else 0.0
+
+    def set_colormap(self, cmap: Colormap, background_colour: tuple = (0.0, 0.0, 0.0)):
+        """Set the colormap frames are drawn with.
+
+        Parameters
+        ----------
+        cmap : Colormap
+            Matplotlib colormap, sampled at each of its colours into the lookup table.
+        background_colour : tuple
+            RGB colour behind the frame. NaN and infinite pixels take the colormap's bad colour composited over it.
+        """
+        self.lut = np.ascontiguousarray(cmap(np.arange(cmap.N), bytes=True))
+        self.lut_changed = True
+        *bad_rgb, bad_alpha = cmap.get_bad()
+        self.bad_colour = (*(bad * bad_alpha + background * (1.0 - bad_alpha)
+                             for bad, background in zip(bad_rgb, background_colour)), 1.0)
+
+    def draw(self):
+        if self.program is None or self.frame is None or self.lut is None:
+            return
+        self._upload_changes()
+
+        GL.glUseProgram(self.program)
+        GL.glUniform1f(self.uniform_locations["vmin"], self.vmin)
+        GL.glUniform1f(self.uniform_locations["scale"], self.scale)
+        GL.glUniform4f(self.uniform_locations["bad_colour"], *self.bad_colour)
+
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.frame_texture)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_1D, self.lut_texture)
+
+        GL.glBindVertexArray(self.vao)
+        GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+        GL.glBindVertexArray(0)
+
+        GL.glBindTexture(GL.GL_TEXTURE_1D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glUseProgram(0)
+
+    def _upload_changes(self):
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        if self.frame_changed:
+            height, width = self.frame.shape[:2]
+            GL.glBindTexture(GL.GL_TEXTURE_2D, self.frame_texture)
+            # Storage is only allocated when the frame size changes, other frames are copied into it
+            if self.frame_shape != (height, width):
+                GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_R32F, width, height, 0, GL.GL_RED, GL.GL_FLOAT, self.frame)
+                self.frame_shape = (height, width)
+            else:
+                GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, GL.GL_RED, GL.GL_FLOAT, self.frame)
+            GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+            self.frame_changed = False
+        if self.lut_changed:
+            GL.glBindTexture(GL.GL_TEXTURE_1D, self.lut_texture)
+            GL.glTexImage1D(GL.GL_TEXTURE_1D, 0, GL.GL_RGBA8, len(self.lut), 0, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                            self.lut)
+            GL.glBindTexture(GL.GL_TEXTURE_1D, 0)
+            self.lut_changed = False
+
+    @staticmethod
+    def _create_texture(target) -> int:
+        texture = GL.glGenTextures(1)
+        GL.glBindTexture(target, texture)
+        GL.glTexParameteri(target, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(target, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(target, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        if target == GL.GL_TEXTURE_2D:
+            GL.glTexParameteri(target, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+        GL.glBindTexture(target, 0)
+        return texture
+
+
+class VideoOverlayWidget(QWidget):
+    """Transparent widget drawn over the video with the scale bar and timestamp."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.font = QFont()
+        self.font.setPointSize(10)
+        self.font.setBold(True)
+        self.scale_bar_color = QColor("white")
+        self.timestamp_color = QColor("white")
+        self.image_width = 1
+        self.scale_bar_text = "50 nm"
+        self.scale_bar_pixel_length = 50
+        self.scale_bar_shown = False
+        self.timestamp_text = ""
+        self.timestamp_shown = False
+
+    def paintEvent(self, event):
+        if not (self.scale_bar_shown or self.timestamp_shown):
+            return
+        painter = QPainter(self)
+        painter.setFont(self.font)
+        metrics = QFontMetricsF(self.font)
+        margin = 0.4 * metrics.height()
+
+        if self.timestamp_shown and self.timestamp_text:
+            painter.setPen(self.timestamp_color)
+            painter.drawText(QRectF(margin, margin, self.width(), metrics.height()),
+                             Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, self.timestamp_text)
+
+        if self.scale_bar_shown:
+            # The bar is as long as the scale bar length in image pixels and one image pixel thick, with its label
+            # centred below it, in the lower right corner
+            image_scale = self.width() / self.image_width
+            bar_width = self.scale_bar_pixel_length * image_scale
+            bar_height = max(1.0, image_scale)
+            label_width = max(bar_width, metrics.horizontalAdvance(self.scale_bar_text))
+            label_top = self.height() - margin - metrics.height()
+            bar_left = self.width() - margin - (label_width + bar_width) / 2
+            painter.fillRect(QRectF(bar_left, label_top - 0.2 * metrics.height() - bar_height, bar_width, bar_height),
+                             self.scale_bar_color)
+            painter.setPen(self.scale_bar_color)
+            painter.drawText(QRectF(self.width() - margin - label_width, label_top, label_width, metrics.height()),
+                             Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop, self.scale_bar_text)
+        painter.end()
+
+
+class VideoFrameGLWidget(QOpenGLWidget):
+    """OpenGL surface showing the current frame through a `FrameTextureRenderer`."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFormat(opengl_surface_format())
+        self.renderer = FrameTextureRenderer()
+        self.overlay = VideoOverlayWidget(self)
+
+    def initializeGL(self):
+        self.renderer.initialize()
+        self.context().aboutToBeDestroyed.connect(self.cleanupGL)
+
+    def cleanupGL(self):
+        self.makeCurrent()
+        self.renderer.cleanup()
+        self.doneCurrent()
+
+    def paintGL(self):
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        self.renderer.draw()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.overlay.resize(self.size())
+
+
+class OpenGLVideoPlayerWidget(QWidget):
+    update_widgets = pyqtSignal()
+    reset_widgets = pyqtSignal()
+
+    def __init__(self, depth_control_manager: DepthControlManager, parent=None):
+        super().__init__(parent)
+        self.depth_control_manager = depth_control_manager
+        self.layout = None
+        self.gl_widget = None
+        self.video_frames = None
+        self.video_frames_metadata = None
+        self.current_frame_index = 0
+        self.aspect_ratio = 1.0
+        self.fps = DEFAULT_FPS
+        self.real_time = False
+        self.cmap_name = DEFAULT_CMAP_NAME
+        self.scale_bar_shown = False
+        self.timestamp_shown = False
+        self.has_content = False
+        self.frame_processor = None
+        self.is_playing = False
+        self.timestamp_format = "{:.1f}s"  # Format for timestamp display
+        self.scale_bar_color = "white"
+        self.timestamp_color = "white"
+
+        # Connect the depth control manager to update image if needed. Connected once, not for every loaded file
+        self.depth_control_manager.update_widgets.connect(self._on_depth_controls_changed)
+
+    def load_video_frames(self, video_frames: np.ndarray, video_frames_metadata: dict,
+                          frame_statistics: FrameStatistics | None = None):
+        self.setContentsMargins(0, 0, 0, 0)
+        self.reset()
+
+        self.has_content = True
+
+        self.depth_control_manager.load_depth_control_data(video_frames, video_frames_metadata, frame_statistics)
+        self.video_frames = video_frames
+
+        # Create and start the frame processor
+        self.frame_processor = FrameProcessor(video_frames, video_frames_metadata, self.depth_control_manager)
+        self.frame_processor.frame_ready.connect(self._update_frame)
+        self.frame_processor.update_scale_bar.connect(self._update_scale_bar)
+        self.frame_processor.real_time = self.real_time
+
+        # Create a layout for the widget
+        if self.layout is None:
+            self.layout = AspectRatioLayout(self)
+            self.setLayout(self.layout)
+
+        # Create the OpenGL surface the frames are drawn on
+        if self.gl_widget is None:
+            self.gl_widget = VideoFrameGLWidget()
+            self.layout.addWidget(self.gl_widget)
+            self.gl_widget.overlay.scale_bar_color = QColor(self.scale_bar_color)
+            self.gl_widget.overlay.timestamp_color = QColor(self.timestamp_color)
+        self.set_cmap(self.cmap_name)
+
+        # Get image dimensions and calculate aspect ratio
+        self.image_height, self.image_width = video_frames[0].shape[:2]
+        self.aspect_ratio = self.image_width / self.image_height
+        self.layout.setAspectRatio(self.aspect_ratio)
+        self.gl_widget.overlay.image_width = self.image_width
+
+        # Set size policy
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+
+        # Load first frame
+        self.go_to_frame_no(0)
+
+        self.reset_widgets.connect(self.depth_control_manager.reset)
+
+        self.updateGeometry()
+
+    def replace_video_frames(self, video_frames: np.ndarray, video_frames_metadata: dict,
+                             frame_statistics: FrameStatistics | None = None, start: int = 0, stop: int | None = None):
+        """
+        Show processed frames of the same shape in place of the current ones, keeping the current frame.
+
+        Frames are colour mapped as they are drawn, so the range of changed frames, start to stop - 1, is not needed.
+        """
+        if self.frame_processor is None:
+            return
+        self.depth_control_manager.load_depth_control_data(video_frames, video_frames_metadata, frame_statistics)
+        self.frame_processor.set_video_frames(video_frames, video_frames_metadata)
+        self.video_frames = video_frames
+        self._redraw_current_frame()
+
+    def _redraw_current_frame(self):
+        # Only the displayed frame is drawn again. The frame processor is not seeked, so playback carries on from
+        # where it is
+        vmin, vmax = self.depth_control_manager.get_min_max_depths_per_frame(self.current_frame_index)
+        self.gl_widget.renderer.set_frame(np.asarray(self.video_frames[self.current_frame_index]))
+        self.gl_widget.renderer.set_limits(vmin, vmax)
+        self.gl_widget.update()
+
+    def reset(self):
+        if not self.has_content:
+            return
+        if self.frame_processor:
+            self.frame_processor.stop()
+            self.frame_processor.wait()
+            self.frame_processor = None
+        self.layout.setAspectRatio(1.0)
+        self.gl_widget.renderer.frame = None
+        self.gl_widget.update()
+        self.fps = DEFAULT_FPS
+
+        self.reset_widgets.emit()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateGeometry()
+
+    def heightForWidth(self, width):
+        return int(width / self.aspect_ratio)
+
+    def widthForHeight(self, height):
+        return int(height * self.aspect_ratio)
+
+    ### OpenGL video player functions ###
+    def _update_frame(self, frame, current_frame_index, vmin, vmax, timestamp):
+        # Frames still queued by the frame processor of the previous file belong to another movie, and must not mark
+        # a frame of the new processor as presented
+        if self.sender() is not self.frame_processor:
+            return
+        render_start = time.perf_counter()
+        try:
+            self.current_frame_index = current_frame_index
+            # Only the frame is copied to the GPU, it is colour mapped there when the widget is next painted. Updates
+            # are coalesced, so frames arriving faster than the screen refreshes are skipped
+            self.gl_widget.renderer.set_frame(frame)
+            self.gl_widget.renderer.set_limits(vmin, vmax)
+            self.gl_widget.update()
+
+            # Update timestamp
+            if self.timestamp_shown:
+                self._update_timestamp(timestamp)
+
+            self.update_widgets.emit()
+        finally:
+            # The frame processor holds back the next frame until this one is drawn
+            if self.frame_processor:
+                self.frame_processor.frame_presented(time.perf_counter() - render_start)
+
+    def _on_depth_controls_changed(self):
+        self.go_to_frame_no(frame_no=self.current_frame_index)
+
+    def _go_to_next_frame(self):
+        if self.frame_processor:
+            self.frame_processor.current_frame_index = (self.frame_processor.current_frame_index + 1) % len(self.frame_processor.video_frames)
+
+    def set_fps(self, fps):
+        self.fps = fps
+        if self.frame_processor:
+            self.frame_processor.fps = fps
+
+    def stop_timer(self):
+        if self.frame_processor and self.is_playing:
+            self.frame_processor.running = False
+            self.frame_processor.stop()
+            self.is_playing = False
+
+    def start_timer(self):
+        if self.frame_processor and not self.is_playing:
+            self.frame_processor.running = True
+            self.frame_processor.start()
+            self.is_playing = True
+
+    def get_fps(self):
+        return self.fps
+
+    def set_real_time(self, real_time: bool):
+        self.real_time = real_time
+        if self.frame_processor:
+            self.frame_processor.real_time = real_time
+
+    def get_playback_statistics(self) -> dict:
+        return self.frame_processor.playback_statistics.get_statistics() if self.frame_processor else {}
+
+    def skip_forward(self):
+        if self.frame_processor:
+            self.frame_processor.current_frame_index = min(
+                self.frame_processor.current_frame_index + 30,
+                len(self.frame_processor.video_frames) - 1
+            )
+
+    def skip_backward(self):
+        if self.frame_processor:
+            self.frame_processor.current_frame_index = max(
+                self.frame_processor.current_frame_index - 30,
+                0
+            )
+
+    def timer_is_running(self):
+        return self.is_playing
+
+    def go_to_frame_no(self, frame_no):
+        if self.frame_processor:
+            self.frame_processor.seek_to_frame(frame_no)
+            self.current_frame_index = frame_no
+
+    def get_frame_number(self):
+        return self.frame_processor.current_frame_index if self.frame_processor else 0
+
+    ### Visual control functions ###
+    def _update_scale_bar(self, nm_value: int, pixel_length: int):
+        if self.gl_widget:
+            if nm_value < 1000:
+                scale_bar_text =  f'{nm_value} nm'
+            elif nm_value < 1000000:
+                scale_bar_text =  f'{nm_value/1000:.1f} µm'
+            else:
+                scale_bar_text = f'{nm_value/1000000:.2f} mm'
+
+            self.gl_widget.overlay.scale_bar_text = scale_bar_text
+            self.gl_widget.overlay.scale_bar_pixel_length = pixel_length
+            self.gl_widget.overlay.update()
+
+    def _update_timestamp(self, timestamp):
+        if self.gl_widget:
+            self.gl_widget.overlay.timestamp_text = self.timestamp_format.format(timestamp)
+            self.gl_widget.overlay.update()
+
+    def set_cmap(self, cmap_name: str):
+        if self.gl_widget:
+            # Only the lookup table is uploaded, the frame is drawn again with it
+            background = self.palette().color(QPalette.ColorRole.Window)
+            self.gl_widget.renderer.set_colormap(CMAPS[cmap_name], background.getRgbF()[:3])
+            self.gl_widget.update()
+
+        self.cmap_name = cmap_name
+
+    def show_scale_bar(self):
+        self.scale_bar_shown = True
+        self._set_overlay_visibility()
+
+    def hide_scale_bar(self):
+        self.scale_bar_shown = False
+        self._set_overlay_visibility()
+
+    def show_timescale(self):
+        self.timestamp_shown = True
+        self._set_overlay_visibility()
+
+    def hide_timescale(self):
+        self.timestamp_shown = False
+        self._set_overlay_visibility()
+
+    def _set_overlay_visibility(self):
+        if self.gl_widget:
+            self.gl_widget.overlay.scale_bar_shown = self.scale_bar_shown
+            self.gl_widget.overlay.timestamp_shown = self.timestamp_shown
+            self.gl_widget.overlay.update()
+
+if __name__ == '__main__':
+    # Generate a random video using NumPy (100 frames of 100x100 images)
+    video_frames = np.random.rand(100, 100, 100).astype(np.float32)
+    video_frames_metadata = [{"Timestamp": frame_no / DEFAULT_FPS, "Scale Bar nm Value": 50,
+                              "Scale Bar Pixel Length": 25} for frame_no in range(len(video_frames))]
+
+    # Create the PyQt6 application
+    app = QApplication(sys.argv)
+
+    # Create the main window
+    main_window = QWidget()
+    main_window.setWindowTitle('OpenGL Video Display')
+
+    # Create and add the OpenGL widget to the main window
+    opengl_widget = OpenGLVideoPlayerWidget(DepthControlManager())
+    layout = QVBoxLayout()
+    main_window.setLayout(layout)
+    layout.addWidget(opengl_widget)
+
+    # Load video frames into the OpenGL widget
+    opengl_widget.load_video_frames(video_frames, video_frames_metadata)
+    opengl_widget.show_scale_bar()
+    opengl_widget.show_timescale()
+    opengl_widget.start_timer()
+
+    # Show the main window
+    main_window.show()
+
+    # Start the PyQt6 event loop
+    sys.exit(app.exec())
@@ -0,0 +1,242 @@
+import threading
+import numpy as np
+from PyQt6.QtCore import QThread
+from matplotlib.colors import Colormap
+from core.Image_Storage_Module.Depth_Control_Manager import DepthControlManager
+from core.Image_Storage_Module.Frame_Source import FrameSource
+
+# Frames colour mapped ahead of the displayed frame, fewer are kept if they would not fit in the byte budget
+RENDER_AHEAD_FRAMES = 64
+RENDER_AHEAD_BYTE_BUDGET = 256 * 1024 ** 2
+# Fraction of the buffer kept for the frames before the displayed frame, so scrubbing backwards also hits the buffer
+RENDER_BEHIND_FRACTION = 0.25
+
+
+def nearest_indices(input_length: int, output_length: int) -> np.ndarray:
+    """Indices of the input pixels sampled by each output pixel when resampling with nearest neighbour sampling.
+
+    Each output pixel takes the input pixel under its centre, the same pixels matplotlib shows with nearest
+    interpolation.
+    """
+    return ((np.arange(output_length) + 0.5) * (input_length / output_length)).astype(np.intp)
+
+
+def colour_map_frame(frame: np.ndarray, vmin: float, vmax: float, lut: np.ndarray, rows: np.ndarray,
+                     cols: np.ndarray) -> np.ndarray:
+    """Colour map a frame and resample it to the output size.
+
+    Parameters
+    ----------
+    frame : np.ndarray
+        2D frame of pixel values.
+    vmin, vmax : float
+        Values mapped to the first and last colours of the lookup table, values outside them are clipped.
+    lut : np.ndarray
+        Lookup table of packed RGBA colours as uint32, with the colour of NaN and infinite pixels last.
+    rows, cols : np.ndarray
+        Frame rows and columns sampled by each output row and column, see `nearest_indices`.
+
+    Returns
+    -------
+    np.ndarray
+        Packed RGBA image of shape (len(rows), len(cols)) as uint32, view it as uint8 for the separate channels.
+    """
+    # Values are normalised and scaled to the lookup table the same way as matplotlib, in float32, so the colours are
+    # the ones matplotlib would show
+    n_colours = len(lut) - 1
+    frame = np.asarray(frame, dtype=np.float32)
+    scaled = np.subtract(frame, np.float32(vmin))
+    if vmax > vmin:
+        scaled /= np.float32(vmax - vmin)
+    else:
+        scaled[:] = 0
+    scaled *= np.float32(n_colours)
+    np.clip(scaled, 0, n_colours - 1, out=scaled)
+    with np.errstate(invalid="ignore"):
+        indices = scaled.astype(np.intp)
+    indices[~np.isfinite(frame)] = n_colours
+
+    image = np.take(lut, indices)
+    return np.take(np.take(image, rows, axis=0), cols, axis=1)
+
+
+class RenderAheadBuffer(QThread):
+    """Ring buffer of colour mapped frames, filled ahead of the displayed frame by a worker thread.
+
+    The worker colour maps the frames after the displayed frame, and keeps some of the frames before it, with the
+    current colormap and depth bounds, resampled to the size they are shown at. The GUI thread then only has to draw
+    the image. Changing the colormap, the depth bounds or the output size invalidates the buffer, rewriting some
+    frames only drops those frames.
+
+    Parameters
+    ----------
+    frames : FrameSource | np.ndarray
+        Frames to colour map.
+    depth_control_manager : DepthControlManager
+        Gives the depth bounds of each frame.
+    capacity : int
+        Most frames kept in the buffer.
+    """
+
+    def __init__(self, frames: FrameSource | np.ndarray, depth_control_manager: DepthControlManager,
+                 capacity: int = RENDER_AHEAD_FRAMES):
+        super().__init__()
+        self.depth_control_manager = depth_control_manager
+        self.frames = frames
+        self.frame_shape = np.shape(frames[0])[:2]
+        self.max_capacity = capacity
+        self.condition = threading.Condition()
+        self.running = False
+        # Bumped by every change that makes rendered frames stale. Frames rendered for an older generation are dropped
+        self.generation = 0
+        # Bumped for each frame that is rewritten, so a frame rendered from its old pixels is dropped
+        self.frame_versions = np.zeros(len(frames), dtype=np.int64)
+        self.playhead = 0
+        self.lut = None
+        self.rows = None
+        self.cols = None
+        self.images = None
+        self.slot_frames = None
+        self.slot_generations = None
+        self.frame_slots = {}
+        self.hits = 0
+        self.misses = 0
+        self.set_output_size(*self.frame_shape)
+
+    def set_frames(self, frames: FrameSource | np.ndarray, start: int = 0, stop: int | None = None):
+        """
+        Replace the frames, of the same shape, of which only frames start to stop - 1 have changed.
+
+        Only the rendered frames in that range are dropped, the rest of the buffer is kept.
+        """
+        with self.condition:
+            self.frames = frames
+            stop = len(frames) if stop is None else stop
+            self.frame_versions[start:stop] += 1
+            for frame_no in range(start, stop):
+                slot = self.frame_slots.pop(frame_no, None)
+                if slot is not None:
+                    self.slot_frames[slot] = -1
+                    self.slot_generations[slot] = -1
+            self.condition.notify()
+
+    def set_colormap(self, cmap: Colormap):
+        # The bad colour is appended last, for NaN and infinite pixels
+        colours = np.vstack([cmap(np.arange(cmap.N), bytes=True), cmap(np.nan, bytes=True)])
+        with self.condition:
+            self.lut = np.ascontiguousarray(colours).view(np.uint32).ravel()
+            self._invalidate()
+
+    def set_output_size(self, height: int, width: int):
+        """Resample frames to height x width pixels, the size they are drawn at."""
+        height, width = max(1, int(height)), max(1, int(width))
+        with self.condition:
+            if self.images is not None and self.images.shape[1:] == (height, width):
+                return
+            self.rows = nearest_indices(self.frame_shape[0], height)
+            self.cols = nearest_indices(self.frame_shape[1], width)
+            capacity = min(self.max_capacity, len(self.frames), RENDER_AHEAD_BYTE_BUDGET // (4 * height * width))
+            capacity = max(1, capacity)
+            self.images = np.empty((capacity, height, width), dtype=np.uint32)
+            self.slot_frames = np.full(capacity, -1)
+            self.slot_generations = np.full(capacity, -1)
+            self.frame_slots = {}
+            self._invalidate()
+
+    def invalidate(self):
+        with self.condition:
+            self._invalidate()
+
+    def get_frame(self, frame_no: int) -> np.ndarray:
+        """Get a frame colour mapped and resampled to the output size, as an RGBA uint8 image.
+
+        The frame is taken from the buffer if it is ready, otherwise it is rendered now. Either way the worker then
+        renders ahead of this frame.
+        """
+        with self.condition:
+            self.playhead = frame_no
+            self.condition.notify()
+            slot = self.frame_slots.get(frame_no)
+            if slot is not None and self.slot_generations[slot] == self.generation:
+                self.hits += 1
+                return self.images[slot].copy().view(np.uint8).reshape(*self.images.shape[1:], 4)
+            self.misses += 1
+            generation, frame_version = self.generation, self.frame_versions[frame_no]
+            lut, rows, cols = self.lut, self.rows, self.cols
+
+        image = self._render(frame_no, lut, rows, cols)
+        with self.condition:
+            self._store(frame_no, generation, frame_version, image)
+        return image.view(np.uint8).reshape(*image.shape, 4)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (frame_no := self._next_frame_to_render()) is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                generation, frame_version = self.generation, self.frame_versions[frame_no]
+                lut, rows, cols = self.lut, self.rows, self.cols
+
+            # Rendered without holding the lock so the GUI thread is never kept waiting
+            image = self._render(frame_no, lut, rows, cols)
+
+            with self.condition:
+                self._store(frame_no, generation, frame_version, image)
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.wait()
+
+    def _render(self, frame_no: int, lut: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        vmin, vmax = self.depth_control_manager.get_min_max_depths_per_frame(frame_no)
+        return colour_map_frame(self.frames[frame_no], vmin, vmax, lut, rows, cols)
+
+    def _store(self, frame_no: int, generation: int, frame_version: int, image: np.ndarray):
+        # Frames rendered before the last change, from pixels that have since been rewritten, or at another size, are
+        # stale
+        if (generation != self.generation or frame_version != self.frame_versions[frame_no]
+                or image.shape != self.images.shape[1:]):
+            return
+        window = set(self._window())
+        slot = self.frame_slots.get(frame_no)
+        if slot is None:
+            # Replace a frame outside the window around the displayed frame, there is always one as the window is
+            # as long as the buffer and this frame is not in the buffer
+            slot = next((slot for slot, slot_frame in enumerate(self.slot_frames)
+                         if slot_frame not in window or self.slot_generations[slot] != generation), None)
+            if slot is None:
+                return
+            self.frame_slots.pop(int(self.slot_frames[slot]), None)
+        self.images[slot] = image
+        self.slot_frames[slot] = frame_no
+        self.slot_generations[slot] = generation
+        self.frame_slots[frame_no] = slot
+
+    def _window(self) -> list:
+        # Frames around the displayed frame in the order they are rendered, those after it first. Playback loops, so
+        # the window wraps around the ends of the movie
+        capacity = len(self.images)
+        behind = int(capacity * RENDER_BEHIND_FRACTION) if capacity < len(self.frames) else 0
+        offsets = [*range(capacity - behind), *range(-1, -behind - 1, -1)]
+        return [(self.playhead + offset) % len(self.frames) for offset in offsets]
+
+    def _next_frame_to_render(self) -> int | None:
+        if self.lut is None:
+            return None
+        for frame_no in self._window():
+            slot = self.frame_slots.get(frame_no)
+            if slot is None or self.slot_generations[slot] != self.generation:
+                return frame_no
+        return None
+
+    def _invalidate(self):
+        self.generation += 1
+        self.condition.notify()
@@ -2,7 +2,7 @@ import re
 import os
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSpinBox, QLabel, 
-    QLineEdit, QSlider
+    QLineEdit, QSlider, QCheckBox
 )
 from PyQt6.QtGui import QIcon, QIntValidator, QValidator
 from PyQt6.QtCore import Qt, pyqtSignal
@@ -34,6 +34,7 @@ class VideoControlWidget(QWidget):
     skipBackClicked = pyqtSignal()
     skipForwardClicked = pyqtSignal()
     fpsChanged = pyqtSignal(int)
+    realTimeChecked = pyqtSignal(bool)
     videoAlignButtonClicked = pyqtSignal()
     deleteFramesButtonClicked = pyqtSignal()
 
@@ -94,6 +95,13 @@ class VideoControlWidget(QWidget):
         self.buttonLayout.addWidget(self.fpsLabel)
         self.buttonLayout.addWidget(self.fpsTextBox)
 
+        # Real time playback spaces frames by their timestamps, so the FPS is not used
+        self.realTimeCheckbox = QCheckBox("Real time")
+        self.realTimeCheckbox.setToolTip("Play frames at the times they were recorded")
+        self.realTimeCheckbox.toggled.connect(lambda checked: self.fpsTextBox.setDisabled(checked))
+        self.realTimeCheckbox.toggled.connect(self.realTimeChecked.emit)
+        self.buttonLayout.addWidget(self.realTimeCheckbox)
+
         self.layout.addLayout(self.buttonLayout)
 
         # Video slider
@@ -1,12 +1,13 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QLabel, 
-    QDoubleSpinBox, QSizePolicy
+    QDoubleSpinBox, QSpinBox, QSizePolicy
 )
 from PyQt6.QtCore import Qt, pyqtSignal
-from utils.constants import DEPTH_CONTROL_OPTIONS
+from utils.constants import DEPTH_CONTROL_OPTIONS, DEFAULT_DEPTH_WINDOW_FRAMES
 
 class VideoDepthControlWidget(QWidget):
     new_depth_values = pyqtSignal(float, float)
+    new_window_size = pyqtSignal(int)
 
     def __init__(self):
         super().__init__()
@@ -50,9 +51,21 @@ class VideoDepthControlWidget(QWidget):
         self.minSpinLayout.addWidget(self.minSpinLabel)
         self.minSpinLayout.addWidget(self.minSpinBox)
 
+        # Window spin box layout, the frames of the "Rolling window" depth control
+        self.windowSpinLayout = QHBoxLayout()
+        self.windowSpinBox = QSpinBox()
+        self.windowSpinBox.setMinimum(1)
+        self.windowSpinBox.setMaximum(100000)
+        self.windowSpinBox.setValue(DEFAULT_DEPTH_WINDOW_FRAMES)
+        self.windowSpinBox.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.windowSpinLabel = QLabel("Window:")
+        self.windowSpinLayout.addWidget(self.windowSpinLabel)
+        self.windowSpinLayout.addWidget(self.windowSpinBox)
+
         # Adding min and max spin box layouts to main layout
         self.layout.addLayout(self.maxSpinLayout)
         self.layout.addLayout(self.minSpinLayout)
+        self.layout.addLayout(self.windowSpinLayout)
         self.layout.addStretch(1)  # Optional, for spacing
 
         # Connect signals to slots
@@ -62,6 +75,7 @@ class VideoDepthControlWidget(QWidget):
         self.maxSpinBox.valueChanged.connect(self.validate_min_max_spin_boxes)
         self.minSpinBox.valueChanged.connect(self.go_to_manual_depth_control)
         self.maxSpinBox.valueChanged.connect(self.go_to_manual_depth_control)
+        self.windowSpinBox.valueChanged.connect(self.new_window_size.emit)
 
         self.setLayout(self.layout)
 
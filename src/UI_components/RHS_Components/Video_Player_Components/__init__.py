@@ -4,6 +4,7 @@ from .Video_Depth_Control_Module import VideoDepthControlWidget
 from .Visual_Representation_Module import VisualRepresentationWidget
 from .Export_and_Video_Scale_Module import ExportAndVideoScaleWidget
 from .Matplotlib_Video_Player_Module import MatplotlibVideoPlayerWidget
+from .OpenGL_Video_Player_Module import OpenGLVideoPlayerWidget, opengl_is_available
 from .Colourbar_Module import MatplotlibColourBarWidget
 
 __all__ = [
@@ -12,5 +13,7 @@ __all__ = [
     "VisualRepresentationWidget",
     "ExportAndVideoScaleWidget",
     "MatplotlibVideoPlayerWidget",
+    "OpenGLVideoPlayerWidget",
+    "opengl_is_available",
     "MatplotlibColourBarWidget"
 ]
\ No newline at end of file
@@ -3,10 +3,11 @@ import os
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QSizePolicy, QApplication
 from PyQt6.QtGui import QIcon
 from PyQt6.QtCore import pyqtSignal, QSize
-from UI_components.RHS_Components.Video_Player_Components import VideoControlWidget, VideoDepthControlWidget, VisualRepresentationWidget, ExportAndVideoScaleWidget, MatplotlibVideoPlayerWidget, MatplotlibColourBarWidget
-from utils.constants import PATH_TO_ICON_DIRECTORY
+from UI_components.RHS_Components.Video_Player_Components import VideoControlWidget, VideoDepthControlWidget, VisualRepresentationWidget, ExportAndVideoScaleWidget, MatplotlibVideoPlayerWidget, OpenGLVideoPlayerWidget, MatplotlibColourBarWidget, opengl_is_available
+from utils.constants import PATH_TO_ICON_DIRECTORY, VIDEO_PLAYER_BACKEND
 from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
 from core.Image_Storage_Module.Depth_Control_Manager import DepthControlManager
+from core.Image_Processing_Module.Frame_Parallel_Executor import FrameParallelExecutor
 
 class VideoPlayerWidget(QWidget):
     update_external_widgets = pyqtSignal(int)
@@ -18,6 +19,7 @@ class VideoPlayerWidget(QWidget):
     def buildVideoPlayerWidgets(self):
         self.media_data_manager = MediaDataManager()
         self.depth_control_manager = DepthControlManager()
+        self.frame_executor = FrameParallelExecutor()
         # Set up video player layout 
         self.mediaLayout = QVBoxLayout()
         self.mediaLayout.setContentsMargins(0, 0, 0, 0)
@@ -47,7 +49,11 @@ class VideoPlayerWidget(QWidget):
         self.accept_changes_button.hide()
         self.videoPlayerLayout.addWidget(self.accept_changes_button)
         
-        self.videoPlayerWidget = MatplotlibVideoPlayerWidget(self.depth_control_manager)
+        # Both players have the same interface
+        if VIDEO_PLAYER_BACKEND == "OpenGL" and opengl_is_available():
+            self.videoPlayerWidget = OpenGLVideoPlayerWidget(self.depth_control_manager)
+        else:
+            self.videoPlayerWidget = MatplotlibVideoPlayerWidget(self.depth_control_manager)
         self.videoPlayerWidget.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
         self.videoPlayerLayout.addWidget(self.videoPlayerWidget, stretch=1)
         self.videoPlayerWidget.setMinimumSize(10, 10)
@@ -69,6 +75,7 @@ class VideoPlayerWidget(QWidget):
         self.videoControlWidget.skipBackClicked.connect(self.skipBackward)
         self.videoControlWidget.skipForwardClicked.connect(self.skipForward)
         self.videoControlWidget.fpsChanged.connect(self.changePlaybackRate)
+        self.videoControlWidget.realTimeChecked.connect(self.changeRealTimePlayback)
         self.videoControlWidget.specificVideoFrameGiven.connect(self.goToFrameNo)
         self.videoControlWidget.videoSeekSlider.valueChanged.connect(self.setVideoPosition)
         self.videoControlWidget.videoSeekSlider.sliderReleased.connect(self.sliderReleased)
@@ -84,12 +91,14 @@ class VideoPlayerWidget(QWidget):
         # Depth control widgets
         self.videoDepthControlWidget.new_depth_values.connect(self.depth_control_manager.set_min_max_manual_values)
         self.videoDepthControlWidget.depthTypeDropdown.currentTextChanged.connect(self.depth_control_manager.set_depth_control_type)
+        self.videoDepthControlWidget.new_window_size.connect(self.depth_control_manager.set_rolling_window_size)
         self.depth_control_manager.request_current_min_max_values.connect(self.videoDepthControlWidget.get_min_max_values)
 
 
         # Media manager class
         self.media_data_manager.new_file_loaded.connect(self.load_frames_data)
         self.media_data_manager.current_mode_changed.connect(self.on_view_mode_changed)
+        self.media_data_manager.frames_changed.connect(self.on_frames_changed)
         self.accept_changes_button.clicked.connect(self.on_accept_changes_button_clicked)
 
 
@@ -118,12 +127,20 @@ class VideoPlayerWidget(QWidget):
 
         self.setLayout(self.mediaLayout)
 
+    def on_frames_changed(self, start, stop):
+        # Frames start to stop - 1 were processed in place, show the new frames without resetting playback
+        self.frames = self.media_data_manager.get_frames()
+        self.videoPlayerWidget.replace_video_frames(self.frames, self.media_data_manager.get_frames_metadata(),
+                                                    self.media_data_manager.get_frame_statistics(), start, stop)
+        self.update_widgets()
+
     # TODO: create proper load frames func that triggers after user selects a file to open
     def load_frames_data(self):
         self.frames = self.media_data_manager.get_frames()
         self.number_of_frames = len(self.frames)
 
-        self.videoPlayerWidget.load_video_frames(self.frames, self.media_data_manager.get_frames_metadata())
+        self.videoPlayerWidget.load_video_frames(self.frames, self.media_data_manager.get_frames_metadata(),
+                                                 self.media_data_manager.get_frame_statistics())
 
         # Update slider with max frames
         self.videoControlWidget.videoSeekSlider.setRange(0, self.number_of_frames - 1)
@@ -227,6 +244,9 @@ class VideoPlayerWidget(QWidget):
     def changePlaybackRate(self, fps):
         self.videoPlayerWidget.set_fps(fps)
 
+    def changeRealTimePlayback(self, real_time):
+        self.videoPlayerWidget.set_real_time(real_time)
+
     def goToFrameNo(self, frameNo):
         self.videoPlayerWidget.go_to_frame_no(frameNo - 1)
 
@@ -262,7 +282,8 @@ class VideoPlayerWidget(QWidget):
 
     ### VIEW MODE FUNCTIONALITY ###
     def on_accept_changes_button_clicked(self):
-        self.media_data_manager.accept_changes()
+        # Processing deferred while previewing is applied to every frame before the preview is accepted
+        self.frame_executor.accept_changes()
 
     def on_view_mode_changed(self, mode):
         if mode == "Preview":
@@ -0,0 +1,384 @@
+from __future__ import annotations
+import warnings
+import numpy as np
+from scipy import ndimage, fft
+from skimage.restoration import denoise_nl_means
+
+# Gaussians at least this wide are applied by multiplying in the Fourier domain, narrower ones by separable
+# convolution, whose cost grows with the width of the kernel
+GAUSSIAN_FFT_MIN_SIGMA = 8.0
+# Medians up to this window size are exact sorting based filters. Wider windows use a running histogram of
+# MEDIAN_HISTOGRAM_BINS bins, whose cost does not depend on the window size
+MEDIAN_DIRECT_MAX_SIZE = 7
+MEDIAN_HISTOGRAM_BINS = 64
+NLM_PATCH_SIZE = 5
+# Noise to signal power ratio of the Wiener filter used for sphere deconvolution
+SPHERE_WIENER_NOISE = 1e-2
+FILL_MASK_MAX_ITERATIONS = 20
+# Median absolute deviations to standard deviations of normally distributed values
+MAD_TO_SIGMA = 1.4826
+# Previews of filters over all frames are calculated from at most this many evenly spaced frames
+PREVIEW_MAX_TEMPORAL_FRAMES = 32
+# Pixels whose blurred weight of finite neighbours is below this have too few finite neighbours to be blurred
+NORMALISED_MIN_WEIGHT = 1e-3
+
+
+def gaussian_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Gaussian blur of every frame with a standard deviation of size pixels."""
+    if size <= 0:
+        return frames.copy()
+    if size >= GAUSSIAN_FFT_MIN_SIGMA:
+        return _fft_gaussian(frames, size)
+    return ndimage.gaussian_filter(frames, sigma=(0, size, size), mode="reflect")
+
+
+def mean_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Mean of a size x size window around every pixel. Running sums make the cost independent of the size.
+
+    A running sum carries a NaN to every later window, so non-finite pixels are left out by normalised convolution,
+    see _normalised_filter.
+    """
+    size = max(size, 1)
+    return _normalised_filter(lambda values: ndimage.uniform_filter(values, size=(1, size, size), mode="reflect"),
+                              frames)
+
+
+def median_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Median of a size x size window around every pixel.
+
+    Windows up to MEDIAN_DIRECT_MAX_SIZE are exact. Wider windows are found from running histograms, see
+    _histogram_median.
+    """
+    size = max(size, 1)
+    if size <= MEDIAN_DIRECT_MAX_SIZE:
+        return ndimage.median_filter(frames, size=(1, size, size), mode="reflect")
+    return _histogram_median(frames, size)
+
+
+def non_local_mean_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Non-local means denoising of every frame, searching for similar patches up to size pixels away."""
+    filtered = np.empty_like(frames)
+    for frame_no, frame in enumerate(frames):
+        sigma = _noise_sigma(frame)
+        filtered[frame_no] = denoise_nl_means(frame, patch_size=NLM_PATCH_SIZE, patch_distance=max(size, 1),
+                                              h=0.8 * sigma, sigma=sigma, fast_mode=True, preserve_range=True)
+    return filtered
+
+
+def high_pass_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Remove features wider than about size pixels, by subtracting a Gaussian blur applied in the Fourier domain."""
+    if size <= 0:
+        return frames.copy()
+    # Non-finite pixels are left out of the blur, see _fft_gaussian, and are kept as they are
+    with np.errstate(invalid="ignore"):
+        high_passed = frames - _fft_gaussian(frames, size)
+    return np.where(np.isfinite(frames), high_passed, frames)
+
+
+def top_hat_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """White top hat, keeping features narrower than a size x size square and removing the background under them."""
+    size = max(size, 1)
+    return frames - ndimage.grey_opening(frames, size=(1, size, size), mode="reflect")
+
+
+def sphere_deconvolution_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Wiener deconvolution of the blur of a spherical tip of radius size pixels, in the Fourier domain.
+
+    Non-finite pixels are left out by normalised convolution, see _normalised_filter.
+    """
+    if size <= 0:
+        return frames.copy()
+    return _normalised_filter(lambda values: _sphere_deconvolution(values, int(size)), frames)
+
+
+def _sphere_deconvolution(frames: np.ndarray, radius: int) -> np.ndarray:
+    """Wiener deconvolution of finite frames, see sphere_deconvolution_filter_frames."""
+    y, x = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    kernel = np.sqrt(np.clip(radius ** 2 - x ** 2 - y ** 2, 0, None)).astype(np.float32)
+    kernel /= kernel.sum()
+
+    padded = _reflect_pad(frames, radius)
+    shape = padded.shape[1:]
+    # Centre the kernel on the origin, so the deconvolution does not shift the frames
+    kernel_padded = np.zeros(shape, dtype=np.float32)
+    kernel_padded[:kernel.shape[0], :kernel.shape[1]] = kernel
+    kernel_padded = np.roll(kernel_padded, (-radius, -radius), axis=(0, 1))
+    transfer = fft.rfft2(kernel_padded)
+    wiener = np.conj(transfer) / (np.abs(transfer) ** 2 + SPHERE_WIENER_NOISE)
+
+    deconvolved = fft.irfft2(fft.rfft2(padded, axes=(1, 2), workers=-1) * wiener, s=shape, axes=(1, 2), workers=-1)
+    return deconvolved[:, radius:radius + frames.shape[1], radius:radius + frames.shape[2]].astype(np.float32)
+
+
+def sliding_mean_frames_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Mean of every pixel over a window of size frames. Running sums make the cost independent of the size."""
+    return ndimage.uniform_filter1d(frames, size=max(size, 1), axis=0, mode="nearest")
+
+
+def mean_all_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Mean of every pixel over all frames, the same for every frame."""
+    return np.broadcast_to(frames.mean(axis=0, dtype=np.float32), frames.shape).copy()
+
+
+def median_all_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """Median of every pixel over all frames, the same for every frame."""
+    return np.broadcast_to(np.median(frames, axis=0).astype(np.float32), frames.shape).copy()
+
+
+def fill_mask_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Fill the pixels excluded by the mask (zero or False) from the surrounding pixels.
+
+    Uses normalised convolution with a Gaussian of size pixels, repeated until holes wider than the Gaussian are
+    filled from their edges inwards. Frames are unchanged if there is no mask.
+    """
+    if mask is None:
+        return frames.copy()
+    known = np.broadcast_to(np.asarray(mask) > 0, frames.shape) & np.isfinite(frames)
+    filled = np.where(known, frames, 0).astype(np.float32)
+    sigma = (0, max(size, 1), max(size, 1))
+    for _ in range(FILL_MASK_MAX_ITERATIONS):
+        if known.all():
+            break
+        weights = ndimage.gaussian_filter(known.astype(np.float32), sigma=sigma, mode="reflect")
+        values = ndimage.gaussian_filter(filled, sigma=sigma, mode="reflect")
+        newly_known = ~known & (weights > 1e-3)
+        filled[newly_known] = values[newly_known] / weights[newly_known]
+        known = known | newly_known
+    return filled
+
+
+def scar_fill_filter_frames(frames: np.ndarray, size: int, mask: np.ndarray | None = None) -> np.ndarray:
+    """
+    Replace scars, pixels that stand out from the rows above and below them in the same direction, with the mean of
+    those rows.
+
+    A pixel is a scar when it differs from both vertical neighbours by more than size times the standard deviation of
+    the vertical differences of its frame, estimated robustly from their median absolute deviation.
+    """
+    filled = frames.copy()
+    if frames.shape[1] < 3:
+        return filled
+    above, centre, below = frames[:, :-2], frames[:, 1:-1], frames[:, 2:]
+    differences = np.diff(frames, axis=1)
+    deviations = np.median(np.abs(differences - np.median(differences, axis=(1, 2), keepdims=True)), axis=(1, 2))
+    thresholds = (max(size, 1) * MAD_TO_SIGMA * deviations).astype(np.float32)[:, None, None]
+
+    up, down = centre - above, centre - below
+    scars = ((up > thresholds) & (down > thresholds)) | ((up < -thresholds) & (down < -thresholds))
+    filled[:, 1:-1] = np.where(scars, (above + below) / 2, centre)
+    return filled
+
+
+FILTER_FUNCTIONS = {
+    "Gaussian": gaussian_filter_frames,
+    "Median": median_filter_frames,
+    "Mean": mean_filter_frames,
+    "Non-local mean": non_local_mean_filter_frames,
+    "High-pass": high_pass_filter_frames,
+    "Top Hat": top_hat_filter_frames,
+    "Sliding Mean Frames": sliding_mean_frames_filter_frames,
+    "Sphere Deconvolution": sphere_deconvolution_filter_frames,
+    "Mean All": mean_all_filter_frames,
+    "Median all": median_all_filter_frames,
+    "Fill Mask": fill_mask_filter_frames,
+    "Scar Fill": scar_fill_filter_frames,
+}
+# Filters along the frame axis. Every pixel is filtered on its own, so they can be split by rows instead of frames
+TEMPORAL_FILTERS = ["Sliding Mean Frames", "Mean All", "Median all"]
+
+
+def filter_frames(frames, filter_name: str, size: int, imgt: np.ndarray | None = None,
+                  subtract: bool = False) -> np.ndarray:
+    """
+    Apply one of the FILTER_FUNCTIONS to a whole stack of frames at once.
+
+    Parameters
+    ----------
+    frames : np.ndarray or FrameSource
+        The frames to filter (N x H x W), or a single frame (H x W).
+    filter_name : str
+        A key of FILTER_FUNCTIONS, or "Off".
+    size : int
+        The size of the filter, e.g. the standard deviation of the Gaussian or the width of the median window in
+        pixels, or the number of frames of the sliding mean.
+    imgt : np.ndarray, optional
+        Mask (H x W or N x H x W), used by "Fill Mask" for the pixels to keep.
+    subtract : bool
+        Return the frames minus the filtered frames, e.g. to remove the background found by a wide filter.
+
+    Returns
+    -------
+    np.ndarray
+        The filtered frames as float32 (N x H x W).
+    """
+    stack = np.array(frames, dtype=np.float32)
+    if stack.ndim == 2:
+        stack = stack[None]
+    if stack.ndim != 3:
+        raise ValueError(f"Frames must be a 2D or 3D array, got {stack.ndim} dimensions.")
+    if filter_name == "Off":
+        return stack
+    if filter_name not in FILTER_FUNCTIONS:
+        raise ValueError(f"Unknown filter {filter_name}, expected one of {list(FILTER_FUNCTIONS)}.")
+
+    filtered = FILTER_FUNCTIONS[filter_name](stack, size, imgt).astype(np.float32, copy=False)
+    return stack - filtered if subtract else filtered
+
+
+def preview_frame_indices(frame_no: int, n_frames: int, filter_name: str, size: int,
+                          max_frames: int = PREVIEW_MAX_TEMPORAL_FRAMES) -> np.ndarray:
+    """
+    The frames needed to preview a filter on one frame, see filter_preview_frame.
+
+    Spatial filters only need the frame itself. The sliding mean needs the frames of its window, repeating the first
+    or last frame at the ends of the movie. Filters over all frames are previewed from at most max_frames evenly
+    spaced frames.
+    """
+    if filter_name == "Sliding Mean Frames":
+        size = max(size, 1)
+        start = frame_no - size // 2
+        return np.clip(np.arange(start, start + size), 0, n_frames - 1)
+    if filter_name in ("Mean All", "Median all"):
+        if n_frames <= max_frames:
+            return np.arange(n_frames)
+        return np.unique(np.r_[np.round(np.linspace(0, n_frames - 1, max_frames)).astype(int), frame_no])
+    return np.array([frame_no])
+
+
+def filter_preview_frame(frames: np.ndarray, frame_no: int, indices: np.ndarray, filter_name: str, size: int,
+                         imgt: np.ndarray | None = None, subtract: bool = False) -> np.ndarray:
+    """
+    Filter a single frame for an interactive preview.
+
+    Parameters
+    ----------
+    frames : np.ndarray
+        The frames given by preview_frame_indices (n x H x W).
+    frame_no : int
+        The frame to preview, which is in indices.
+    indices : np.ndarray
+        The frame numbers of frames, as returned by preview_frame_indices.
+
+    Returns
+    -------
+    np.ndarray
+        The filtered frame (H x W).
+    """
+    frame = np.asarray(frames[int(np.flatnonzero(indices == frame_no)[0])], dtype=np.float32)
+    if filter_name in ("Sliding Mean Frames", "Mean All"):
+        filtered = np.mean(frames, axis=0, dtype=np.float32)
+    elif filter_name == "Median all":
+        filtered = np.median(frames, axis=0).astype(np.float32)
+    else:
+        return filter_frames(frame, filter_name, size, imgt, subtract)[0]
+    return frame - filtered if subtract else filtered
+
+
+def _noise_sigma(frame: np.ndarray) -> float:
+    """Standard deviation of the pixel noise, from the median absolute deviation of neighbouring pixel differences."""
+    differences = np.diff(frame, axis=1)
+    return float(MAD_TO_SIGMA * np.median(np.abs(differences - np.median(differences))) / np.sqrt(2))
+
+
+def _reflect_pad(frames: np.ndarray, width: int) -> np.ndarray:
+    # Symmetric padding repeats the edge pixel, as ndimage's "reflect" mode does, so the Fourier domain filters give
+    # the same borders as the direct ones
+    return np.pad(frames, ((0, 0), (width, width), (width, width)), mode="symmetric")
+
+
+def _fft_gaussian(frames: np.ndarray, sigma: float) -> np.ndarray:
+    """
+    Gaussian blur by multiplication with its transfer function, with the frames reflected at their edges.
+
+    Every pixel of a frame contributes to every frequency, so non-finite pixels are left out by normalised
+    convolution, see _normalised_filter, rather than making the whole frame NaN.
+    """
+    return _normalised_filter(lambda values: _fft_blur(values, sigma), frames)
+
+
+def _normalised_filter(linear_filter, frames: np.ndarray) -> np.ndarray:
+    """
+    Apply a linear filter with non-finite pixels left out, by normalised convolution.
+
+    The frames with non-finite pixels set to zero and the mask of finite pixels are both filtered, and the first is
+    divided by the second, as in fill_mask_filter_frames, so pixels far from any non-finite pixel are filtered as
+    before. Non-finite pixels keep their value, and pixels with too few
+    finite neighbours are NaN. Frames without non-finite pixels are filtered directly.
+    """
+    finite = np.isfinite(frames)
+    if finite.all():
+        return linear_filter(frames)
+    # Relative to the weights of frames with every pixel finite, which are not one for filters that do not preserve
+    # the mean, such as the Wiener deconvolution
+    weights = linear_filter(finite.astype(np.float32)) / linear_filter(np.ones(frames.shape, dtype=np.float32))
+    filtered = linear_filter(np.where(finite, frames, 0).astype(np.float32))
+    np.divide(filtered, weights, out=filtered, where=weights > NORMALISED_MIN_WEIGHT)
+    filtered[weights <= NORMALISED_MIN_WEIGHT] = np.nan
+    return np.where(finite, filtered, frames)
+
+
+def _fft_blur(frames: np.ndarray, sigma: float) -> np.ndarray:
+    width = int(np.ceil(4 * sigma))
+    padded = _reflect_pad(frames, width)
+    shape = padded.shape[1:]
+    frequency_y = fft.fftfreq(shape[0]).astype(np.float32)[:, None]
+    frequency_x = fft.rfftfreq(shape[1]).astype(np.float32)[None, :]
+    transfer = np.exp(-2 * np.pi ** 2 * sigma ** 2 * (frequency_y ** 2 + frequency_x ** 2))
+
+    blurred = fft.irfft2(fft.rfft2(padded, axes=(1, 2), workers=-1) * transfer, s=shape, axes=(1, 2), workers=-1)
+    return blurred[:, width:width + frames.shape[1], width:width + frames.shape[2]].astype(np.float32)
+
+
+def _histogram_median(frames: np.ndarray, size: int) -> np.ndarray:
+    """
+    Median of a size x size window around every pixel, from running histograms.
+
+    The values of every frame are split into MEDIAN_HISTOGRAM_BINS bins holding equal numbers of pixels. The number
+    of window pixels in each bin is a box filter of the pixels in the bin, so the cost per pixel is independent of
+    the window size. The median is interpolated within the bin holding the middle window pixel, so it is accurate to
+    a fraction of that bin's width.
+
+    Non-finite pixels are left out of the bin edges and of every window, and stay non-finite.
+    """
+    n_frames = frames.shape[0]
+    finite = np.isfinite(frames)
+    all_finite = finite.all()
+    quantiles = np.linspace(0, 1, MEDIAN_HISTOGRAM_BINS + 1)
+    if all_finite:
+        edges = np.quantile(frames.reshape(n_frames, -1), quantiles, axis=1)
+    else:
+        with warnings.catch_warnings():
+            # Frames without finite pixels have NaN edges, every pixel is restored below
+            warnings.simplefilter("ignore", RuntimeWarning)
+            edges = np.nanquantile(np.where(finite, frames, np.nan).reshape(n_frames, -1), quantiles, axis=1)
+    edges = edges.T.astype(np.float32)  # N x bins + 1
+    bins = np.empty(frames.shape, dtype=np.int16)
+    for frame_no in range(n_frames):
+        bins[frame_no] = np.clip(np.searchsorted(edges[frame_no], frames[frame_no], side="right") - 1, 0,
+                                 MEDIAN_HISTOGRAM_BINS - 1)
+
+    if not all_finite:
+        # Non-finite pixels are put in no bin
+        bins[~finite] = -1
+
+    # Fractions of the window below the current bin. The median lies in the bin where this crosses half of the
+    # finite fraction of the window
+    half = 0.5 if all_finite else ndimage.uniform_filter(finite.astype(np.float32), size=(1, size, size),
+                                                         mode="reflect") / 2
+    below = np.zeros(frames.shape, dtype=np.float32)
+    median = np.full(frames.shape, np.nan, dtype=np.float32)
+    for bin_no in range(MEDIAN_HISTOGRAM_BINS):
+        in_bin = ndimage.uniform_filter((bins == bin_no).astype(np.float32), size=(1, size, size), mode="reflect")
+        crossing = np.isnan(median) & (below + in_bin >= half)
+        if np.any(crossing):
+            lower = np.broadcast_to(edges[:, bin_no, None, None], frames.shape)[crossing]
+            upper = np.broadcast_to(edges[:, bin_no + 1, None, None], frames.shape)[crossing]
+            half_crossing = half if all_finite else half[crossing]
+            fraction = (half_crossing - below[crossing]) / np.maximum(in_bin[crossing], 1e-12)
+            median[crossing] = lower + np.clip(fraction, 0, 1) * (upper - lower)
+        below += in_bin
+    return median if all_finite else np.where(finite, median, frames)
@@ -0,0 +1,355 @@
+from __future__ import annotations
+import os
+import math
+import logging
+import threading
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, NamedTuple
+import numpy as np
+from PyQt6.QtCore import QObject, pyqtSignal
+from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_PROCESSING_WORKERS = os.cpu_count() or 1
+# Every worker is given several chunks so that workers that finish early pick up the remaining frames, and progress
+# is reported often enough for the progress bar to move smoothly
+CHUNKS_PER_WORKER = 4
+# Upper bound on the frames in one chunk, so progress and cancellation stay responsive on long movies
+MAX_CHUNK_FRAMES = 64
+
+
+class _JobCancelled(Exception):
+    pass
+
+
+def _process_chunk(shm_name: str, shape: tuple, start: int, stop: int, operation: Callable, kwargs: dict,
+                   frame_kwargs: dict, chunk_axis: int = 0) -> tuple[int, int]:
+    """
+    Apply an operation to frames start to stop of a stack held in shared memory, writing the result back in place.
+
+    With chunk_axis 1 the chunk is rows start to stop of every frame instead, for operations along the frame axis.
+
+    Defined at module level so it can be sent to worker processes. Only the shared memory name, the chunk bounds and
+    the operation arguments are pickled, never the frames.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        chunk = (slice(None),) * chunk_axis + (slice(start, stop),)
+        chunk_kwargs = dict(kwargs)
+        chunk_kwargs.update({name: value[chunk] for name, value in frame_kwargs.items()})
+        frames[chunk] = operation(frames[chunk], **chunk_kwargs)
+        del frames
+    finally:
+        shm.close()
+    return start, stop
+
+
+class ProcessingStage(NamedTuple):
+    """
+    One operation of a job, applied to every frame before the next stage starts.
+
+    Attributes
+    ----------
+    operation : Callable
+        Function taking a float32 chunk of frames and the keyword arguments, returning the processed chunk with the
+        same shape, e.g. level_frames. Must be defined at module level so it can be pickled.
+    kwargs : dict
+        Keyword arguments passed unchanged to every chunk.
+    frame_kwargs : dict
+        Keyword arguments with one entry per frame along their first axis (e.g. an N x H x W mask). Each chunk is
+        given the matching slice.
+    chunk_axis : int
+        0 to split the stack into chunks of frames. 1 to split it into chunks of rows of every frame, for operations
+        along the frame axis such as temporal filters.
+    """
+    operation: Callable
+    kwargs: dict = {}
+    frame_kwargs: dict = {}
+    chunk_axis: int = 0
+
+
+def _chunks(shape: tuple, chunk_axis: int) -> list[tuple[int, int]]:
+    # Chunks of at most MAX_CHUNK_FRAMES frames, or of rows holding about as many pixels
+    length = shape[chunk_axis]
+    max_length = MAX_CHUNK_FRAMES if chunk_axis == 0 else max(1, MAX_CHUNK_FRAMES * shape[1] // shape[0])
+    chunk_length = max(1, min(max_length, math.ceil(length / (MAX_PROCESSING_WORKERS * CHUNKS_PER_WORKER))))
+    return [(start, min(start + chunk_length, length)) for start in range(0, length, chunk_length)]
+
+
+class FrameParallelExecutor(QObject):
+    """
+    Runs per frame image processing operations (levelling, filtering) across a pool of worker processes.
+
+    The frame stack is copied once into a shared memory buffer and split into chunks of frames. Each worker maps the
+    buffer, processes its chunk and writes the result back into the buffer, so no frames are pickled between
+    processes. When every chunk is done the results are written into the "Preview" storage of the MediaDataManager,
+    replacing its frames in place.
+
+    A job is one or more ProcessingStages (e.g. levelling then filtering), run one after another on the same buffer.
+
+    Only one job runs at a time. Starting a new job cancels the previous one, whose results are discarded.
+
+    Interactive tools preview their result on the displayed frame and defer() the job for the whole movie instead of
+    running it on every change. accept_changes() runs the deferred job and accepts the preview once it finishes.
+    """
+    _instance = None
+
+    progress = pyqtSignal(int, int)  # Frames processed, total frames
+    finished = pyqtSignal()
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
+    # Emitted from the coordinating thread. Connected with a queued connection so they are handled on the GUI thread
+    _chunk_done = pyqtSignal(int, int)
+    _job_done = pyqtSignal(int, str, str, object)
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FrameParallelExecutor, cls).__new__(cls)
+            QObject.__init__(cls._instance)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.media_data_manager = MediaDataManager()
+        self.process_pool = None
+        self.generation = 0
+        self.cancel_event = threading.Event()
+        self.job_thread = None
+        self.total_frames = 0
+        self.deferred_job = None
+        self.accept_when_finished = False
+
+        self._chunk_done.connect(self._on_chunk_done)
+        self._job_done.connect(self._on_job_done)
+        # Results of a job started on the previous file must not be written over the new one
+        self.media_data_manager.new_file_loaded.connect(self.discard_deferred_job)
+        self.media_data_manager.new_file_loaded.connect(self.cancel)
+
+    def __init__(self):
+        pass
+
+    def run(self, operation: Callable, source_mode: str = "Target", frame_kwargs: dict | None = None,
+            chunk_axis: int = 0, **kwargs):
+        """
+        Apply an operation to every frame of a storage in the background and write the results to "Preview".
+
+        Parameters
+        ----------
+        operation : Callable
+            Function taking a float32 chunk of frames (n x H x W) and the keyword arguments, returning the processed
+            chunk with the same shape, e.g. level_frames. Must be defined at module level so it can be pickled.
+        source_mode : str
+            The storage of the MediaDataManager whose frames are processed. Defaults to "Target", so that repeated
+            runs with different settings do not compound on each other's results.
+        frame_kwargs : dict, optional
+            Keyword arguments with one entry per frame along their first axis (e.g. an N x H x W mask). Each chunk is
+            given the matching slice.
+        chunk_axis : int
+            Split the frames into chunks along this axis, see ProcessingStage.
+        **kwargs
+            Keyword arguments passed unchanged to every chunk.
+        """
+        self.run_stages([ProcessingStage(operation, kwargs, frame_kwargs or {}, chunk_axis)], source_mode)
+
+    def run_stages(self, stages: list[ProcessingStage], source_mode: str = "Target"):
+        """
+        Apply several operations to every frame of a storage in the background and write the results to "Preview".
+
+        Each stage is applied to the whole stack before the next one starts. Progress counts the frames of every
+        stage, so it reaches the number of frames times the number of stages.
+        """
+        self.deferred_job = None
+        self._start_job(stages, source_mode)
+
+    def _start_job(self, stages: list[ProcessingStage], source_mode: str):
+        self.cancel()
+        storage = self.media_data_manager.storage[source_mode]
+        frames = storage.get_frames()
+        if frames is None:
+            raise ValueError(f"No frames loaded in the '{source_mode}' storage.")
+
+        self.generation += 1
+        self.cancel_event = threading.Event()
+        self.total_frames = len(frames) * len(stages)
+        self.progress.emit(0, self.total_frames)
+
+        self.job_thread = threading.Thread(
+            target=self._run_job,
+            args=(self.generation, self.cancel_event, frames, list(stages)),
+            name="frame_parallel_job",
+            daemon=True,
+        )
+        self.job_thread.start()
+
+    def defer(self, operation: Callable, source_mode: str = "Target", frame_kwargs: dict | None = None,
+              chunk_axis: int = 0, **kwargs):
+        """
+        Store a job to run over every frame when the preview is accepted, replacing any earlier deferred job.
+
+        Takes the same arguments as run(). A running job is cancelled, since its results are superseded.
+        """
+        self.defer_stages([ProcessingStage(operation, kwargs, frame_kwargs or {}, chunk_axis)], source_mode)
+
+    def defer_stages(self, stages: list[ProcessingStage], source_mode: str = "Target"):
+        """Store a job of several stages to run when the preview is accepted, see defer() and run_stages()."""
+        self.cancel()
+        self.deferred_job = (list(stages), source_mode)
+
+    def has_deferred_job(self) -> bool:
+        """Return True if a job is deferred and is not already being run to accept the preview."""
+        return self.deferred_job is not None and not self.accept_when_finished
+
+    def discard_deferred_job(self):
+        self.deferred_job = None
+
+    def accept_changes(self):
+        """
+        Accept the "Preview" storage as the new "Target".
+
+        If a job is deferred it is run first and the preview is accepted once it finishes, so the accepted frames are
+        all processed. Cancelling the job also cancels accepting. The job stays deferred until it has finished, so if
+        it is cancelled or fails the next accept runs it again rather than accepting a partly processed preview.
+        """
+        if self.deferred_job is not None:
+            stages, source_mode = self.deferred_job
+            self._start_job(stages, source_mode)
+            self.accept_when_finished = True
+        elif self.is_running() and not self.cancel_event.is_set():
+            self.accept_when_finished = True
+        else:
+            self.media_data_manager.accept_changes()
+
+    def cancel(self):
+        """Cancel the running job. Chunks already being processed finish, but nothing is written to "Preview"."""
+        self.cancel_event.set()
+        self.accept_when_finished = False
+
+    def is_running(self) -> bool:
+        return self.job_thread is not None and self.job_thread.is_alive()
+
+    def shutdown(self):
+        """Cancel any running job and stop the worker processes."""
+        self.cancel()
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        # The pool is kept between jobs so workers are only started once. Workers are spawned rather than forked,
+        # forking a process that is running Qt and other threads is unsafe
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(max_workers=MAX_PROCESSING_WORKERS,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+        return self.process_pool
+
+    def _run_job(self, generation: int, cancel_event: threading.Event, frames, stages: list[ProcessingStage]):
+        shape = (len(frames), *frames.shape[1:])
+        chunks = _chunks(shape, 0)
+
+        shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(np.float32).itemsize))
+        try:
+            buffer = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            # Fill the buffer a chunk at a time, so lazy frame sources are decoded without a second full copy
+            for start, stop in chunks:
+                if cancel_event.is_set():
+                    raise _JobCancelled()
+                buffer[start:stop] = frames[start:stop]
+            del buffer
+
+            try:
+                self._process_stages(self._get_process_pool(), generation, cancel_event, shm.name, shape, stages)
+            except BrokenProcessPool as e:
+                logger.warning(f"Process pool failed ({e}), processing frames with threads instead")
+                self.process_pool = None
+                # Some chunks may already hold their results, so refill the buffer from the source and start again
+                buffer = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                for start, stop in chunks:
+                    buffer[start:stop] = frames[start:stop]
+                del buffer
+                self._chunk_done.emit(generation, 0)
+                with ThreadPoolExecutor(max_workers=MAX_PROCESSING_WORKERS) as executor:
+                    self._process_stages(executor, generation, cancel_event, shm.name, shape, stages)
+        except _JobCancelled:
+            shm.close()
+            shm.unlink()
+            self._job_done.emit(generation, "cancelled", "", None)
+            return
+        except Exception as e:
+            traceback.print_exc()
+            shm.close()
+            shm.unlink()
+            self._job_done.emit(generation, "failed", str(e), None)
+            return
+
+        # The GUI thread copies the results into "Preview" and then releases the buffer
+        self._job_done.emit(generation, "finished", "", (shm, shape))
+
+    def _process_stages(self, executor, generation: int, cancel_event: threading.Event, shm_name: str, shape: tuple,
+                        stages: list[ProcessingStage]):
+        for stage_no, stage in enumerate(stages):
+            self._process_chunks(executor, generation, cancel_event, shm_name, shape, stage, stage_no * shape[0])
+
+    def _process_chunks(self, executor, generation: int, cancel_event: threading.Event, shm_name: str, shape: tuple,
+                        stage: ProcessingStage, frames_before: int):
+        pending = {executor.submit(_process_chunk, shm_name, shape, start, stop, stage.operation, stage.kwargs,
+                                   stage.frame_kwargs, stage.chunk_axis)
+                   for start, stop in _chunks(shape, stage.chunk_axis)}
+        # Chunks of rows are counted as the equivalent number of whole frames
+        frames_per_index = shape[0] / shape[stage.chunk_axis]
+        indices_done = 0
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, stop = future.result()
+                    indices_done += stop - start
+                    self._chunk_done.emit(generation, frames_before + round(indices_done * frames_per_index))
+                if cancel_event.is_set():
+                    raise _JobCancelled()
+        finally:
+            for future in pending:
+                future.cancel()
+            # Running chunks still write to the buffer, it can only be released once they are done
+            wait(pending)
+
+    def _on_chunk_done(self, generation: int, frames_done: int):
+        if generation != self.generation:
+            return
+        self.progress.emit(frames_done, self.total_frames)
+
+    def _on_job_done(self, generation: int, status: str, message: str, result):
+        if status == "finished":
+            shm, shape = result
+            try:
+                if generation == self.generation and not self.cancel_event.is_set():
+                    results = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                    self.media_data_manager.write_frames(0, results)
+                    del results
+                else:
+                    status = "cancelled"
+            finally:
+                shm.close()
+                shm.unlink()
+
+        if generation != self.generation:
+            return
+        if status == "finished":
+            # Every frame is now processed, so there is nothing left to defer
+            self.deferred_job = None
+            if self.accept_when_finished:
+                self.accept_when_finished = False
+                self.media_data_manager.accept_changes()
+            self.finished.emit()
+        elif status == "cancelled":
+            self.cancelled.emit()
+        else:
+            print(f"Frame processing failed: {message}")
+            self.failed.emit(message)
@@ -0,0 +1,339 @@
+from __future__ import annotations
+from functools import lru_cache
+import numpy as np
+
+# In line mode a row needs this many unmasked pixels more than the polynomial order to be fitted
+LINE_FIT_EXTRA_POINTS = 8
+# Interactive previews fit the backgrounds of the displayed frame on a proxy of at most this many pixels, so that
+# re-levelling stays within the time of a single UI frame (about 16 ms) even with the iterative auto modes
+PREVIEW_MAX_FIT_PIXELS = 128 * 128
+
+
+@lru_cache(maxsize=32)
+def vandermonde(length: int, order: int) -> np.ndarray:
+    """
+    Vandermonde matrix (length x order + 1) of the pixel positions of a line.
+
+    Positions are scaled to [-1, 1] so that fits stay well conditioned in float32.
+    """
+    positions = np.linspace(-1.0, 1.0, length) if length > 1 else np.zeros(1)
+    return np.vander(positions, order + 1, increasing=True).astype(np.float32)
+
+
+@lru_cache(maxsize=32)
+def vandermonde_products(length: int, order: int) -> np.ndarray:
+    """Outer products of every row of the Vandermonde matrix with itself (length x (order + 1)^2), the terms of V^T W V."""
+    vander = vandermonde(length, order)
+    return (vander[:, :, None] * vander[:, None, :]).reshape(length, -1)
+
+
+def fit_lines(lines: np.ndarray, order: int, weights: np.ndarray | None = None, min_points: int | None = None,
+              axis: int = -1, evaluate_length: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Least-squares polynomial fit of every line in a batch.
+
+    Parameters
+    ----------
+    lines : np.ndarray
+        Lines to fit, running along axis.
+    order : int
+        The polynomial order.
+    weights : np.ndarray, optional
+        Weights of every value, the same shape as lines. Zero or False weights exclude values, e.g. masked pixels.
+        Values that are not finite are always excluded. If None, every finite value has a weight of one.
+    min_points : int, optional
+        Lines with fewer non zero weights than this are not fitted. Defaults to order + 1.
+    axis : int
+        The axis the lines run along, -1 (e.g. the rows of frames) or -2 (e.g. the columns of frames). Fitting the
+        columns of frames along -2 avoids copying the frames into a transposed layout.
+    evaluate_length : int, optional
+        Evaluate the fitted polynomials along lines of this length instead, spanning the same positions. Used to fit
+        lines subsampled at evenly spaced positions and apply the fits to the full lines.
+
+    Returns
+    -------
+    np.ndarray
+        The fitted polynomial evaluated along every line, the shape of lines with evaluate_length along axis. Lines
+        that could not be fitted are zero.
+    np.ndarray
+        Boolean array of which lines were fitted, the shape of lines without axis.
+    """
+    if axis not in (-1, -2):
+        raise ValueError(f"Lines must run along axis -1 or -2, got {axis}.")
+    length = lines.shape[axis]
+    min_points = order + 1 if min_points is None else min_points
+    vander = vandermonde(length, order)
+    products = vandermonde_products(length, order)
+
+    # Binary weights (masks) only need the excluded values zeroed, general weights also scale the values
+    finite = np.isfinite(lines)
+    binary = weights is None or weights.dtype == bool
+    if weights is None:
+        weights = finite
+    elif binary:
+        weights = weights & finite
+    else:
+        weights = np.where(finite, weights, 0).astype(np.float32)
+    values = np.where(weights != 0, lines, 0).astype(np.float32, copy=False)
+    if not binary:
+        values *= weights
+    weights = weights.astype(np.float32, copy=False)
+
+    # Normal equations (V^T W V) c = V^T W y of every line
+    if axis == -1:
+        normal_matrices = weights @ products
+        normal_vectors = values @ vander
+    else:
+        normal_matrices = np.swapaxes(products.T @ weights, -1, -2)
+        normal_vectors = np.swapaxes(vander.T @ values, -1, -2)
+
+    # The first Vandermonde column is all ones, so the first term of V^T W V counts the non zero binary weights
+    counts = normal_matrices[..., 0] if binary else np.count_nonzero(weights, axis=axis)
+    fitted = counts >= min_points
+
+    normal_matrices = normal_matrices.reshape(*normal_matrices.shape[:-1], order + 1, order + 1).astype(np.float64)
+    # A tiny ridge term keeps degenerate lines solvable, e.g. when every unmasked pixel is at one position, and lines
+    # that are not fitted solve an identity system so the batch never contains a singular matrix
+    normal_matrices += np.eye(order + 1) * 1e-9 * np.trace(normal_matrices, axis1=-2, axis2=-1)[..., None, None]
+    normal_matrices[~fitted] = np.eye(order + 1)
+    coefficients = np.linalg.solve(normal_matrices, normal_vectors[..., None].astype(np.float64))[..., 0]
+    coefficients[~fitted] = 0
+    coefficients = coefficients.astype(np.float32)
+
+    if evaluate_length is not None:
+        vander = vandermonde(evaluate_length, order)
+    if axis == -1:
+        backgrounds = coefficients @ vander.T
+    else:
+        backgrounds = vander @ np.swapaxes(coefficients, -1, -2)
+    return backgrounds, fitted
+
+
+def masked_mean(frames: np.ndarray, mask: np.ndarray, axis: int) -> np.ndarray:
+    """Mean over an axis of the finite, unmasked values. NaN where there are none."""
+    valid = mask & np.isfinite(frames)
+    totals = np.where(valid, frames, 0).sum(axis=axis, dtype=np.float32)
+    counts = valid.sum(axis=axis)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan).astype(np.float32)
+
+
+def proxy_indices(length: int, max_length: int) -> np.ndarray | slice:
+    """
+    Evenly spaced indices of at most max_length of the positions along a line, always including both ends.
+
+    Returns a slice of every position when no subsampling is needed, so indexing with it does not copy.
+    """
+    if max_length >= length:
+        return slice(None)
+    return np.round(np.linspace(0, length - 1, max(2, max_length))).astype(np.intp)
+
+
+def level_frames(frames, polyx: int, polyy: int, line_plane: str, imgt: np.ndarray | None = None,
+                 max_fit_pixels: int | None = None) -> np.ndarray:
+    """
+    Level every frame of a movie with polynomial backgrounds, in one vectorised pass.
+
+    Parameters
+    ----------
+    frames : np.ndarray or FrameSource
+        The frames to level (N x H x W), or a single frame (H x W).
+    polyx : int
+        Polynomial order fitted along x. In plane mode this is fitted to the mean of every row, in line mode to every
+        row on its own. 0 disables it.
+    polyy : int
+        Polynomial order fitted along y. In plane mode this is fitted to the mean of every column, in line mode to
+        every column on its own. 0 disables it.
+    line_plane : str
+        "plane" or "line".
+    imgt : np.ndarray, optional
+        Mask of the pixels used for fitting (H x W for every frame, or N x H x W). Pixels that are zero or False are
+        excluded from the fits but are still levelled. If None, every pixel is used.
+    max_fit_pixels : int, optional
+        Fit the backgrounds to a proxy of every frame subsampled to at most this many pixels, and subtract them
+        from the full frames. Plane fits subsample both axes, line fits only the axis along the lines, so every row
+        (or column) still gets its own fit. If None, every pixel is fitted.
+
+    Returns
+    -------
+    np.ndarray
+        The levelled frames as float32 (N x H x W).
+    """
+    # Copy into float32, this also decodes lazy frame sources
+    levelled = np.array(frames, dtype=np.float32)
+    if levelled.ndim == 2:
+        levelled = levelled[None]
+    if levelled.ndim != 3:
+        raise ValueError(f"Frames must be a 2D or 3D array, got {levelled.ndim} dimensions.")
+
+    height, width = levelled.shape[1:]
+    pixels = height * width
+    max_fit_pixels = pixels if max_fit_pixels is None else max_fit_pixels
+    mask = None if imgt is None else np.broadcast_to(np.asarray(imgt) > 0, levelled.shape)
+
+    if line_plane == "plane":
+        # Subsample both axes by the same factor
+        scale = np.sqrt(max_fit_pixels / pixels)
+        rows = proxy_indices(height, int(height * scale))
+        cols = proxy_indices(width, int(width * scale))
+        proxy = levelled[:, rows][:, :, cols]
+        plane_mask = True if mask is None else mask[:, rows][:, :, cols]
+
+        if polyx > 0:
+            # Fit the mean of every row against the row position, one line per frame
+            row_means = masked_mean(proxy, plane_mask, axis=2)
+            background, fitted = fit_lines(row_means, polyx, evaluate_length=height)
+            background = np.where(fitted[:, None], background, 0)
+            levelled -= background[:, :, None]
+            proxy = levelled[:, rows][:, :, cols]
+
+        if polyy > 0:
+            column_means = masked_mean(proxy, plane_mask, axis=1)
+            background, fitted = fit_lines(column_means, polyy, evaluate_length=width)
+            levelled -= np.where(fitted[:, None], background, 0)[:, None, :]
+
+    elif line_plane == "line":
+        if polyx > 0:
+            # Every row of every frame is a line
+            cols = proxy_indices(width, max_fit_pixels // height)
+            row_mask = None if mask is None else mask[:, :, cols]
+            background, fitted = fit_lines(levelled[:, :, cols], polyx, weights=row_mask,
+                                           min_points=polyx + LINE_FIT_EXTRA_POINTS, evaluate_length=width)
+            levelled -= background
+            # Rows without enough unmasked pixels are shifted by the median background of the fitted rows
+            unfitted = ~fitted
+            if np.any(unfitted):
+                fitted_backgrounds = np.where(fitted[:, :, None], background, np.nan)
+                frame_medians = np.zeros(levelled.shape[0], dtype=np.float32)
+                has_fitted_rows = np.any(fitted, axis=1)
+                frame_medians[has_fitted_rows] = np.nanmedian(fitted_backgrounds[has_fitted_rows], axis=(1, 2))
+                levelled -= np.where(unfitted, frame_medians[:, None], 0)[:, :, None]
+
+        if polyy > 0:
+            # Every column of every frame is a line
+            rows = proxy_indices(height, max_fit_pixels // width)
+            column_mask = None if mask is None else mask[:, rows]
+            background, fitted = fit_lines(levelled[:, rows], polyy, weights=column_mask, axis=-2,
+                                           evaluate_length=height)
+            levelled -= background
+
+    else:
+        raise ValueError(f"Unknown levelling mode {line_plane}, expected 'plane' or 'line'.")
+
+    return levelled
+
+
+# Auto levelling modes: which side of the background is excluded from the fit, how the exclusion threshold is set
+# ("height" is a fixed height in nm, "fit" a multiple of the spread of the background) and the iteration limit
+AUTO_LEVELLING_MODES = {
+    "Iterative 1nm High": {"exclude_high": True, "exclude_low": False, "threshold": "height", "max_iterations": 10},
+    "Iterative -1nm Low": {"exclude_high": False, "exclude_low": True, "threshold": "height", "max_iterations": 10},
+    "Iterative High Low": {"exclude_high": True, "exclude_low": True, "threshold": "height", "max_iterations": 10},
+    "High-Low x2 (Fit)": {"exclude_high": True, "exclude_low": True, "threshold": "fit", "max_iterations": 2},
+    "Iterative Fit Holes": {"exclude_high": False, "exclude_low": True, "threshold": "fit", "max_iterations": 10},
+    "Iterative Fit Peaks": {"exclude_high": True, "exclude_low": False, "threshold": "fit", "max_iterations": 10},
+}
+AUTO_HEIGHT_THRESHOLD_NM = 1.0
+# Multiple of the standard deviation of the background beyond which pixels are excluded in the "fit" modes
+AUTO_FIT_THRESHOLD_SIGMA = 3.0
+# A frame has converged once fewer than this fraction of its pixels change between masks of successive iterations
+AUTO_CONVERGENCE_FRACTION = 1e-2
+# Masks keeping fewer than this fraction of the pixels of a frame are rejected, the previous mask is kept instead
+AUTO_MIN_MASK_FRACTION = 0.05
+
+
+def auto_level_frames(frames, polyx: int, polyy: int, line_plane: str, mode: str, imgt: np.ndarray | None = None,
+                      max_iterations: int | None = None, max_fit_pixels: int | None = None) -> np.ndarray:
+    """
+    Level every frame iteratively, excluding features above and/or below the background from the fit.
+
+    Each iteration fits the residual of the previous one using the mask of background pixels found from it, so the
+    backgrounds accumulate instead of being fitted from scratch. Every frame with features is fitted with its first
+    mask, after that only frames whose masks still change by more than AUTO_CONVERGENCE_FRACTION of their pixels are
+    fitted again, the rest have converged.
+
+    Parameters
+    ----------
+    frames : np.ndarray or FrameSource
+        The frames to level (N x H x W), or a single frame (H x W).
+    polyx, polyy : int
+        Polynomial orders, see level_frames.
+    line_plane : str
+        "plane" or "line".
+    mode : str
+        One of AUTO_LEVELLING_MODES.
+    imgt : np.ndarray, optional
+        Mask of the pixels that may be used for fitting (H x W or N x H x W). Features are only excluded from these.
+    max_iterations : int, optional
+        Overrides the iteration limit of the mode.
+    max_fit_pixels : int, optional
+        Fit the backgrounds to subsampled proxies of the frames, see level_frames.
+
+    Returns
+    -------
+    np.ndarray
+        The levelled frames as float32 (N x H x W).
+    """
+    if mode not in AUTO_LEVELLING_MODES:
+        raise ValueError(f"Unknown auto levelling mode {mode}, expected one of {list(AUTO_LEVELLING_MODES)}.")
+    settings = AUTO_LEVELLING_MODES[mode]
+    max_iterations = settings["max_iterations"] if max_iterations is None else max_iterations
+
+    # The first iteration is plain levelling with the user's mask
+    levelled = level_frames(frames, polyx, polyy, line_plane, imgt, max_fit_pixels)
+    allowed = np.ones(levelled.shape, dtype=bool) if imgt is None else np.broadcast_to(np.asarray(imgt) > 0, levelled.shape)
+    mask = allowed.copy()
+    active = np.arange(len(levelled))
+    pixels_per_frame = levelled.shape[1] * levelled.shape[2]
+
+    for iteration in range(max_iterations):
+        residual = levelled[active]
+        new_mask = _background_mask(residual, mask[active], allowed[active], settings)
+
+        # Keep the previous mask of frames where too little background would be left to fit
+        too_small = new_mask.sum(axis=(1, 2)) < AUTO_MIN_MASK_FRACTION * pixels_per_frame
+        new_mask[too_small] = mask[active][too_small]
+
+        # The first mask is always fitted, small features such as single molecules change fewer pixels than the
+        # convergence fraction but still bias the plain levelling. Later masks only refine it
+        min_changed_pixels = 0 if iteration == 0 else AUTO_CONVERGENCE_FRACTION * pixels_per_frame
+        changed = np.count_nonzero(new_mask != mask[active], axis=(1, 2)) > min_changed_pixels
+        mask[active] = new_mask
+        active = active[changed]
+        if len(active) == 0:
+            break
+
+        # Fitting the residual with the new mask corrects the previous background, rather than starting again
+        levelled[active] = level_frames(levelled[active], polyx, polyy, line_plane, mask[active], max_fit_pixels)
+
+    return levelled
+
+
+def _background_mask(levelled: np.ndarray, mask: np.ndarray, allowed: np.ndarray, settings: dict) -> np.ndarray:
+    """Mask of the pixels that are background given the current levelling, for every frame at once."""
+    # Heights are measured from the mean of the current background of each frame
+    valid = mask & np.isfinite(levelled)
+    counts = np.maximum(valid.sum(axis=(1, 2)), 1)
+    background = np.where(valid, levelled, 0)
+    means = background.sum(axis=(1, 2), dtype=np.float64) / counts
+    heights = levelled - means[:, None, None].astype(np.float32)
+
+    if settings["threshold"] == "fit":
+        # When only one side is excluded the spread is measured on the other side, which features do not reach.
+        # Clipping the side the spread is measured on would shrink it every iteration and never converge
+        spread_pixels = valid
+        if settings["exclude_high"] != settings["exclude_low"]:
+            spread_pixels = valid & ((heights <= 0) if settings["exclude_high"] else (heights >= 0))
+        spread_counts = np.maximum(spread_pixels.sum(axis=(1, 2)), 1)
+        squares = np.where(spread_pixels, heights, 0) ** 2
+        sigmas = np.sqrt(squares.sum(axis=(1, 2), dtype=np.float64) / spread_counts)
+        thresholds = (AUTO_FIT_THRESHOLD_SIGMA * sigmas).astype(np.float32)[:, None, None]
+    else:
+        thresholds = np.float32(AUTO_HEIGHT_THRESHOLD_NM)
+
+    new_mask = allowed & np.isfinite(levelled)
+    if settings["exclude_high"]:
+        new_mask &= heights <= thresholds
+    if settings["exclude_low"]:
+        new_mask &= heights >= -thresholds
+    return new_mask
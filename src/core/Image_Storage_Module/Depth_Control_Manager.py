@@ -1,7 +1,14 @@
 from typing import Tuple
 import numpy as np
+from scipy.ndimage import minimum_filter1d, maximum_filter1d
 from PyQt6.QtCore import QObject, pyqtSignal
-from utils.constants import DEPTH_CONTROL_OPTIONS
+from utils.constants import DEPTH_CONTROL_OPTIONS, DEFAULT_DEPTH_WINDOW_FRAMES
+from .Frame_Source import FrameSource
+from .Frame_Statistics import FrameStatistics
+
+# Percentiles of the pixel values used as the bounds of the "Histogram" depth control
+HISTOGRAM_LOWER_PERCENTILE = 0.5
+HISTOGRAM_UPPER_PERCENTILE = 99.5
 
 class DepthControlManager(QObject):
     update_widgets = pyqtSignal()
@@ -10,9 +17,18 @@ class DepthControlManager(QObject):
     def __init__(self):
         super().__init__()
         self.depth_control_type = DEPTH_CONTROL_OPTIONS[0]
-        self.frame_depth_metadata_dict = {}
+        self.frames = None
+        self.frame_metadata = None
+        self.frame_statistics = None
         self.manual_min = 0.0
         self.manual_max = 0.0
+        self.window_size = DEFAULT_DEPTH_WINDOW_FRAMES
+        # Bounds of the whole movie, of the rolling window around every frame and of the merged histogram of the whole
+        # movie, built from the frame statistics the first time they are needed, with the statistics version they
+        # were built from
+        self.movie_bounds = None
+        self.window_bounds = None
+        self.movie_histogram_bounds = None
 
     def set_depth_control_type(self, name: str):
         self.depth_control_type = name
@@ -20,78 +36,139 @@ class DepthControlManager(QObject):
             self.request_current_min_max_values.emit()
         self.update_widgets.emit()
 
-    def load_depth_control_data(self, frames: np.ndarray, frame_metadata: dict):
-        self.reset()
-        for frame_no in range(len(frames)):
-            max_frame_value = frame_metadata[frame_no]["Max pixel value"]
-            min_frame_value = frame_metadata[frame_no]["Min pixel value"]
-            min_outlier_frame_value, max_outlier_frame_value = self._calculate_outlier_bounds(frames[frame_no], min=min_frame_value, max=max_frame_value)
-            # TODO: complete function for the Histogram min max values (requires histogram to use)
-            min_histogram_frame_value, max_histogram_frame_value = self._calculate_histogram_bounds(frames[frame_no])
-
-            # Storing the values in a nested dictionary structure
-            self.frame_depth_metadata_dict[frame_no] = {
-                "Frame": {
-                    "Min": min_frame_value,
-                    "Max": max_frame_value
-                },
-                "Outlier": {
-                    "Min": min_outlier_frame_value,
-                    "Max": max_outlier_frame_value
-                },
-                "Histogram": {
-                    "Min": min_histogram_frame_value,
-                    "Max": max_histogram_frame_value
-                }
-            }
+    def load_depth_control_data(self, frames: FrameSource | np.ndarray, frame_metadata: dict,
+                                frame_statistics: FrameStatistics | None = None):
+        # Depth values are derived from the pixel statistics of each frame, which are calculated the first time that
+        # frame is requested. Sharing the statistics of the MediaStorage means frames it has already measured are not
+        # measured again, and frames it modifies are measured again
+        # The frame processor and render buffer threads keep reading the statistics while new frames are loaded, so
+        # the new statistics are built first and swapped in with one assignment rather than after a reset to None
+        if frame_statistics is None:
+            frame_statistics = FrameStatistics(frames)
+        self.frames = frames
+        self.frame_metadata = frame_metadata
+        self.frame_statistics = frame_statistics
 
     def get_min_max_depths_per_frame(self, frame_no: int) -> Tuple[float, float]:
+        # Only the bounds of the selected type are calculated, histograms are not built unless they are used. The
+        # statistics are read once, so a swap to the statistics of new frames part way through is not seen
+        frame_statistics = self.frame_statistics
         if self.depth_control_type == DEPTH_CONTROL_OPTIONS[0]:
             # Frames min max
-            return self.frame_depth_metadata_dict[frame_no]["Frame"]["Min"], self.frame_depth_metadata_dict[frame_no]["Frame"]["Max"]
+            statistics = frame_statistics.get_frame_statistics(frame_no)
+            return statistics["Min"], statistics["Max"]
         elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[1]:
             # Histogram min max
-            return self.frame_depth_metadata_dict[frame_no]["Histogram"]["Min"], self.frame_depth_metadata_dict[frame_no]["Histogram"]["Max"]
+            return self._calculate_histogram_bounds(frame_statistics, frame_no)
         elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[2]:
             # Outliers min max
-            return self.frame_depth_metadata_dict[frame_no]["Outlier"]["Min"], self.frame_depth_metadata_dict[frame_no]["Outlier"]["Max"]
+            return self._calculate_outlier_bounds(frame_statistics.get_frame_statistics(frame_no))
         elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[3]:
             # Manual min max
             return self.manual_min, self.manual_max 
+        elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[4]:
+            # Whole movie min max, the same for every frame so colours do not flicker during playback
+            return self._get_movie_bounds(frame_statistics)
+        elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[5]:
+            # Min max over the rolling window of frames centred on this frame
+            minima, maxima = self._get_window_bounds(frame_statistics)
+            return minima[frame_no], maxima[frame_no]
+        elif self.depth_control_type == DEPTH_CONTROL_OPTIONS[6]:
+            # Histogram min max of the whole movie, the same for every frame and robust to outlying pixels
+            return self._get_movie_histogram_bounds(frame_statistics)
         else:
             raise ValueError(f"Unknown depth control type: {self.depth_control_type}")
 
+    def bounds_depend_on_other_frames(self) -> bool:
+        """Return True if the depth bounds of a frame depend on the pixels of other frames, as in the whole movie and
+        rolling window types."""
+        return self.depth_control_type in (DEPTH_CONTROL_OPTIONS[4], DEPTH_CONTROL_OPTIONS[5], DEPTH_CONTROL_OPTIONS[6])
+
     def set_min_max_manual_values(self, min_value: float, max_value: float):
         self.manual_min = min_value
         self.manual_max = max_value
         self.update_widgets.emit()
 
 
-    def _calculate_outlier_bounds(self, frame: np.ndarray, min, max) -> Tuple[float, float]:
+    def set_rolling_window_size(self, window_size: int):
+        self.window_size = max(1, int(window_size))
+        self.window_bounds = None
+        if self.depth_control_type == DEPTH_CONTROL_OPTIONS[5]:
+            self.update_widgets.emit()
+
+    def _get_movie_bounds(self, frame_statistics: FrameStatistics) -> Tuple[float, float]:
+        # Cached bounds are keyed by the statistics they were built from as well as their version, as the statistics
+        # of newly loaded frames start again from version 0
+        key = (frame_statistics, frame_statistics.version)
+        movie_bounds = self.movie_bounds
+        if movie_bounds is None or movie_bounds[0] != key:
+            minima, maxima = self._get_frame_extrema(frame_statistics)
+            movie_bounds = (key, (minima.min(), maxima.max()))
+            self.movie_bounds = movie_bounds
+        return movie_bounds[1]
+
+    def _get_window_bounds(self, frame_statistics: FrameStatistics) -> Tuple[np.ndarray, np.ndarray]:
+        # The min and max over the window around every frame are found together in O(1) per frame, independent of
+        # the window size, so each lookup during playback is a single index
+        key = (frame_statistics, frame_statistics.version)
+        window_bounds = self.window_bounds
+        if window_bounds is None or window_bounds[0] != key:
+            minima, maxima = self._get_frame_extrema(frame_statistics)
+            window_size = min(self.window_size, len(minima))
+            window_bounds = (key, (minimum_filter1d(minima, window_size, mode="nearest"),
+                                   maximum_filter1d(maxima, window_size, mode="nearest")))
+            self.window_bounds = window_bounds
+        return window_bounds[1]
+
+    def _get_movie_histogram_bounds(self, frame_statistics: FrameStatistics) -> Tuple[float, float]:
+        # The per frame histograms are merged, so the frames are only read once, to build their histograms, and
+        # modifying some frames only reads those frames again
+        key = (frame_statistics, frame_statistics.version)
+        movie_histogram_bounds = self.movie_histogram_bounds
+        if movie_histogram_bounds is None or movie_histogram_bounds[0] != key:
+            movie_histogram_bounds = (key, self._calculate_histogram_bounds(frame_statistics,
+                                                                            np.arange(len(frame_statistics))))
+            self.movie_histogram_bounds = movie_histogram_bounds
+        return movie_histogram_bounds[1]
+
+    def _get_frame_extrema(self, frame_statistics: FrameStatistics) -> Tuple[np.ndarray, np.ndarray]:
+        # Frames without finite pixels are ignored rather than making every bound they touch NaN
+        frame_statistics.ensure()
+        minima = np.nan_to_num(frame_statistics.minimum, nan=np.inf)
+        maxima = np.nan_to_num(frame_statistics.maximum, nan=-np.inf)
+        return minima, maxima
+
+    def _calculate_outlier_bounds(self, frame_statistics: dict) -> Tuple[float, float]:
 
-        if np.isnan(frame).any():
+        if frame_statistics["NaN count"]:
             print("Warning: NaN values detected in the frame.")
-        if np.isinf(frame).any():
+        if frame_statistics["Inf count"]:
             print("Warning: Infinite values detected in the frame.")
 
-        mean = np.mean(frame)
-        std_dev = np.std(frame)
+        mean = frame_statistics["Mean"]
+        std_dev = frame_statistics["Std"]
         lower_bound = mean - 2 * std_dev
         upper_bound = mean + 2 * std_dev
 
         # Verify bound limits
-        if lower_bound < min:
-            lower_bound = min
+        if lower_bound < frame_statistics["Min"]:
+            lower_bound = frame_statistics["Min"]
 
-        if upper_bound > max:
-            upper_bound = max
+        if upper_bound > frame_statistics["Max"]:
+            upper_bound = frame_statistics["Max"]
 
         return lower_bound, upper_bound
     
-    # TODO: complete function for the Histogram min max values (requires histogram to use)
-    def _calculate_histogram_bounds(self, frame: np.ndarray) -> Tuple[float, float]:
-        return 0.0, 0.0
+    def _calculate_histogram_bounds(self, frame_statistics: FrameStatistics, frame_nos) -> Tuple[float, float]:
+        # Percentile bounds from the cached histogram of a frame, or from the merged histograms of several frames
+        return frame_statistics.get_histogram_bounds(frame_nos, HISTOGRAM_LOWER_PERCENTILE,
+                                                          HISTOGRAM_UPPER_PERCENTILE)
     
     def reset(self):
-        self.frame_depth_metadata_dict = {}
+        self.frames = None
+        self.frame_metadata = None
+        self.frame_statistics = None
+        self.movie_bounds = None
+        self.window_bounds = None
+        self.movie_histogram_bounds = None
 
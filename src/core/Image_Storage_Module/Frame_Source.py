@@ -0,0 +1,134 @@
+from typing import Protocol, runtime_checkable
+import numpy as np
+
+
+@runtime_checkable
+class FrameSource(Protocol):
+    """
+    A stack of frames (N x H x W) that can be decoded on demand.
+
+    File readers may return any object implementing this protocol instead of an np.ndarray, so that frames are only
+    read from disk when they are indexed. np.ndarray itself satisfies the protocol.
+
+    `__getitem__` must accept a single frame number (returning an H x W array) or a slice (returning an n x H x W
+    array). `np.asarray(source)` must materialise the whole stack.
+    """
+    shape: tuple
+    dtype: np.dtype
+
+    def __len__(self) -> int:
+        ...
+
+    def __getitem__(self, index) -> np.ndarray:
+        ...
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        ...
+
+
+def is_lazy_frame_source(frames) -> bool:
+    """Return True if frames is a FrameSource that is not already held in memory as an np.ndarray."""
+    return isinstance(frames, FrameSource) and not isinstance(frames, np.ndarray)
+
+
+class CopyOnWriteFrames:
+    """
+    Copy-on-write view of a frame stack that may be shared between several MediaStorage instances.
+
+    Reads fall through to the shared base stack, which is never modified. Writing to a frame materialises a private
+    copy of only that frame, so copies made with copy() are O(1) until a frame is actually changed.
+
+    Parameters
+    ----------
+    base : FrameSource or np.ndarray
+        The shared, read only frame stack.
+    """
+
+    def __init__(self, base: FrameSource | np.ndarray):
+        self.base = base
+        self.shape = tuple(base.shape)
+        self.dtype = np.dtype(base.dtype)
+        # Frames that differ from the base stack, and the subset of those this instance may modify in place
+        self._overrides = {}
+        self._owned_frames = set()
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            frame_no = self._normalise_frame_no(index)
+            frame = self._overrides.get(frame_no)
+            if frame is None:
+                frame = self.base[frame_no]
+            # Shared frames are handed out read only, changes must go through writable_frame()
+            frame = frame.view()
+            frame.flags.writeable = False
+            return frame
+        frame_numbers = range(*index.indices(len(self))) if isinstance(index, slice) else np.arange(len(self))[index]
+        frames = np.empty((len(frame_numbers), *self.shape[1:]), dtype=self.dtype)
+        for i, frame_no in enumerate(frame_numbers):
+            frames[i] = self[int(frame_no)]
+        return frames
+
+    def __setitem__(self, index, value):
+        if isinstance(index, (int, np.integer)):
+            self.writable_frame(index)[...] = value
+            return
+        frame_numbers = range(*index.indices(len(self))) if isinstance(index, slice) else np.arange(len(self))[index]
+        value = np.asarray(value)
+        for i, frame_no in enumerate(frame_numbers):
+            self.writable_frame(int(frame_no))[...] = value[i] if value.ndim == len(self.shape) else value
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        frames = np.array(self.base, dtype=self.dtype)
+        for frame_no, frame in self._overrides.items():
+            frames[frame_no] = frame
+        return frames if dtype is None else frames.astype(dtype, copy=False)
+
+    def writable_frame(self, frame_no: int) -> np.ndarray:
+        """Return a frame that may be modified in place, copying it out of the shared stack on first use."""
+        frame_no = self._normalise_frame_no(frame_no)
+        if frame_no not in self._owned_frames:
+            self._overrides[frame_no] = np.array(self[frame_no], dtype=self.dtype)
+            self._owned_frames.add(frame_no)
+        return self._overrides[frame_no]
+
+    def replace_frames(self, start: int, frames: np.ndarray):
+        """
+        Replace frames start to start + len(frames) with new values.
+
+        Unlike writable_frame(), shared frames are not copied out of the base stack first, since they are entirely
+        overwritten. Frames this instance already owns are overwritten in place.
+        """
+        for i, frame in enumerate(frames):
+            frame_no = self._normalise_frame_no(start + i)
+            if frame_no in self._owned_frames:
+                self._overrides[frame_no][...] = frame
+            else:
+                self._overrides[frame_no] = np.array(frame, dtype=self.dtype)
+                self._owned_frames.add(frame_no)
+
+    def modified_frames(self) -> set:
+        """Frame numbers that differ from the shared base stack."""
+        return set(self._overrides)
+
+    def shares_data_with(self, other) -> bool:
+        """Return True if other is guaranteed to hold the same frames without comparing any pixel data."""
+        if not isinstance(other, CopyOnWriteFrames) or self.base is not other.base:
+            return False
+        if self._overrides.keys() != other._overrides.keys():
+            return False
+        return all(self._overrides[frame_no] is other._overrides[frame_no] for frame_no in self._overrides)
+
+    def copy(self) -> "CopyOnWriteFrames":
+        """Create an O(1) copy. Modified frames become shared, so both instances copy them again before writing."""
+        new_instance = CopyOnWriteFrames(self.base)
+        new_instance._overrides = dict(self._overrides)
+        self._owned_frames = set()
+        return new_instance
+
+    def _normalise_frame_no(self, frame_no: int) -> int:
+        if not -len(self) <= frame_no < len(self):
+            raise IndexError(f"Frame {frame_no} is out of range for {len(self)} frames.")
+        return int(frame_no) % len(self)
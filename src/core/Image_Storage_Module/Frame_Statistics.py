@@ -0,0 +1,274 @@
+import threading
+import numpy as np
+from .Frame_Source import FrameSource
+
+# Percentiles of the finite pixel values cached for every frame
+STATISTICS_PERCENTILES = (1.0, 50.0, 99.0)
+# Percentiles are taken from an evenly strided sample of at most this many pixels of each frame
+STATISTICS_PERCENTILE_SAMPLES = 4096
+# Fixed bins of the per frame histograms, spanning the finite range of each frame
+HISTOGRAM_BINS = 512
+# Frames whose histograms are merged together, bounding the temporary memory used
+HISTOGRAM_MERGE_BATCH_FRAMES = 256
+# Frames whose statistics are calculated together in one vectorised pass, bounding the temporary memory used
+STATISTICS_BATCH_FRAMES = 32
+
+
+class FrameStatistics:
+    """
+    Per frame pixel statistics of a frame stack, calculated on demand and cached until the frames change.
+
+    The min, max, mean, variance, percentiles and NaN/inf counts of a frame are all calculated together the first
+    time any of them is requested, vectorised over batches of frames. Percentiles are estimated from a sample of
+    STATISTICS_PERCENTILE_SAMPLES pixels.
+
+    Histograms of HISTOGRAM_BINS fixed bins are calculated in the same pass, but only for frames whose histogram has
+    been requested. They are mergeable: the histograms of any set of frames combine into one for the set, so bounds
+    over a whole movie or a window of frames come from the cached histograms without reading the frames again. Frames that are modified must be invalidated
+    with invalidate(), every other frame keeps its cached statistics.
+
+    Statistics other than the NaN and inf counts are of the finite pixel values only. A frame with no finite values
+    has NaN statistics.
+
+    The statistics are shared by the GUI, frame processor and render buffer threads. Each batch of frames is read,
+    calculated and stored under a lock that invalidate() also takes, so statistics calculated from frames that were
+    invalidated meanwhile are never stored as valid.
+
+    Parameters
+    ----------
+    frames : FrameSource or np.ndarray
+        The frame stack (N x H x W). Must be replaced through the frames attribute if the stack object changes.
+    """
+
+    def __init__(self, frames: FrameSource | np.ndarray):
+        self.frames = frames
+        frames_amount = len(frames)
+        self.valid = np.zeros(frames_amount, dtype=bool)
+        self.minimum = np.full(frames_amount, np.nan)
+        self.maximum = np.full(frames_amount, np.nan)
+        self.mean = np.full(frames_amount, np.nan)
+        self.variance = np.full(frames_amount, np.nan)
+        self.nan_count = np.zeros(frames_amount, dtype=np.int64)
+        self.inf_count = np.zeros(frames_amount, dtype=np.int64)
+        self.percentiles = np.full((frames_amount, len(STATISTICS_PERCENTILES)), np.nan)
+        # Only allocated once a histogram is requested
+        self.histograms = None
+        self.histogram_valid = np.zeros(frames_amount, dtype=bool)
+        # Incremented whenever frames are invalidated, so anything derived from the statistics of many frames can
+        # tell in O(1) whether it is out of date
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def invalidate(self, frame_nos=None):
+        """Discard the statistics of the given frame numbers, or of every frame if None."""
+        if frame_nos is None:
+            frame_nos = slice(None)
+        else:
+            frame_nos = np.asarray(list(frame_nos) if isinstance(frame_nos, range) else frame_nos, dtype=np.intp)
+        with self.lock:
+            self.valid[frame_nos] = False
+            self.histogram_valid[frame_nos] = False
+            self.version += 1
+
+    def ensure(self, frame_nos=None, histograms: bool = False):
+        """
+        Calculate the statistics of the given frame numbers, or of every frame if None, unless they are cached.
+
+        With histograms True the histograms of the frames are also calculated, in the same pass over each frame.
+        """
+        if frame_nos is None:
+            frame_nos = np.arange(len(self))
+        frame_nos = np.atleast_1d(np.asarray(frame_nos, dtype=np.intp))
+        missing = frame_nos[self._missing(frame_nos, histograms)]
+        for start in range(0, len(missing), STATISTICS_BATCH_FRAMES):
+            batch = missing[start:start + STATISTICS_BATCH_FRAMES]
+            # The lock is held per batch, so invalidate() waits for at most one batch. Frames another thread
+            # calculated meanwhile are skipped
+            with self.lock:
+                if histograms and self.histograms is None:
+                    self.histograms = np.zeros((len(self), HISTOGRAM_BINS), dtype=np.uint32)
+                batch = batch[self._missing(batch, histograms)]
+                if len(batch):
+                    self._calculate(batch, histograms)
+
+    def _missing(self, frame_nos: np.ndarray, histograms: bool) -> np.ndarray:
+        missing = ~self.valid[frame_nos]
+        if histograms:
+            missing |= ~self.histogram_valid[frame_nos]
+        return missing
+
+    def get_histogram_bounds(self, frame_nos, lower_percentile: float, upper_percentile: float) -> tuple[float, float]:
+        """
+        Return the values at two percentiles of the finite pixels of one frame, or of several frames together.
+
+        The percentiles are interpolated within the bins of the frame histograms, merged if there are several frames
+        (see merge_histograms). Frames are only read if their histogram is not cached yet.
+        """
+        frame_nos = np.atleast_1d(np.asarray(frame_nos, dtype=np.intp))
+        self.ensure(frame_nos, histograms=True)
+        if len(frame_nos) == 1:
+            frame_no = frame_nos[0]
+            counts, lower_edge, upper_edge = self.histograms[frame_no], self.minimum[frame_no], self.maximum[frame_no]
+        else:
+            counts, lower_edge, upper_edge = self.merge_histograms(frame_nos)
+        if not np.isfinite(lower_edge) or counts.sum() == 0:
+            return np.nan, np.nan
+        edges = np.linspace(lower_edge, upper_edge, len(counts) + 1)
+        cumulative = np.r_[0, np.cumsum(counts, dtype=np.float64)]
+        targets = np.array([lower_percentile, upper_percentile]) / 100 * cumulative[-1]
+        lower_bound, upper_bound = np.interp(targets, cumulative, edges)
+        return lower_bound, upper_bound
+
+    def merge_histograms(self, frame_nos) -> tuple[np.ndarray, float, float]:
+        """
+        Merge the cached histograms of several frames into one histogram of HISTOGRAM_BINS bins.
+
+        Each frame histogram spans that frame's own range. They are resampled onto bins spanning the range of all the
+        frames by interpolating their cumulative counts, which treats the pixels in a bin as evenly spread across it.
+        Frames must have their histograms calculated first, see ensure().
+
+        Returns
+        -------
+        tuple[np.ndarray, float, float]
+            The merged (fractional) counts, and the lower and upper edges of the first and last bins. The edges are
+            NaN if no frame has finite pixels.
+        """
+        frame_nos = np.atleast_1d(np.asarray(frame_nos, dtype=np.intp))
+        frame_nos = frame_nos[np.isfinite(self.minimum[frame_nos])]
+        if len(frame_nos) == 0:
+            return np.zeros(HISTOGRAM_BINS), np.nan, np.nan
+        lower_edge, upper_edge = self.minimum[frame_nos].min(), self.maximum[frame_nos].max()
+        edges = np.linspace(lower_edge, upper_edge, HISTOGRAM_BINS + 1)
+
+        merged_cumulative = np.zeros(HISTOGRAM_BINS + 1)
+        for start in range(0, len(frame_nos), HISTOGRAM_MERGE_BATCH_FRAMES):
+            batch = frame_nos[start:start + HISTOGRAM_MERGE_BATCH_FRAMES]
+            counts = self.histograms[batch]
+            cumulative = np.zeros((len(batch), HISTOGRAM_BINS + 1))
+            np.cumsum(counts, axis=1, out=cumulative[:, 1:])
+
+            # Position of the merged bin edges within the bins of each frame. A frame of a single value has all its
+            # pixels at its minimum
+            minimum = self.minimum[batch][:, None]
+            width = (self.maximum[batch] - self.minimum[batch])[:, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                positions = np.where(width > 0, (edges - minimum) / width * HISTOGRAM_BINS,
+                                     np.where(edges >= minimum, HISTOGRAM_BINS, 0))
+            positions = np.clip(positions, 0, HISTOGRAM_BINS)
+            bins = np.minimum(positions.astype(np.intp), HISTOGRAM_BINS - 1)
+            rows = np.arange(len(batch))[:, None]
+            below = cumulative[rows, bins]
+            merged_cumulative += (below + (positions - bins) * (cumulative[rows, bins + 1] - below)).sum(axis=0)
+        # Frames of a single value at the lower edge are counted at the first edge, they belong in the first bin
+        counts = np.diff(merged_cumulative)
+        counts[0] += merged_cumulative[0]
+        return counts, lower_edge, upper_edge
+
+    def get_frame_statistics(self, frame_no: int) -> dict:
+        """Return the statistics of one frame, calculating them if they are not cached."""
+        self.ensure(frame_no)
+        return {
+            "Min": self.minimum[frame_no],
+            "Max": self.maximum[frame_no],
+            "Mean": self.mean[frame_no],
+            "Std": np.sqrt(self.variance[frame_no]),
+            "NaN count": int(self.nan_count[frame_no]),
+            "Inf count": int(self.inf_count[frame_no]),
+            "Percentiles": dict(zip(STATISTICS_PERCENTILES, self.percentiles[frame_no])),
+        }
+
+    def copy(self, frames: FrameSource | np.ndarray | None = None) -> "FrameStatistics":
+        """Return a copy with the same cached statistics, reading any further frames from frames if given."""
+        new_instance = FrameStatistics.__new__(FrameStatistics)
+        new_instance.frames = self.frames if frames is None else frames
+        with self.lock:
+            for name in ("valid", "minimum", "maximum", "mean", "variance", "nan_count", "inf_count", "percentiles",
+                         "histogram_valid"):
+                setattr(new_instance, name, getattr(self, name).copy())
+            new_instance.histograms = None if self.histograms is None else self.histograms.copy()
+            new_instance.version = self.version
+        new_instance.lock = threading.Lock()
+        return new_instance
+
+    def _calculate(self, frame_nos: np.ndarray, histograms: bool = False):
+        if len(frame_nos) == 1:
+            block = np.asarray(self.frames[int(frame_nos[0])], dtype=np.float32)[None]
+        elif np.all(np.diff(frame_nos) == 1):
+            # Consecutive frames are read as one slice, a view rather than a copy of frames held in memory
+            block = np.asarray(self.frames[int(frame_nos[0]):int(frame_nos[-1]) + 1], dtype=np.float32)
+        else:
+            block = np.stack([np.asarray(self.frames[int(frame_no)], dtype=np.float32) for frame_no in frame_nos])
+        values = block.reshape(len(frame_nos), -1)
+
+        # NaN and inf propagate into the min and max, so finite extrema show the whole frame is finite without a
+        # separate pass. These frames, nearly always all of them, are handled for the whole batch at once
+        minimum, maximum = values.min(axis=1), values.max(axis=1)
+        all_finite = np.isfinite(minimum) & np.isfinite(maximum)
+        if all_finite.any():
+            rows = values if all_finite.all() else values[all_finite]
+            self._store(frame_nos[all_finite], minimum[all_finite], maximum[all_finite], *_moments_and_percentiles(rows))
+            self.nan_count[frame_nos[all_finite]] = 0
+            self.inf_count[frame_nos[all_finite]] = 0
+            if histograms:
+                self.histograms[frame_nos[all_finite]] = _histograms(rows, minimum[all_finite], maximum[all_finite])
+
+        for row in np.flatnonzero(~all_finite):
+            frame_no = frame_nos[row]
+            finite = np.isfinite(values[row])
+            nan_count = int(np.isnan(values[row]).sum())
+            self.nan_count[frame_no] = nan_count
+            self.inf_count[frame_no] = int(values.shape[1] - finite.sum() - nan_count)
+            finite_values = values[row][finite][None]
+            if finite_values.size == 0:
+                self._store(frame_no, np.nan, np.nan, np.nan, np.nan, np.nan)
+                if histograms:
+                    self.histograms[frame_no] = 0
+            else:
+                mean, variance, percentiles = _moments_and_percentiles(finite_values)
+                finite_minimum, finite_maximum = finite_values.min(axis=1), finite_values.max(axis=1)
+                self._store(frame_no, finite_minimum[0], finite_maximum[0], mean[0], variance[0], percentiles[0])
+                if histograms:
+                    self.histograms[frame_no] = _histograms(finite_values, finite_minimum, finite_maximum)[0]
+        self.valid[frame_nos] = True
+        if histograms:
+            self.histogram_valid[frame_nos] = True
+
+    def _store(self, frame_nos, minimum, maximum, mean, variance, percentiles):
+        self.minimum[frame_nos] = minimum
+        self.maximum[frame_nos] = maximum
+        self.mean[frame_nos] = mean
+        self.variance[frame_nos] = variance
+        self.percentiles[frame_nos] = percentiles
+
+
+def _moments_and_percentiles(values: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mean, variance and STATISTICS_PERCENTILES of each row of finite values (n x P).
+
+    The sums are taken around a value of each row, avoiding cancellation in the variance of frames with a large
+    offset. Percentiles are of an evenly strided sample of at most STATISTICS_PERCENTILE_SAMPLES values per row, which
+    is exact for smaller frames and avoids partially sorting every pixel of larger ones.
+    """
+    length = values.shape[1]
+    offset = values[:, :1]
+    deviations = values - offset
+    mean_deviation = deviations.sum(axis=1) / length
+    variance = np.square(deviations, out=deviations).sum(axis=1) / length - mean_deviation ** 2
+
+    sample = values[:, ::max(1, -(-length // STATISTICS_PERCENTILE_SAMPLES))]
+    percentiles = np.percentile(sample, STATISTICS_PERCENTILES, axis=1).T
+    return offset[:, 0] + mean_deviation, np.maximum(variance, 0), percentiles
+
+
+def _histograms(values: np.ndarray, minimum: np.ndarray, maximum: np.ndarray) -> np.ndarray:
+    """Histograms of HISTOGRAM_BINS bins spanning minimum to maximum of each row of finite values (n x P)."""
+    width = (maximum - minimum).astype(np.float64)
+    scale = np.divide(HISTOGRAM_BINS, width, out=np.zeros_like(width), where=width > 0).astype(np.float32)
+    bins = (values - minimum[:, None]) * scale[:, None]
+    bins = np.minimum(bins, HISTOGRAM_BINS - 1, out=bins).astype(np.intp)
+    # Offset the bins of each row so a single bincount histograms every row
+    bins += np.arange(len(values))[:, None] * HISTOGRAM_BINS
+    return np.bincount(bins.ravel(), minlength=len(values) * HISTOGRAM_BINS).reshape(len(values), HISTOGRAM_BINS)
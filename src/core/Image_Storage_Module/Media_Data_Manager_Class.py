@@ -1,6 +1,8 @@
 import numpy as np
 from PyQt6.QtCore import QObject, pyqtSignal
 from .Media_Storage_Class import MediaStorage
+from .Frame_Source import FrameSource
+from .Frame_Statistics import FrameStatistics
 
 DEFAULT_VIEW_MODES = ['Target', 'Preview']
 
@@ -9,6 +11,7 @@ class MediaDataManager(QObject):
     
     new_file_loaded = pyqtSignal()
     current_mode_changed = pyqtSignal(str)
+    frames_changed = pyqtSignal(int, int)  # First and last + 1 frame numbers that were rewritten
     
     def __new__(cls):
         if cls._instance is None:
@@ -37,7 +40,7 @@ class MediaDataManager(QObject):
     def get_mode_list(self) -> list:
         return self.storage.keys()
 
-    def load_new_file_data(self, file_path: str, file_ext: str, frames: np.ndarray | list | tuple, 
+    def load_new_file_data(self, file_path: str, file_ext: str, frames: FrameSource | np.ndarray | list | tuple, 
                            file_metadata: list, channels: list):
         self.storage[self.current_mode].load_new_file_data(file_path, file_ext, frames, file_metadata, channels)
 
@@ -68,7 +71,7 @@ class MediaDataManager(QObject):
 
     def copy_storage(self, from_type: str, to_type: str):
         """
-        Copy one storage instance to another.
+        Copy one storage instance to another. The copy is copy-on-write, so no frame data is duplicated here.
         """
         if from_type not in self.storage:
             raise ValueError(f"Invalid 'from' storage type: {from_type}")
@@ -84,11 +87,13 @@ class MediaDataManager(QObject):
 
     def switch_to_preview(self):
         if self.current_mode != "Preview":
-            self.storage["Preview"] = self.copy_storage(from_type=self.current_mode, to_type="Preview")
+            self.copy_storage(from_type=self.current_mode, to_type="Preview")
             self.set_mode("Preview")
 
     def accept_changes(self):
-        self.copy_storage(from_type="Preview", to_type="Target")
+        # The preview becomes the target, and the new preview is a copy-on-write copy of it
+        self.storage["Target"] = self.storage["Preview"]
+        self.copy_storage(from_type="Target", to_type="Preview")
         self.set_mode("Target")
 
 
@@ -101,6 +106,24 @@ class MediaDataManager(QObject):
         self.switch_to_preview()
         self.storage[self.current_mode].set_image_data(media)
 
+    def get_writable_frame(self, frame_no: int) -> np.ndarray:
+        """
+        Switch to the "Preview" view mode and return one of its frames that can be modified in place.
+
+        Only the requested frame is copied out of the data shared with the "Target" storage.
+        """
+        self.switch_to_preview()
+        return self.storage[self.current_mode].get_writable_frame(frame_no)
+    
+    def write_frames(self, start: int, frames: np.ndarray):
+        """
+        Switch to the "Preview" view mode and overwrite its frames from start onwards in place with frames.
+
+        Frames shared with the "Target" storage are replaced without being copied first.
+        """
+        self.switch_to_preview()
+        self.storage[self.current_mode].write_frames(start, frames)
+        self.frames_changed.emit(start, start + len(frames))
     
     # Getter functions, direct from dict depending on view mode
     def get_file_path(self) -> str:
@@ -138,13 +161,16 @@ class MediaDataManager(QObject):
         return self.storage[self.current_mode].file_metadata
     
     def get_frames_metadata_per_frame(self, frame_no: int) -> dict:
-        return self.storage[self.current_mode].image_metadata[frame_no]
+        return self.storage[self.current_mode].get_frames_metadata_per_frame(frame_no)
     
     def get_frames_metadata(self) -> dict:
-        return self.storage[self.current_mode].image_metadata
+        return self.storage[self.current_mode].get_frames_metadata()
     
-    def get_frames(self) -> np.ndarray:
-        return self.storage[self.current_mode].image_data
+    def get_frames(self) -> FrameSource | np.ndarray:
+        return self.storage[self.current_mode].get_frames()
+
+    def get_frame_statistics(self) -> FrameStatistics:
+        return self.storage[self.current_mode].get_frame_statistics()
     
 
 
@@ -1,9 +1,10 @@
 import numpy as np
 import math
-import copy
 from PyQt6.QtWidgets import QMessageBox
 from collections import Counter
 from utils.constants import FILE_METADATA_DICT_KEYS, IMAGE_METADATA_DICT_KEYS, STANDARDISED_METADATA_DICT_KEYS
+from .Frame_Source import FrameSource, CopyOnWriteFrames
+from .Frame_Statistics import FrameStatistics
 
 
 class MediaStorage():
@@ -14,20 +15,31 @@ class MediaStorage():
         self.image_data = None
         self.image_metadata = None
         self.contained_in_folder = False
-
-    def load_new_file_data(self, file_path: str, file_ext: str, frames: np.ndarray | list | tuple, 
+        # Pixel statistics of each frame, shared by everything that needs them (extrema, depth control, colourbar)
+        self.statistics = None
+        # Copy-on-write bookkeeping. image_metadata may be shared with copies of this instance, in which case the
+        # outer dict and each per frame dict are copied before they are first modified
+        self._owns_metadata_dict = True
+        self._owned_frame_metadata = None  # None means every per frame dict is owned
+
+    def load_new_file_data(self, file_path: str, file_ext: str, frames: FrameSource | np.ndarray | list | tuple, 
                            file_metadata: list, channels: list):
-        """Load new file data into the manager, resetting previous data."""
+        """
+        Load new file data into the manager, resetting previous data.
+
+        Frames may be a lazy FrameSource, in which case no pixel data is read here. Frames are only decoded when
+        they are requested through get_frames() or the per frame metadata getters.
+        """
 
         # Convert frames to np.array if not already
         if isinstance(frames, (list, tuple)):
             frames = np.array(frames, dtype=np.float32)
         
-        if frames.ndim not in [2, 3]:
+        if len(frames.shape) not in [2, 3]:
             raise ValueError("Frames must be a 2D or 3D array.")
         
         # Add a new axis to handle images as if they are frames
-        if frames.ndim == 2:
+        if len(frames.shape) == 2:
             frames = np.expand_dims(frames, axis=0)
 
         if len(file_metadata) != len(STANDARDISED_METADATA_DICT_KEYS):
@@ -52,15 +64,15 @@ class MediaStorage():
         ]    
 
         frame_metadata_dictionary = {}
-        # Store frames metadata
+        # Store frames metadata. Max and min pixel values are only calculated when a frame is first requested
         for frame_no in range(file_metadata["Frames"]):
-            nm_value, pix_length = self._calculate_scale_bar(frame=frames[frame_no], pix_to_nm_scaling_factor=file_metadata["Pixel/nm Scaling Factor"][frame_no])
+            nm_value, pix_length = self._calculate_scale_bar(x_dim=frames.shape[2], pix_to_nm_scaling_factor=file_metadata["Pixel/nm Scaling Factor"][frame_no])
 
             frame_metadata_values = [
                 file_metadata["X Range (nm)"][frame_no],
                 file_metadata["Pixel/nm Scaling Factor"][frame_no],
-                np.max(frames[frame_no]),
-                np.min(frames[frame_no]),
+                None,
+                None,
                 file_metadata["Timestamp"][frame_no] if file_metadata["Frames"] != 1 else 0,
                 nm_value,
                 pix_length
@@ -73,7 +85,10 @@ class MediaStorage():
         self.file_metadata = dict(zip(FILE_METADATA_DICT_KEYS, file_metadata_values))
         self.image_data = frames
         self.image_metadata = frame_metadata_dictionary
+        self.statistics = FrameStatistics(frames)
         self.contained_in_folder = False
+        self._owns_metadata_dict = True
+        self._owned_frame_metadata = None
 
         self.output_file_data()
 
@@ -149,13 +164,13 @@ class MediaStorage():
         frame_metadata_dictionary = {}
         # Store frames metadata
         for frame_no in range(len(frames)):
-            nm_value, pix_length = self._calculate_scale_bar(frame=frames[frame_no], pix_to_nm_scaling_factor=folder_metadata[frame_no]["Pixel/nm Scaling Factor"])
+            nm_value, pix_length = self._calculate_scale_bar(x_dim=frames.shape[2], pix_to_nm_scaling_factor=folder_metadata[frame_no]["Pixel/nm Scaling Factor"])
 
             frame_metadata_values = [
                 folder_metadata[frame_no]["X Range (nm)"],
                 folder_metadata[frame_no]["Pixel/nm Scaling Factor"],
-                np.max(frames[frame_no]),
-                np.min(frames[frame_no]),
+                None,
+                None,
                 folder_metadata[frame_no]["Timestamp"],
                 nm_value,
                 pix_length
@@ -168,18 +183,81 @@ class MediaStorage():
         self.file_metadata = dict(zip(FILE_METADATA_DICT_KEYS, file_metadata_values))
         self.image_data = frames
         self.image_metadata = frame_metadata_dictionary
+        self.statistics = FrameStatistics(frames)
         self.contained_in_folder = True
+        self._owns_metadata_dict = True
+        self._owned_frame_metadata = None
         
         self.output_file_data()
 
     def set_image_data(self, image_data: np.ndarray):
         self.image_data = image_data
-        self._calculate_new_image_metadata(self, image_data)
+        self.statistics = FrameStatistics(image_data)
+        self._calculate_new_image_metadata(image_data)
 
     def _calculate_new_image_metadata(self, frames: np.ndarray):
+        # Invalidate the cached max and min values, they are recalculated when each frame is next requested
         for frame_no in range(len(frames)):
-            self.image_metadata[frame_no]["Max pixel value"] = np.max(frames[frame_no])
-            self.image_metadata[frame_no]["Min pixel value"] = np.min(frames[frame_no])
+            frame_metadata = self._own_frame_metadata(frame_no)
+            frame_metadata["Max pixel value"] = None
+            frame_metadata["Min pixel value"] = None
+
+    def get_writable_frame(self, frame_no: int) -> np.ndarray:
+        """
+        Return a frame that can be modified in place.
+
+        Only this frame and its metadata are copied out of any data shared with other MediaStorage instances.
+        """
+        self._make_copy_on_write()
+        frame_metadata = self._own_frame_metadata(frame_no)
+        frame_metadata["Max pixel value"] = None
+        frame_metadata["Min pixel value"] = None
+        self.statistics.invalidate([frame_no])
+        return self.image_data.writable_frame(frame_no)
+
+    def write_frames(self, start: int, frames: np.ndarray):
+        """
+        Overwrite frames start to start + len(frames) in place with processed frames of the same shape.
+
+        Frames shared with other MediaStorage instances are replaced rather than copied and then overwritten.
+        """
+        if frames.shape[1:] != self.image_data.shape[1:] or start + len(frames) > len(self.image_data):
+            raise ValueError(f"Cannot write {frames.shape} frames at frame {start} of {self.image_data.shape} frames.")
+        self._make_copy_on_write()
+        for frame_no in range(start, start + len(frames)):
+            frame_metadata = self._own_frame_metadata(frame_no)
+            frame_metadata["Max pixel value"] = None
+            frame_metadata["Min pixel value"] = None
+        self.statistics.invalidate(range(start, start + len(frames)))
+        self.image_data.replace_frames(start, frames)
+
+    def _make_copy_on_write(self):
+        # Wrap the frames so they can be modified without affecting copies of this instance. The statistics then
+        # read frames through the wrapper, so they see the modified frames
+        if not isinstance(self.image_data, CopyOnWriteFrames):
+            self.image_data = CopyOnWriteFrames(self.image_data)
+            self.statistics.frames = self.image_data
+
+    def _own_frame_metadata(self, frame_no: int) -> dict:
+        """Return the metadata dict of a frame, copying it first if it is shared with another MediaStorage."""
+        if not self._owns_metadata_dict:
+            self.image_metadata = dict(self.image_metadata)
+            self._owns_metadata_dict = True
+        if self._owned_frame_metadata is not None and frame_no not in self._owned_frame_metadata:
+            self.image_metadata[frame_no] = dict(self.image_metadata[frame_no])
+            self._owned_frame_metadata.add(frame_no)
+        return self.image_metadata[frame_no]
+
+    def _ensure_frame_extrema(self, frame_no: int) -> dict:
+        """Calculate and cache the max and min pixel values of a frame if they are not known yet."""
+        # Writing to a shared dict is safe here. Frames are only shared while their pixel data is identical, and
+        # get_writable_frame() gives a frame its own metadata before the pixel data can diverge
+        frame_metadata = self.image_metadata[frame_no]
+        if frame_metadata["Max pixel value"] is None or frame_metadata["Min pixel value"] is None:
+            frame_statistics = self.statistics.get_frame_statistics(frame_no)
+            frame_metadata["Max pixel value"] = frame_statistics["Max"]
+            frame_metadata["Min pixel value"] = frame_statistics["Min"]
+        return frame_metadata
 
     @staticmethod
     def _filter_arrays_by_common_shape(arrays, metadata):
@@ -210,9 +288,7 @@ class MediaStorage():
         
         return np.array(filtered_arrays), filtered_metadata
     
-    def _calculate_scale_bar(self, frame: np.ndarray, pix_to_nm_scaling_factor: float) -> tuple[int, int]:
-        x_dim = frame.shape[1]
-        
+    def _calculate_scale_bar(self, x_dim: int, pix_to_nm_scaling_factor: float) -> tuple[int, int]:
         # Define limits to contain the bar to
         x_dim_lower_target = x_dim / 5
 
@@ -278,13 +354,16 @@ class MediaStorage():
         return self.file_metadata
     
     def get_frames_metadata_per_frame(self, frame_no: int) -> dict:
-        return self.image_metadata[frame_no]
+        return self._ensure_frame_extrema(frame_no)
     
     def get_frames_metadata(self) -> dict:
         return self.image_metadata
     
-    def get_frames(self) -> np.ndarray:
+    def get_frames(self) -> FrameSource | np.ndarray:
         return self.image_data
+
+    def get_frame_statistics(self) -> FrameStatistics:
+        return self.statistics
     
     # Debugger function
     def output_file_data(self, show_image_data: bool = False):
@@ -318,7 +397,11 @@ class MediaStorage():
         if self.image_metadata != other.image_metadata:
             return False
         
-        # Compare image_data
+        # Compare image_data, avoiding decoding frames that are shared by both instances
+        if self.image_data is other.image_data:
+            return True
+        if isinstance(self.image_data, CopyOnWriteFrames) and self.image_data.shares_data_with(other.image_data):
+            return True
         if not np.array_equal(self.image_data, other.image_data):
             return False
         
@@ -326,15 +409,28 @@ class MediaStorage():
 
     def copy(self):
         """
-        Create a deep copy of this MediaStorage instance.
+        Create a copy-on-write copy of this MediaStorage instance.
+
+        Frames and metadata are shared between both instances and nothing is copied here. Whichever instance later
+        modifies a frame (see get_writable_frame) copies only that frame and its metadata.
         """
         new_instance = MediaStorage()
         new_instance.file_path = self.file_path
         new_instance.file_ext = self.file_ext
-        new_instance.file_metadata = copy.deepcopy(self.file_metadata)
-        new_instance.image_data = np.copy(self.image_data)
-        new_instance.image_metadata = copy.deepcopy(self.image_metadata)
+        # File metadata is never modified after loading, so it is always shared
+        new_instance.file_metadata = self.file_metadata
+        new_instance.image_metadata = self.image_metadata
         new_instance.contained_in_folder = self.contained_in_folder
+
+        for instance in (self, new_instance):
+            instance._owns_metadata_dict = False
+            instance._owned_frame_metadata = set()
+
+        if self.image_data is not None:
+            self._make_copy_on_write()
+            new_instance.image_data = self.image_data.copy()
+            # Statistics of the shared frames stay valid for both instances until either modifies a frame
+            new_instance.statistics = self.statistics.copy(new_instance.image_data)
         return new_instance
 
     def __repr__(self):
@@ -352,5 +448,8 @@ class MediaStorage():
         self.file_metadata = None
         self.image_data = None
         self.image_metadata = None
+        self.statistics = None
         self.channels = None
         self.contained_in_folder = None
+        self._owns_metadata_dict = True
+        self._owned_frame_metadata = None
@@ -57,6 +57,7 @@ class MyApp(QMainWindow):
 
         # Connect widgets
         self.rhs_component.videoPlayerWidgets.update_external_widgets.connect(self.lhs_component.fileDetailingWidgets.update_table_data)
+        self.rhs_component.videoPlayerWidgets.update_external_widgets.connect(self.lhs_component.tabWidgets.level_tab.set_current_frame)
 
     def createMenu(self):
         menubar = self.menuBar()
@@ -34,6 +34,18 @@ STANDARDISED_METADATA_DICT_KEYS = [
     "X Pixel Dimensions", "Pixel/nm Scaling Factor", "Current channel", "Timestamp",
 ]
 
-DEPTH_CONTROL_OPTIONS = ["Min Max", "Histogram", "Excl. outliers", "Manual"]
+DEPTH_CONTROL_OPTIONS = ["Min Max", "Histogram", "Excl. outliers", "Manual", "Whole movie", "Rolling window",
+                         "Whole movie histogram"]
+# Frames in the window of the "Rolling window" depth control, centred on the displayed frame
+DEFAULT_DEPTH_WINDOW_FRAMES = 25
+
+# Video player used to show frames, "OpenGL" or "Matplotlib". The OpenGL player colour maps frames on the GPU, or in
+# software through Mesa, and the Matplotlib player is used instead when no suitable OpenGL context can be created
+VIDEO_PLAYER_BACKEND = "OpenGL"
 
 NANOMETRES_IN_METRE = 1e9
+
+# Decoded frame cache. Decoded frame stacks are kept here so that reopening a file maps the cached frames
+# instead of decoding the raw file again. Least recently used entries are evicted above the byte budget
+FRAME_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".pNanoLocz", "frame_cache")
+FRAME_CACHE_BYTE_BUDGET = 8 * 1024 ** 3
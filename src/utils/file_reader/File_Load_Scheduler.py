@@ -0,0 +1,149 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from .File_Reader import readFileData, commitFileData, probeFileData
+
+# Selection changes closer together than this are coalesced, so only the last selected file is decoded
+LOAD_DEBOUNCE_MS = 150
+# A superseded load that is already running cannot be interrupted, so a second worker lets the newest load start
+# straight away instead of queueing behind it
+MAX_LOAD_WORKERS = 2
+
+
+class FileLoadScheduler(QObject):
+    """
+    Loads files on a background worker pool so that reading large files does not block the GUI thread.
+
+    Each request supersedes every earlier one. Requests that have not started are cancelled, and the results of
+    superseded loads that were already running are discarded when they finish. Only the newest result is committed
+    to the MediaDataManager, on the GUI thread, which then emits new_file_loaded.
+
+    The headers of each file are probed on the same workers before it is loaded, and metadata_probed is emitted with
+    its metadata and channels while the frames are still being read.
+    """
+    _instance = None
+
+    load_started = pyqtSignal(str)
+    load_failed = pyqtSignal(str, str)
+    metadata_probed = pyqtSignal(str, object)
+    # Emitted from the worker threads. Connected with a queued connection so results are handled on the GUI thread
+    _load_finished = pyqtSignal(int, object)
+    _load_errored = pyqtSignal(int, str, str)
+    _probe_finished = pyqtSignal(int, str, object)
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(FileLoadScheduler, cls).__new__(cls)
+            QObject.__init__(cls._instance)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.executor = ThreadPoolExecutor(max_workers=MAX_LOAD_WORKERS, thread_name_prefix="file_loader")
+        self.generation = 0
+        # Generation of the last committed load, so a probe that finishes after its load does not overwrite it
+        self.committed_generation = -1
+        self.pending_request = None
+        self.pending_futures = []
+
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self._submit_pending_request)
+
+        self._load_finished.connect(self._on_load_finished)
+        self._load_errored.connect(self._on_load_errored)
+        self._probe_finished.connect(self._on_probe_finished)
+
+    def __init__(self):
+        pass
+
+    def request_load(self, file_path: str, channel: str | None = None, debounce: bool = True,
+                     frames: slice | None = None, stride: int = 1):
+        """
+        Load a file or folder in the background, superseding any earlier request.
+
+        Parameters
+        ----------
+        file_path : str
+            The file or image series folder to load.
+        channel : str, optional
+            The channel to load. The reader's default channel is used if None.
+        debounce : bool
+            Wait LOAD_DEBOUNCE_MS for further requests before starting the load. Use for rapid selection changes.
+        frames : slice, optional
+            Range of frames to load. Every frame is loaded if None.
+        stride : int
+            Only load every stride-th frame of the range. Defaults to 1.
+        """
+        self.cancel()
+        self.pending_request = (file_path, channel, frames, stride)
+        if debounce:
+            self.debounce_timer.start(LOAD_DEBOUNCE_MS)
+        else:
+            self._submit_pending_request()
+
+    def cancel(self):
+        """Cancel every outstanding request. Loads that are already running finish but are not committed."""
+        self.generation += 1
+        self.pending_request = None
+        self.debounce_timer.stop()
+        for future in self.pending_futures:
+            future.cancel()
+        self.pending_futures = [future for future in self.pending_futures if not future.done()]
+
+    def is_loading(self) -> bool:
+        return self.pending_request is not None or any(not future.done() for future in self.pending_futures)
+
+    def _submit_pending_request(self):
+        if self.pending_request is None:
+            return
+        file_path, channel, frames, stride = self.pending_request
+        self.pending_request = None
+
+        self.load_started.emit(file_path)
+        # The probe is submitted first so a load already running on the other worker does not delay it
+        self.pending_futures.append(self.executor.submit(self._probe, self.generation, file_path, channel))
+        future = self.executor.submit(self._load, self.generation, file_path, channel, frames, stride)
+        self.pending_futures.append(future)
+
+    def _probe(self, generation: int, file_path: str, channel: str | None):
+        if generation != self.generation:
+            return
+        try:
+            probed_data = probeFileData(file_path, channel)
+        except Exception as e:
+            print(f"Could not read the metadata of {file_path}: {e}")
+            return
+        if probed_data is not None:
+            self._probe_finished.emit(generation, file_path, probed_data)
+
+    def _load(self, generation: int, file_path: str, channel: str | None, frames: slice | None, stride: int):
+        # Skip loads that were superseded while waiting for a worker
+        if generation != self.generation:
+            return
+        try:
+            file_data = readFileData(file_path, channel, frames, stride)
+        except Exception as e:
+            traceback.print_exc()
+            self._load_errored.emit(generation, file_path, str(e))
+            return
+        self._load_finished.emit(generation, file_data)
+
+    def _on_load_finished(self, generation: int, file_data):
+        self.pending_futures = [future for future in self.pending_futures if not future.done()]
+        if generation != self.generation:
+            return
+        self.committed_generation = generation
+        commitFileData(file_data)
+
+    def _on_probe_finished(self, generation: int, file_path: str, probed_data):
+        if generation != self.generation or generation == self.committed_generation:
+            return
+        self.metadata_probed.emit(file_path, probed_data)
+
+    def _on_load_errored(self, generation: int, file_path: str, message: str):
+        self.pending_futures = [future for future in self.pending_futures if not future.done()]
+        if generation != self.generation:
+            return
+        print(f"Failed to load {file_path}: {message}")
+        self.load_failed.emit(file_path, message)
@@ -1,22 +1,110 @@
 import os
+import threading
 from collections import Counter
 import numpy as np
 from .read_folders import ImageLoader
-from .asd import load_asd
-from .read_aris import open_aris
-from .read_ibw import open_ibw
-from .read_jpk import open_jpk
-from .read_nhf import open_nhf
-from .read_spm import open_spm
-from .read_gwy import open_gwy
+from .asd import AsdChannels, probe_asd
+from .read_aris import open_aris, probe_aris
+from .read_ibw import open_ibw, probe_ibw
+from .read_jpk import open_jpk, probe_jpk
+from .read_nhf import open_nhf, probe_nhf
+from .read_spm import open_spm, probe_spm
+from .read_gwy import open_gwy, probe_gwy
+from .frame_cache import DecodedFrameCache
+from .frame_selection import is_frame_selection
 from core.Image_Storage_Module.Media_Data_Manager_Class import MediaDataManager
+from core.Image_Storage_Module.Frame_Source import is_lazy_frame_source
 
+# Formats whose decoded frames are kept in the on-disk frame cache. .asd and .spm files are already memory-mapped
+# directly, so reading the cache would be no faster than decoding them
+CACHED_FILE_EXTS = ['.aris', '.ibw', '.jpk', '.nhf', '.gwy']
+
+frame_cache = DecodedFrameCache()
+
+# The channels of the last .asd file opened share one memory map, so flipping between its channels does not reopen
+# or re-read the file. Keyed by the path, size and modification time of the file
+asd_channels_lock = threading.Lock()
+asd_channels_cache = {"Key": None, "Channels": None}
+
+# Header-only readers, keyed by file extension
+PROBE_FUNCTIONS = {
+    '.asd': probe_asd,
+    '.aris': probe_aris,
+    '.ibw': probe_ibw,
+    '.jpk': probe_jpk,
+    '.nhf': probe_nhf,
+    '.spm': probe_spm,
+    '.gwy': probe_gwy,
+}
+
+
+def probeFileData(file_path, channel = None):
+    """
+    Read the standardised metadata and channel list of a file from its headers, without decoding any frames.
+
+    Returns
+    -------
+    tuple[dict, list] or None
+        The metadata and channels, as they would be loaded by readFileData. None if the file type is unsupported.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if os.path.isdir(file_path) or ext not in PROBE_FUNCTIONS:
+        return None
+
+    metadata, channels = PROBE_FUNCTIONS[ext](file_path, channel)
+    channels = list(channels)
+    if '' in channels:
+        channels.remove('')
+    return metadata, channels
+
+
+def loadFileData(file_path, channel = None, frames = None, stride = 1):
+    """
+    Read a file or folder and load it into the MediaDataManager. Blocks until the file is fully read.
+
+    frames (a slice) and stride select the frames to load, see readFileData.
+    """
+    commitFileData(readFileData(file_path, channel, frames, stride))
+
+
+def commitFileData(file_data):
+    """
+    Load data returned by readFileData into the MediaDataManager, which emits new_file_loaded.
+
+    Must be called from the GUI thread.
+    """
+    if file_data is None:
+        return
 
-def loadFileData(file_path, channel = None):
     # Instantiate core media manager class
     media_data_manager = MediaDataManager()
+    if file_data["Is Folder"]:
+        media_data_manager.load_new_folder_data(folder_path=file_data["Path"], dominant_file_ext=file_data["Ext"],
+                                                frames=file_data["Frames"], folder_metadata=file_data["Metadata"],
+                                                channels=file_data["Channels"])
+    else:
+        media_data_manager.load_new_file_data(file_path=file_data["Path"], file_ext=file_data["Ext"],
+                                              frames=file_data["Frames"], file_metadata=file_data["Metadata"],
+                                              channels=file_data["Channels"])
+
+
+def readFileData(file_path, channel = None, frames = None, stride = 1):
+    """
+    Decode a file or image series folder without touching the MediaDataManager, so it is safe to call from a
+    worker thread.
+
+    frames (a slice) and stride select a range of frames, or every stride-th frame of it, e.g. for a quick survey of
+    a long movie. Readers seek to or map only the selected frames, and the metadata only describes those frames.
+    Single image files must select their only frame.
+
+    Returns
+    -------
+    dict or None
+        The "Path", "Ext", "Frames", "Metadata" and "Channels" of the data and whether it "Is Folder", to be passed
+        to commitFileData. None if the file type is unsupported or the folder is not an image series.
+    """
     if os.path.isdir(file_path):
-        image_loader = ImageLoader(file_path)
+        image_loader = ImageLoader(file_path, frames, stride)
         dominant_format = image_loader.get_dominant_format()
         if dominant_format is not None:  # Only display data if criteria met
             frames = [data['image'] for data in image_loader._data_dict.values()]
@@ -46,35 +134,70 @@ def loadFileData(file_path, channel = None):
             if '' in repeating_channels:
                 repeating_channels.remove('')
 
-            media_data_manager.load_new_folder_data(folder_path=file_path, dominant_file_ext=dominant_format, frames=frames,
-                                            folder_metadata=metadata, channels=repeating_channels)
-
-            # self.displayDataFolders(frames, metadata, file_path)
+            return {"Is Folder": True, "Path": file_path, "Ext": dominant_format, "Frames": frames,
+                    "Metadata": metadata, "Channels": repeating_channels}
         else:
             print("Folder does not meet the criteria for image series.")
-        return
+        return None
 
     ext = os.path.splitext(file_path)[1].lower()
+
+    # The cache only holds whole files, so selections of frames are always read from the file
+    use_frame_cache = ext in CACHED_FILE_EXTS and not is_frame_selection(frames, stride)
+    cached_file_data = frame_cache.get(file_path, channel) if use_frame_cache else None
+    if cached_file_data is not None:
+        frames, metadata, channels = cached_file_data
+        return {"Is Folder": False, "Path": file_path, "Ext": ext, "Frames": frames,
+                "Metadata": metadata, "Channels": channels}
+
+    # .asd, .aris, .jpk and .spm frames are returned as lazy frame sources and are only decoded when displayed
     if ext == '.asd':
-        frames, metadata, channels = load_asd(file_path, channel)  
+        images, metadata, channels = readAsdChannel(file_path, channel, frames, stride)
     elif ext == '.aris':
-        frames, metadata, channels = open_aris(file_path, channel)
+        images, metadata, channels = open_aris(file_path, channel, lazy=True, frames=frames, stride=stride)
     elif ext == '.ibw':
-        frames, metadata, channels = open_ibw(file_path, channel)
+        images, metadata, channels = open_ibw(file_path, channel, frames=frames, stride=stride)
     elif ext == '.jpk':
-        frames, metadata, channels = open_jpk(file_path, channel)
+        images, metadata, channels = open_jpk(file_path, channel, stream=True, frames=frames, stride=stride)
     elif ext == '.nhf':
-        frames, metadata, channels = open_nhf(file_path, channel)
+        images, metadata, channels = open_nhf(file_path, channel, frames=frames, stride=stride)
     elif ext == '.spm':
-        frames, metadata, channels = open_spm(file_path, channel)
+        images, metadata, channels = open_spm(file_path, channel, stream=True, frames=frames, stride=stride)
     elif ext == '.gwy':
-        frames, metadata, channels = open_gwy(file_path, channel)
+        images, metadata, channels = open_gwy(file_path, channel, frames=frames, stride=stride)
     else:
         print(f"Unsupported file type: {ext}")
-        return
+        return None
     
     if '' in channels:
         channels.remove('')
+
+    if use_frame_cache:
+        # Lazy sources are decoded into the cache in the background so the file still opens immediately.
+        # The metadata is copied as MediaStorage modifies it while loading
+        frame_cache.put(file_path, channel, images, dict(metadata), list(channels),
+                        background=is_lazy_frame_source(images))
     
-    media_data_manager.load_new_file_data(file_path=file_path, file_ext=ext, frames=frames,
-                                            file_metadata=metadata, channels=channels)
\ No newline at end of file
+    return {"Is Folder": False, "Path": file_path, "Ext": ext, "Frames": images,
+            "Metadata": metadata, "Channels": channels}
+
+
+def readAsdChannel(file_path, channel = None, frames = None, stride = 1):
+    """
+    Get one channel of a .asd file, from the shared memory map of the last .asd file opened if it is the same file.
+
+    frames (a slice) and stride select frames as a strided view of the memory map.
+
+    Returns
+    -------
+    tuple
+        The lazy frames, the standardised metadata and the channel list, as returned by load_asd.
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    with asd_channels_lock:
+        if asd_channels_cache["Key"] != key:
+            asd_channels_cache["Channels"] = AsdChannels(file_path, memory_map=True)
+            asd_channels_cache["Key"] = key
+        asd_channels = asd_channels_cache["Channels"]
+    return asd_channels.load(channel, frames, stride)
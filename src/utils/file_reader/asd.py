@@ -1,11 +1,13 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import BinaryIO
+import struct
 import numpy as np
 import numpy.typing as npt
 import matplotlib.pyplot as plt
 from matplotlib import animation
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .frame_selection import select_frames, as_slice
 
 from AFMReader.logging import logger
 from AFMReader.io import (
@@ -13,17 +15,154 @@ from AFMReader.io import (
     read_int16,
     read_float,
     read_bool,
-    read_hex_u32,
-    read_ascii,
-    read_uint8,
-    read_null_separated_utf8,
     read_int8,
-    read_double,
-    skip_bytes,
 )
 
 logger.enable(__package__)
 
+# Layout of the fixed-size header that precedes the pixel block of every frame
+ASD_FRAME_HEADER_FIELDS = [
+    ("frame_number", "<i4"),
+    ("max_data", "<i2"),
+    ("min_data", "<i2"),
+    ("x_offset", "<i2"),
+    ("y_offset", "<i2"),
+    ("x_tilt", "<f4"),
+    ("y_tilt", "<f4"),
+    ("is_stimulated", "?"),
+    ("booked_1", "<i1"),
+    ("booked_2", "<i2"),
+    ("booked_3", "<i4"),
+    ("booked_4", "<i4"),
+]
+
+
+class PackedFields:
+    """
+    Declarative layout of a packed run of little-endian header fields, decoded with a single `struct.unpack_from`.
+
+    Parameters
+    ----------
+    fields : list
+        (name, struct format) pairs in file order. Padding ("x") fields are reserved bytes, they have no name or value.
+    """
+
+    def __init__(self, fields: list):
+        self.fields = fields
+        self.struct = struct.Struct("<" + "".join(field_format for _, field_format in fields))
+        self.names = [name for name, field_format in fields if not field_format.endswith("x")]
+        self.size = self.struct.size
+
+    def decode(self, buffer: bytes, offset: int = 0) -> dict:
+        """Decode the fields from a buffer, starting offset bytes into it."""
+        return dict(zip(self.names, self.struct.unpack_from(buffer, offset)))
+
+    def read(self, open_file: BinaryIO) -> dict:
+        """Read and decode the fields from the current position of an open file."""
+        return self.decode(_read_exactly(open_file, self.size))
+
+
+# Layouts of the fixed-size runs of fields in the file header, after the file version. The variable-length user name,
+# comment and colour scale anchor points between and after them are sliced from a single read
+ASD_HEADER_FIELDS_VERSION_0 = PackedFields([
+    ("channel1", "2s"),
+    ("channel2", "2s"),
+    ("header_length", "i"),
+    ("frame_header_length", "i"),
+    ("user_name_size", "i"),
+    ("comment_offset_size", "i"),
+    ("comment_size", "i"),
+    ("x_pixels", "h"),
+    ("y_pixels", "h"),
+    ("x_nm", "h"),
+    ("y_nm", "h"),
+    ("frame_time", "f"),
+    ("z_piezo_extension", "f"),
+    ("z_piezo_gain", "f"),
+    ("analogue_digital_range", "I"),
+    ("analogue_digital_data_bits_size", "i"),
+    ("is_averaged", "?"),
+    ("averaging_window", "i"),
+    (None, "2x"),
+    ("year", "h"),
+    ("month", "B"),
+    ("day", "B"),
+    ("hour", "B"),
+    ("minute", "B"),
+    ("second", "B"),
+    ("rounding_degree", "B"),
+    ("max_x_scan_range", "f"),
+    ("max_y_scan_range", "f"),
+    (None, "12x"),
+    ("initial_frames", "i"),
+    ("num_frames", "i"),
+    ("afm_id", "i"),
+    ("file_id", "h"),
+])
+
+# Follows the user name in version 0 headers
+ASD_HEADER_SENSITIVITY_FIELDS_VERSION_0 = PackedFields([
+    ("scanner_sensitivity", "f"),
+    ("phase_sensitivity", "f"),
+    ("scan_direction", "i"),
+])
+
+# Shared by version 1 and 2 headers
+ASD_HEADER_FIELDS_VERSION_1 = PackedFields([
+    ("header_length", "i"),
+    ("frame_header_length", "i"),
+    ("text_encoding", "i"),
+    ("user_name_size", "i"),
+    ("comment_size", "i"),
+    ("channel1", "4s"),
+    ("channel2", "4s"),
+    ("initial_frames", "i"),
+    ("num_frames", "i"),
+    ("scan_direction", "i"),
+    ("file_id", "i"),
+    ("x_pixels", "i"),
+    ("y_pixels", "i"),
+    ("x_nm", "i"),
+    ("y_nm", "i"),
+    ("is_averaged", "?"),
+    ("averaging_window", "i"),
+    ("year", "i"),
+    ("month", "i"),
+    ("day", "i"),
+    ("hour", "i"),
+    ("minute", "i"),
+    ("second", "i"),
+    ("x_rounding_degree", "i"),
+    ("y_rounding_degree", "i"),
+    ("frame_time", "f"),
+    ("scanner_sensitivity", "f"),
+    ("phase_sensitivity", "f"),
+    ("offset", "i"),
+    (None, "12x"),
+    ("afm_id", "i"),
+    ("analogue_digital_range", "I"),
+    ("analogue_digital_data_bits_size", "i"),
+    ("max_x_scan_range", "f"),
+    ("max_y_scan_range", "f"),
+    ("x_piezo_extension", "f"),
+    ("y_piezo_extension", "f"),
+    ("z_piezo_extension", "f"),
+    ("z_piezo_gain", "f"),
+])
+
+# Follows the comment in version 2 headers, and is followed by the anchor points of each colour
+ASD_HEADER_COLOUR_SCALE_FIELDS_VERSION_2 = PackedFields([
+    ("number_of_frames", "i"),
+    ("is_x_feed_forward_integer", "i"),
+    ("is_x_feed_forward_double", "d"),
+    ("max_colour_scale", "i"),
+    ("min_colour_scale", "i"),
+    ("length_red_anchor_points", "i"),
+    ("length_green_anchor_points", "i"),
+    ("length_blue_anchor_points", "i"),
+])
+
+
 def calculate_scaling_factor(
     channel: str,
     z_piezo_gain: float,
@@ -67,7 +206,7 @@ def calculate_scaling_factor(
     raise ValueError(f"channel {channel} not known for .asd file type.")
 
 
-def load_asd(file_path: Path, channel: str):
+def load_asd(file_path: Path, channel: str, memory_map: bool = False, frames: slice | None = None, stride: int = 1):
     """
     Load a .asd file.
 
@@ -78,12 +217,20 @@ def load_asd(file_path: Path, channel: str):
     channel : str
         Channel to load. Note that only three channels seem to be present in a single .asd file. Options: TP
         (Topograph), ER (Error) and PH (Phase).
+    memory_map : bool
+        If True, the frame data is not read into memory. Instead an `AsdFrameStack` is returned that memory-maps the
+        file and decodes each frame only when it is accessed. Defaults to False.
+    frames : slice, optional
+        Range of frames to load. Defaults to every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1. Only the selected frames are read, or mapped.
 
     Returns
     -------
-    npt.NDArray
+    npt.NDArray | AsdFrameStack
         The .asd file frames data as a numpy 3D array N x W x H
-        (Number of frames x Width of each frame x height of each frame).
+        (Number of frames x Width of each frame x height of each frame), or a lazy `AsdFrameStack` of the same shape
+        if `memory_map` is True.
     float
         The number of nanometres per pixel for the .asd file. (AKA the resolution).
         Enables converting between pixels and nanometres when working with the data, in order to use real-world length
@@ -97,44 +244,12 @@ def load_asd(file_path: Path, channel: str):
     file_path = Path(file_path)
     # Open the file in binary mode
     with Path.open(file_path, "rb", encoding=None) as open_file:  # pylint: disable=unspecified-encoding
-        file_version = read_file_version(open_file)
-
-        if file_version == 0:
-            header_dict = read_header_file_version_0(open_file)
-
-        elif file_version == 1:
-            header_dict = read_header_file_version_1(open_file)
-
-        elif file_version == 2:
-            header_dict = read_header_file_version_2(open_file)
-        else:
-            raise ValueError(
-                f"File version {file_version} unknown. Please add support if you "
-                "know how to decode this file version."
-            )
-
-        pixel_to_nanometre_scaling_factor_x = header_dict["x_pixels"] / header_dict["x_nm"]
-        pixel_to_nanometre_scaling_factor_y = header_dict["y_pixels"] / header_dict["y_nm"]
-        if pixel_to_nanometre_scaling_factor_x != pixel_to_nanometre_scaling_factor_y:
-            logger.warning(
-                f"Resolution of image is different in x and y directions:"
-                f"x: {pixel_to_nanometre_scaling_factor_x}"
-                f"y: {pixel_to_nanometre_scaling_factor_y}"
-            )
-        pixel_to_nanometre_scaling_factor = pixel_to_nanometre_scaling_factor_x
+        header_dict = read_header(open_file)
+        channel_offsets = asd_channel_offsets(header_dict, open_file.tell())
 
         if channel == header_dict["channel1"]:
             logger.info(f"Requested channel {channel} matches first channel in file: {header_dict['channel1']}")
-        elif channel == header_dict["channel2"]:
-            # Skip first channel data
-            _size_of_frame_header = header_dict["frame_header_length"]
-            # Remember that each value is two bytes (since signed int16)
-            size_of_single_frame_plus_header = (
-                header_dict["frame_header_length"] + header_dict["x_pixels"] * header_dict["y_pixels"] * 2
-            )
-            length_of_all_first_channel_frames = header_dict["num_frames"] * size_of_single_frame_plus_header
-            _ = open_file.read(length_of_all_first_channel_frames)
-        else:
+        elif channel not in channel_offsets:
             channel = header_dict["channel1"]
 
         scaling_factor = calculate_scaling_factor(
@@ -145,45 +260,251 @@ def load_asd(file_path: Path, channel: str):
             phase_sensitivity=header_dict["phase_sensitivity"],
         )
 
-        frames, frame_metadata_list = read_channel_data(
-            open_file=open_file,
-            num_frames=header_dict["num_frames"],
-            x_pixels=header_dict["x_pixels"],
-            y_pixels=header_dict["y_pixels"],
-            frame_time=header_dict["frame_time"]
-        )
-
-        frames = np.array(frames)
+        selected = select_frames(header_dict["num_frames"], frames, stride)
+        if memory_map:
+            frames = AsdFrameStack.open(
+                file_path=file_path,
+                offset=channel_offsets[channel],
+                num_frames=header_dict["num_frames"],
+                frame_header_length=header_dict["frame_header_length"],
+                x_pixels=header_dict["x_pixels"],
+                y_pixels=header_dict["y_pixels"],
+                frames=selected,
+            )
+        else:
+            # Seek straight to each selected frame, frames that are not selected, and the frames of the channels
+            # before this one, are never read
+            frame_size = header_dict["frame_header_length"] + header_dict["x_pixels"] * header_dict["y_pixels"] * 2
+            frames = np.empty((len(selected), header_dict["y_pixels"], header_dict["x_pixels"]), dtype=np.float32)
+            next_frame_no = None
+            for i, frame_no in enumerate(selected):
+                if frame_no != next_frame_no:
+                    open_file.seek(channel_offsets[channel] + frame_no * frame_size)
+                frame, _ = read_channel_data(
+                    open_file=open_file,
+                    num_frames=1,
+                    x_pixels=header_dict["x_pixels"],
+                    y_pixels=header_dict["y_pixels"],
+                    frame_time=header_dict["frame_time"]
+                )
+                frames[i] = frame[0]
+                next_frame_no = frame_no + 1
+        timestamps = _asd_timestamps(header_dict, selected)
 
         # Ensure channels are returned
         channels = [header_dict["channel1"], header_dict["channel2"]]
 
-        # Ensure metadata includes channels
-        header_dict["channels"] = channels
-
-        fps = 1000.0 / header_dict.get('frame_time', 1000.0)  # Default to 1 fps if frame_time is missing
-        line_rate = header_dict.get('y_pixels', 1) / (header_dict.get('frame_time', 1000.0) / 1000.0)
-        values = [
-            header_dict.get('num_frames', 'N/A'),
-            [header_dict.get('x_nm', 'N/A') for i in range(header_dict.get('num_frames', 0))],
-            fps,
-            line_rate,
-            header_dict.get('y_pixels', 'N/A'),
-            header_dict.get('x_pixels', 'N/A'),
-            [pixel_to_nanometre_scaling_factor for i in range(header_dict.get('num_frames', 'N/A'))],
-            channel,
-            [frame_metadata_list[i]["timestamp"] for i in range(int(header_dict.get('num_frames', 'N/A')))]
-        ]
-
-        if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
-            raise ValueError(f"The length of the values in .asd does not match the required metadata keys.")
-
-        # Create the metadata dictionary
-        file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+        file_metadata = _asd_file_metadata(header_dict, channel, timestamps)
 
         return frames, file_metadata, channels
 
 
+class AsdChannels:
+    """
+    The frames of every channel in a .asd file, held in one buffer shared by all the channels.
+
+    The channels are stored one after the other in the file, so the frame records of all of them are memory-mapped,
+    or read with a single read, as one array, and each channel is a view of its part of it. Switching between the
+    channels of a file that is already open then needs no further reads.
+
+    Parameters
+    ----------
+    file_path : Path
+        Path to the .asd file.
+    memory_map : bool
+        If True, the frame records are memory-mapped rather than read into memory. Defaults to False.
+    """
+
+    def __init__(self, file_path: Path, memory_map: bool = False):
+        self.file_path = Path(file_path)
+        with Path.open(self.file_path, "rb", encoding=None) as open_file:  # pylint: disable=unspecified-encoding
+            self.header_dict = read_header(open_file)
+            channel_offsets = asd_channel_offsets(self.header_dict, open_file.tell())
+            data_offset = min(channel_offsets.values())
+            num_frames = self.header_dict["num_frames"]
+            frame_dtype = create_frame_dtype(
+                self.header_dict["frame_header_length"], self.header_dict["x_pixels"], self.header_dict["y_pixels"]
+            )
+            shape = (len(channel_offsets) * num_frames,)
+            if memory_map:
+                records = np.memmap(self.file_path, dtype=frame_dtype, mode="r", offset=data_offset, shape=shape)
+            else:
+                open_file.seek(data_offset)
+                records = np.fromfile(open_file, dtype=frame_dtype, count=shape[0])
+                if len(records) != shape[0]:
+                    raise ValueError(f"The .asd file ended before the last of its {shape[0]} frames.")
+
+        self.channels = [self.header_dict["channel1"], self.header_dict["channel2"]]
+        self.frames = {
+            channel: AsdFrameStack(records[(offset - data_offset) // frame_dtype.itemsize:][:num_frames])
+            for channel, offset in channel_offsets.items()
+        }
+
+    def load(self, channel: str, frames: slice | None = None, stride: int = 1) -> tuple[AsdFrameStack, dict, list]:
+        """
+        Get the frames of a channel, as returned by `load_asd`. Unknown channels fall back to the first channel.
+
+        The frames and stride select frames as in `load_asd`, as a view of the shared buffer.
+
+        Returns
+        -------
+        AsdFrameStack
+            The frames of the channel, a view of the shared buffer.
+        dict
+            Metadata for the channel, built afresh on every call so it can be modified by the caller.
+        list
+            The channels in the file.
+        """
+        if channel not in self.frames:
+            channel = self.header_dict["channel1"]
+        selected = select_frames(self.header_dict["num_frames"], frames, stride)
+        channel_frames = self.frames[channel]
+        if selected != range(len(channel_frames)):
+            channel_frames = channel_frames.select(selected)
+        file_metadata = _asd_file_metadata(self.header_dict, channel, _asd_timestamps(self.header_dict, selected))
+        return channel_frames, file_metadata, list(self.channels)
+
+
+def asd_channel_offsets(header_dict: dict, data_offset: int) -> dict:
+    """
+    Compute the byte offset of the first frame header of each channel in a .asd file.
+
+    Parameters
+    ----------
+    header_dict : dict
+        The header of the file.
+    data_offset : int
+        Byte offset of the first frame header of the first channel, the end of the file header.
+
+    Returns
+    -------
+    dict
+        Offset of each channel keyed by its name. The second channel is only present if the file names one.
+    """
+    channel_size = header_dict["num_frames"] * (
+        header_dict["frame_header_length"] + header_dict["x_pixels"] * header_dict["y_pixels"] * 2
+    )
+    channel_offsets = {header_dict["channel1"]: data_offset}
+    if header_dict["channel2"] and header_dict["channel2"] != header_dict["channel1"]:
+        channel_offsets[header_dict["channel2"]] = data_offset + channel_size
+    return channel_offsets
+
+
+def _asd_timestamps(header_dict: dict, selected: range | None = None) -> list:
+    """The timestamp in seconds of every selected frame, or of every frame, computed from the frame time."""
+    frame_numbers = np.arange(header_dict["num_frames"]) if selected is None else np.asarray(selected)
+    return (frame_numbers * header_dict["frame_time"] / 1000.0).tolist()
+
+
+def probe_asd(file_path: Path, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of a .asd file from its file header, without reading any frames.
+
+    Parameters
+    ----------
+    file_path : Path
+        Path to the .asd file.
+    channel : str, optional
+        The channel reported as the current channel. Defaults to the first channel in the file.
+
+    Returns
+    -------
+    dict
+        The standardised metadata, as returned by `load_asd`.
+    list
+        The channels in the file.
+    """
+    file_path = Path(file_path)
+    with Path.open(file_path, "rb", encoding=None) as open_file:  # pylint: disable=unspecified-encoding
+        header_dict = read_header(open_file)
+
+    channels = [header_dict["channel1"], header_dict["channel2"]]
+    if channel not in channels:
+        channel = header_dict["channel1"]
+
+    return _asd_file_metadata(header_dict, channel, _asd_timestamps(header_dict)), channels
+
+
+def read_header(open_file: BinaryIO) -> dict:
+    """
+    Read the file header of a .asd file, leaving the file positioned at the first frame header.
+
+    Parameters
+    ----------
+    open_file : BinaryIO
+        An open binary file object for a .asd file, positioned at the start of the file.
+
+    Returns
+    -------
+    dict
+        The header of the file, see the `read_header_file_version_x` functions.
+    """
+    file_version = read_file_version(open_file)
+
+    if file_version == 0:
+        return read_header_file_version_0(open_file)
+    if file_version == 1:
+        return read_header_file_version_1(open_file)
+    if file_version == 2:
+        return read_header_file_version_2(open_file)
+    raise ValueError(
+        f"File version {file_version} unknown. Please add support if you "
+        "know how to decode this file version."
+    )
+
+
+def _asd_file_metadata(header_dict: dict, channel: str, timestamps: list) -> dict:
+    """
+    Build the standardised metadata dictionary of a .asd file from its header.
+
+    Parameters
+    ----------
+    header_dict : dict
+        The header of the file.
+    channel : str
+        The channel that was loaded.
+    timestamps : list
+        The timestamp in seconds of every frame that was loaded, which sets the number of frames.
+
+    Returns
+    -------
+    dict
+        Metadata keyed by `STANDARDISED_METADATA_DICT_KEYS`.
+    """
+    pixel_to_nanometre_scaling_factor_x = header_dict["x_pixels"] / header_dict["x_nm"]
+    pixel_to_nanometre_scaling_factor_y = header_dict["y_pixels"] / header_dict["y_nm"]
+    if pixel_to_nanometre_scaling_factor_x != pixel_to_nanometre_scaling_factor_y:
+        logger.warning(
+            f"Resolution of image is different in x and y directions:"
+            f"x: {pixel_to_nanometre_scaling_factor_x}"
+            f"y: {pixel_to_nanometre_scaling_factor_y}"
+        )
+    pixel_to_nanometre_scaling_factor = pixel_to_nanometre_scaling_factor_x
+
+    # Ensure metadata includes channels
+    header_dict["channels"] = [header_dict["channel1"], header_dict["channel2"]]
+
+    fps = 1000.0 / header_dict.get('frame_time', 1000.0)  # Default to 1 fps if frame_time is missing
+    line_rate = header_dict.get('y_pixels', 1) / (header_dict.get('frame_time', 1000.0) / 1000.0)
+    values = [
+        len(timestamps),
+        [header_dict.get('x_nm', 'N/A') for i in range(len(timestamps))],
+        fps,
+        line_rate,
+        header_dict.get('y_pixels', 'N/A'),
+        header_dict.get('x_pixels', 'N/A'),
+        [pixel_to_nanometre_scaling_factor for i in range(len(timestamps))],
+        channel,
+        list(timestamps)
+    ]
+
+    if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
+        raise ValueError(f"The length of the values in .asd does not match the required metadata keys.")
+
+    # Create the metadata dictionary
+    return dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+
+
 def read_file_version(open_file: BinaryIO) -> int:
     """
     Read the file version from an open asd file. File versions are 0, 1 and 2.
@@ -218,54 +539,17 @@ def read_header_file_version_0(open_file: BinaryIO) -> dict:
     dict
         Dictionary of metadata decoded from the file header.
     """
-    header_dict = {}
-    header_dict["channel1"] = read_ascii(open_file, 2)
-    header_dict["channel2"] = read_ascii(open_file, 2)
-    header_dict["header_length"] = read_int32(open_file)
-    header_dict["frame_header_length"] = read_int32(open_file)
-    header_dict["user_name_size"] = read_int32(open_file)
-    header_dict["comment_offset_size"] = read_int32(open_file)
-    header_dict["comment_size"] = read_int32(open_file)
-    header_dict["x_pixels"] = read_int16(open_file)
-    header_dict["y_pixels"] = read_int16(open_file)
-    header_dict["x_nm"] = read_int16(open_file)
-    header_dict["y_nm"] = read_int16(open_file)
-    header_dict["frame_time"] = read_float(open_file)
-    header_dict["z_piezo_extension"] = read_float(open_file)
-    header_dict["z_piezo_gain"] = read_float(open_file)
-    header_dict["analogue_digital_range"] = read_hex_u32(open_file)
-    header_dict["analogue_digital_data_bits_size"] = read_int32(open_file)
-    header_dict["analogue_digital_resolution"] = 2 ^ header_dict["analogue_digital_data_bits_size"]
-    header_dict["is_averaged"] = read_bool(open_file)
-    header_dict["averaging_window"] = read_int32(open_file)
-    _ = read_int16(open_file)
-    header_dict["year"] = read_int16(open_file)
-    header_dict["month"] = read_uint8(open_file)
-    header_dict["day"] = read_uint8(open_file)
-    header_dict["hour"] = read_uint8(open_file)
-    header_dict["minute"] = read_uint8(open_file)
-    header_dict["second"] = read_uint8(open_file)
-    header_dict["rounding_degree"] = read_uint8(open_file)
-    header_dict["max_x_scan_range"] = read_float(open_file)
-    header_dict["max_y_scan_range"] = read_float(open_file)
-    _ = read_int32(open_file)
-    _ = read_int32(open_file)
-    _ = read_int32(open_file)
-    header_dict["initial_frames"] = read_int32(open_file)
-    header_dict["num_frames"] = read_int32(open_file)
-    header_dict["afm_id"] = read_int32(open_file)
-    header_dict["file_id"] = read_int16(open_file)
-    header_dict["user_name"] = read_null_separated_utf8(open_file, length_bytes=header_dict["user_name_size"])
-    header_dict["scanner_sensitivity"] = read_float(open_file)
-    header_dict["phase_sensitivity"] = read_float(open_file)
-    header_dict["scan_direction"] = read_int32(open_file)
-    _ = skip_bytes(open_file, header_dict["comment_offset_size"])
-    comment = []
-    for _ in range(header_dict["comment_size"]):
-        comment.append(chr(read_int8(open_file)))
-    header_dict["comment_without_null"] = "".join([c for c in comment if c != "\x00"])
+    header_dict = ASD_HEADER_FIELDS_VERSION_0.read(open_file)
 
-    return header_dict
+    # The user name, the sensitivities after it, the comment offset and the comment are read together
+    user_name_size = header_dict["user_name_size"]
+    comment_start = user_name_size + ASD_HEADER_SENSITIVITY_FIELDS_VERSION_0.size + header_dict["comment_offset_size"]
+    tail = _read_exactly(open_file, comment_start + header_dict["comment_size"])
+    header_dict["user_name"] = _decode_text(tail[:user_name_size])
+    header_dict.update(ASD_HEADER_SENSITIVITY_FIELDS_VERSION_0.decode(tail, offset=user_name_size))
+    header_dict["comment_without_null"] = _decode_text(tail[comment_start:])
+
+    return _decode_header_values(header_dict)
 
 
 def read_header_file_version_1(open_file: BinaryIO) -> dict:
@@ -282,59 +566,14 @@ def read_header_file_version_1(open_file: BinaryIO) -> dict:
     dict
         Dictionary of metadata decoded from the file header.
     """
-    header_dict = {}
-    header_dict["header_length"] = read_int32(open_file)
-    header_dict["frame_header_length"] = read_int32(open_file)
-    header_dict["text_encoding"] = read_int32(open_file)
-    header_dict["user_name_size"] = read_int32(open_file)
-    header_dict["comment_size"] = read_int32(open_file)
-    header_dict["channel1"] = read_null_separated_utf8(open_file, length_bytes=4)
-    header_dict["channel2"] = read_null_separated_utf8(open_file, length_bytes=4)
-    header_dict["initial_frames"] = read_int32(open_file)
-    header_dict["num_frames"] = read_int32(open_file)
-    header_dict["scan_direction"] = read_int32(open_file)
-    header_dict["file_id"] = read_int32(open_file)
-    header_dict["x_pixels"] = read_int32(open_file)
-    header_dict["y_pixels"] = read_int32(open_file)
-    header_dict["x_nm"] = read_int32(open_file)
-    header_dict["y_nm"] = read_int32(open_file)
-    header_dict["is_averaged"] = read_bool(open_file)
-    header_dict["averaging_window"] = read_int32(open_file)
-    header_dict["year"] = read_int32(open_file)
-    header_dict["month"] = read_int32(open_file)
-    header_dict["day"] = read_int32(open_file)
-    header_dict["hour"] = read_int32(open_file)
-    header_dict["minute"] = read_int32(open_file)
-    header_dict["second"] = read_int32(open_file)
-    header_dict["x_rounding_degree"] = read_int32(open_file)
-    header_dict["y_rounding_degree"] = read_int32(open_file)
-    header_dict["frame_time"] = read_float(open_file)
-    header_dict["scanner_sensitivity"] = read_float(open_file)
-    header_dict["phase_sensitivity"] = read_float(open_file)
-    header_dict["offset"] = read_int32(open_file)
-    _ = skip_bytes(open_file, 12)
-    header_dict["afm_id"] = read_int32(open_file)
-    header_dict["analogue_digital_range"] = read_hex_u32(open_file)
-    header_dict["analogue_digital_data_bits_size"] = read_int32(open_file)
-    header_dict["analogue_digital_resolution"] = 2 ^ header_dict["analogue_digital_data_bits_size"]
-    header_dict["max_x_scan_range"] = read_float(open_file)
-    header_dict["max_y_scan_range"] = read_float(open_file)
-    header_dict["x_piezo_extension"] = read_float(open_file)
-    header_dict["y_piezo_extension"] = read_float(open_file)
-    header_dict["z_piezo_extension"] = read_float(open_file)
-    header_dict["z_piezo_gain"] = read_float(open_file)
-
-    user_name = []
-    for _ in range(header_dict["user_name_size"]):
-        user_name.append(chr(read_int8(open_file)))
-    header_dict["user_name"] = "".join([c for c in user_name if c != "\x00"])
-
-    comment = []
-    for _ in range(header_dict["comment_size"]):
-        comment.append(chr(read_int8(open_file)))
-    header_dict["comment_without_null"] = "".join([c for c in comment if c != "\x00"])
+    header_dict = ASD_HEADER_FIELDS_VERSION_1.read(open_file)
 
-    return header_dict
+    user_name_size = header_dict["user_name_size"]
+    tail = _read_exactly(open_file, user_name_size + header_dict["comment_size"])
+    header_dict["user_name"] = _decode_text(tail[:user_name_size])
+    header_dict["comment_without_null"] = _decode_text(tail[user_name_size:])
+
+    return _decode_header_values(header_dict)
 
 
 def read_header_file_version_2(open_file: BinaryIO) -> dict:
@@ -349,85 +588,49 @@ def read_header_file_version_2(open_file: BinaryIO) -> dict:
     Returns
     -------
     dict
-        Dictionary of metadata decoded from the file header.
+        Dictionary of metadata decoded from the file header, including the colour scale anchor points as N x 2 arrays
+        of (x, y) points.
     """
-    header_dict = {}
-    header_dict["header_length"] = read_int32(open_file)
-    header_dict["frame_header_length"] = read_int32(open_file)
-    header_dict["text_encoding"] = read_int32(open_file)
-    header_dict["user_name_size"] = read_int32(open_file)
-    header_dict["comment_size"] = read_int32(open_file)
-    header_dict["channel1"] = read_null_separated_utf8(open_file, length_bytes=4)
-    header_dict["channel2"] = read_null_separated_utf8(open_file, length_bytes=4)
-    header_dict["initial_frames"] = read_int32(open_file)
-    header_dict["num_frames"] = read_int32(open_file)
-    header_dict["scan_direction"] = read_int32(open_file)
-    header_dict["file_id"] = read_int32(open_file)
-    header_dict["x_pixels"] = read_int32(open_file)
-    header_dict["y_pixels"] = read_int32(open_file)
-    header_dict["x_nm"] = read_int32(open_file)
-    header_dict["y_nm"] = read_int32(open_file)
-    header_dict["is_averaged"] = read_bool(open_file)
-    header_dict["averaging_window"] = read_int32(open_file)
-    header_dict["year"] = read_int32(open_file)
-    header_dict["month"] = read_int32(open_file)
-    header_dict["day"] = read_int32(open_file)
-    header_dict["hour"] = read_int32(open_file)
-    header_dict["minute"] = read_int32(open_file)
-    header_dict["second"] = read_int32(open_file)
-    header_dict["x_rounding_degree"] = read_int32(open_file)
-    header_dict["y_rounding_degree"] = read_int32(open_file)
-    header_dict["frame_time"] = read_float(open_file)
-    header_dict["scanner_sensitivity"] = read_float(open_file)
-    header_dict["phase_sensitivity"] = read_float(open_file)
-    header_dict["offset"] = read_int32(open_file)
-    _ = skip_bytes(open_file, 12)
-    header_dict["afm_id"] = read_int32(open_file)
-    header_dict["analogue_digital_range"] = read_hex_u32(open_file)
-    header_dict["analogue_digital_data_bits_size"] = read_int32(open_file)
-    header_dict["analogue_digital_resolution"] = 2 ^ header_dict["analogue_digital_data_bits_size"]
-    header_dict["max_x_scan_range"] = read_float(open_file)
-    header_dict["max_y_scan_range"] = read_float(open_file)
-    header_dict["x_piezo_extension"] = read_float(open_file)
-    header_dict["y_piezo_extension"] = read_float(open_file)
-    header_dict["z_piezo_extension"] = read_float(open_file)
-    header_dict["z_piezo_gain"] = read_float(open_file)
-
-    user_name = []
-    for _ in range(header_dict["user_name_size"]):
-        user_name.append(chr(read_int8(open_file)))
-    header_dict["user_name"] = "".join([c for c in user_name if c != "\x00"])
-
-    comment = []
-    for _ in range(header_dict["comment_size"]):
-        comment.append(chr(read_int8(open_file)))
-    header_dict["comment_without_null"] = "".join([c for c in comment if c != "\x00"])
-
-    header_dict["number_of_frames"] = read_int32(open_file)
-    header_dict["is_x_feed_forward_integer"] = read_int32(open_file)
-    header_dict["is_x_feed_forward_double"] = read_double(open_file)
-    header_dict["max_colour_scale"] = read_int32(open_file)
-    header_dict["min_colour_scale"] = read_int32(open_file)
-    header_dict["length_red_anchor_points"] = read_int32(open_file)
-    header_dict["length_green_anchor_points"] = read_int32(open_file)
-    header_dict["length_blue_anchor_points"] = read_int32(open_file)
-
-    coords_red = []
-    for _ in range(header_dict["length_red_anchor_points"]):
-        anchor_x = read_int32(open_file)
-        anchor_y = read_int32(open_file)
-        coords_red.append((anchor_x, anchor_y))
-    coords_green = []
-    for _ in range(header_dict["length_green_anchor_points"]):
-        anchor_x = read_int32(open_file)
-        anchor_y = read_int32(open_file)
-        coords_green.append((anchor_x, anchor_y))
-    coords_blue = []
-    for _ in range(header_dict["length_blue_anchor_points"]):
-        anchor_x = read_int32(open_file)
-        anchor_y = read_int32(open_file)
-        coords_blue.append((anchor_x, anchor_y))
+    header_dict = ASD_HEADER_FIELDS_VERSION_1.read(open_file)
+
+    # The user name, the comment and the colour scale fields after them are read together
+    user_name_size = header_dict["user_name_size"]
+    comment_end = user_name_size + header_dict["comment_size"]
+    tail = _read_exactly(open_file, comment_end + ASD_HEADER_COLOUR_SCALE_FIELDS_VERSION_2.size)
+    header_dict["user_name"] = _decode_text(tail[:user_name_size])
+    header_dict["comment_without_null"] = _decode_text(tail[user_name_size:comment_end])
+    header_dict.update(ASD_HEADER_COLOUR_SCALE_FIELDS_VERSION_2.decode(tail, offset=comment_end))
+
+    # The anchor points of the three colours follow each other as (x, y) int32 pairs
+    lengths = [header_dict[f"length_{colour}_anchor_points"] for colour in ("red", "green", "blue")]
+    anchor_points = np.frombuffer(_read_exactly(open_file, sum(lengths) * 8), dtype="<i4").reshape(-1, 2)
+    start = 0
+    for colour, length in zip(("red", "green", "blue"), lengths):
+        header_dict[f"{colour}_anchor_points"] = anchor_points[start:start + length]
+        start += length
+
+    return _decode_header_values(header_dict)
+
+
+def _read_exactly(open_file: BinaryIO, size: int) -> bytes:
+    """Read size bytes from an open file, raising a ValueError if the file ends first."""
+    buffer = open_file.read(size)
+    if len(buffer) != size:
+        raise ValueError(f"The .asd file ended {size - len(buffer)} bytes before the end of its header.")
+    return buffer
+
 
+def _decode_text(raw: bytes) -> str:
+    """Decode a text field of the header, dropping the null bytes that pad or separate its characters."""
+    return raw.replace(b"\x00", b"").decode("latin-1")
+
+
+def _decode_header_values(header_dict: dict) -> dict:
+    """Convert the header fields that are not stored as they are used: the channel names and the AD range."""
+    header_dict["channel1"] = _decode_text(header_dict["channel1"])
+    header_dict["channel2"] = _decode_text(header_dict["channel2"])
+    header_dict["analogue_digital_range"] = hex(header_dict["analogue_digital_range"])
+    header_dict["analogue_digital_resolution"] = 2 ^ header_dict["analogue_digital_data_bits_size"]
     return header_dict
 
 
@@ -456,9 +659,8 @@ def read_channel_data(
 
     Returns
     -------
-    tuple[np.ndarray, list]
-        The extracted frame heightmap data as a N x W x H 3D numpy array
-        (number of frames x width of each frame x height of each frame) and
+    tuple[list, list]
+        The extracted float32 frame heightmaps, one H x W array per frame, and
         a list of frame-specific metadata dictionaries.
     """
     frames = []
@@ -485,8 +687,9 @@ def read_channel_data(
         frame_data = np.frombuffer(frame_data, dtype=np.int16)
         frame_data = frame_data.reshape((y_pixels, x_pixels))
 
-        # Multiply the frame data by -1 to adjust the display
-        frame_data = frame_data * -1
+        # Multiply the frame data by -1 to adjust the display. The product is float32, as in AsdFrameStack, so
+        # -32768 does not wrap around in int16
+        frame_data = np.multiply(frame_data, -1.0, dtype=np.float32)
 
         frames.append(frame_data)
 
@@ -505,6 +708,152 @@ def read_channel_data(
 
     return frames, frame_metadata_list
 
+def create_frame_dtype(frame_header_length: int, x_pixels: int, y_pixels: int) -> np.dtype:
+    """
+    Create the structured dtype of a single frame record (frame header + int16 pixel block) in a .asd file.
+
+    Parameters
+    ----------
+    frame_header_length : int
+        The length of each frame header in bytes, as given in the file header.
+    x_pixels : int
+        The width of each frame in pixels.
+    y_pixels : int
+        The height of each frame in pixels.
+
+    Returns
+    -------
+    np.dtype
+        Structured dtype with a "header" field (see `ASD_FRAME_HEADER_FIELDS`) and a "data" field holding the
+        y_pixels x x_pixels pixel block.
+    """
+    header_dtype = np.dtype(ASD_FRAME_HEADER_FIELDS)
+    if frame_header_length < header_dtype.itemsize:
+        raise ValueError(
+            f"Frame header length {frame_header_length} is shorter than the {header_dtype.itemsize} bytes "
+            "required by the frame header layout."
+        )
+
+    return np.dtype(
+        {
+            "names": ["header", "data"],
+            "formats": [header_dtype, ("<i2", (y_pixels, x_pixels))],
+            "offsets": [0, frame_header_length],
+            "itemsize": frame_header_length + x_pixels * y_pixels * 2,
+        }
+    )
+
+
+class AsdFrameStack:
+    """
+    Lazy view of the frames of one channel in a .asd file.
+
+    The frames are exposed through a structured dtype (see `create_frame_dtype`) so the pixel blocks are a strided
+    view into the frame records, which are usually memory-mapped from the file (see `open`), and nothing is decoded
+    until a frame is requested. The sign flip applied by `read_channel_data` is folded into `scale` and applied per
+    frame on access.
+
+    Parameters
+    ----------
+    records : np.ndarray
+        The frame records of the channel, with the dtype given by `create_frame_dtype`.
+    scale : float
+        Factor every raw int16 value is multiplied by on access. Defaults to -1.0 to match `read_channel_data`.
+    """
+
+    def __init__(self, records: np.ndarray, scale: float = -1.0):
+        self.scale = scale
+        self.shape = (len(records), *records.dtype["data"].shape)
+        self.dtype = np.dtype(np.float32)
+        self._records = records
+
+    @classmethod
+    def open(
+        cls,
+        file_path: Path,
+        offset: int,
+        num_frames: int,
+        frame_header_length: int,
+        x_pixels: int,
+        y_pixels: int,
+        scale: float = -1.0,
+        frames: range | None = None,
+    ) -> AsdFrameStack:
+        """
+        Memory-map the frames of one channel of a .asd file.
+
+        Parameters
+        ----------
+        file_path : Path
+            Path to the .asd file.
+        offset : int
+            Byte offset of the first frame header of the channel, see `asd_channel_offsets`.
+        num_frames : int
+            The number of frames in the channel.
+        frame_header_length : int
+            The length of each frame header in bytes.
+        x_pixels : int
+            The width of each frame in pixels.
+        y_pixels : int
+            The height of each frame in pixels.
+        scale : float
+            Factor every raw int16 value is multiplied by on access. Defaults to -1.0.
+        frames : range, optional
+            Frames of the channel to include, see `select_frames`. Defaults to every frame.
+
+        Returns
+        -------
+        AsdFrameStack
+            The lazy frame stack of the channel.
+        """
+        records = np.memmap(
+            Path(file_path),
+            dtype=create_frame_dtype(frame_header_length, x_pixels, y_pixels),
+            mode="r",
+            offset=offset,
+            shape=(num_frames,),
+        )
+        stack = cls(records, scale=scale)
+        return stack if frames is None else stack.select(frames)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def select(self, frames: range) -> AsdFrameStack:
+        """A stack of only the selected frames, as a strided view of the same records that reads no frames."""
+        return AsdFrameStack(self._records[as_slice(frames)], scale=self.scale)
+
+    def __getitem__(self, index) -> npt.NDArray[np.float32]:
+        """
+        Decode a single frame, a slice of frames or any other numpy index into the frame axis.
+
+        Only the pixels selected by `index` are read from the file.
+        """
+        raw = self._records["data"][index]
+        return np.multiply(raw, self.scale, dtype=np.float32).view(np.ndarray)
+
+    def __array__(self, dtype=None, copy=None) -> npt.NDArray:
+        frames = self[:]
+        return frames if dtype is None else frames.astype(dtype, copy=False)
+
+    @property
+    def raw_frames(self) -> npt.NDArray[np.int16]:
+        """Strided int16 view (N x H x W) of the undecoded pixel blocks."""
+        return self._records["data"]
+
+    def read_frame_headers(self) -> dict:
+        """
+        Decode the headers of all frames in one vectorised pass.
+
+        Returns
+        -------
+        dict
+            Mapping of each field in `ASD_FRAME_HEADER_FIELDS` to an array with one value per frame.
+        """
+        headers = self._records["header"]
+        return {name: np.array(headers[name]) for name, _ in ASD_FRAME_HEADER_FIELDS}
+
+
 def create_animation(frames: npt.NDArray) -> None:
     """
     Create animation from a numpy array of frames (2d numpy arrays).
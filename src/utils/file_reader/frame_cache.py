@@ -0,0 +1,201 @@
+from __future__ import annotations
+import os
+import time
+import shutil
+import tempfile
+import threading
+import pickle
+import hashlib
+import logging
+from pathlib import Path
+import numpy as np
+from utils.constants import FRAME_CACHE_DIRECTORY, FRAME_CACHE_BYTE_BUDGET
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Number of bytes hashed from the start and the end of a file for its content fingerprint
+FINGERPRINT_SAMPLE_BYTES = 1024 * 1024
+
+FRAMES_FILE_NAME = "frames.npy"
+METADATA_FILE_NAME = "metadata.pkl"
+
+# Temporary entries older than this were left behind by an interrupted write and are removed on eviction
+STALE_TEMPORARY_ENTRY_SECONDS = 24 * 60 * 60
+
+
+class DecodedFrameCache:
+    """
+    On-disk cache of decoded frame stacks and their standardised metadata.
+
+    Each entry is a directory holding the frames as a .npy file and the metadata and channel list as a pickle.
+    Entries are keyed by the file path, size, modification time, requested channel and a hash of the start and end
+    of the file, so any change to the file invalidates its entry. Cached frames are returned memory-mapped, so
+    reopening a file only reads the frames that are displayed.
+
+    Parameters
+    ----------
+    cache_directory : str or Path
+        Directory the cache entries are stored in. Defaults to FRAME_CACHE_DIRECTORY.
+    byte_budget : int
+        Maximum total size of the cache in bytes. Least recently used entries are evicted once it is exceeded.
+        Defaults to FRAME_CACHE_BYTE_BUDGET.
+    """
+
+    def __init__(self, cache_directory: str | Path = FRAME_CACHE_DIRECTORY, byte_budget: int = FRAME_CACHE_BYTE_BUDGET):
+        self.cache_directory = Path(cache_directory)
+        self.byte_budget = byte_budget
+        # Keys of the entries being written. A file selected again while its entry is still being written is not
+        # written a second time
+        self.writing_lock = threading.Lock()
+        self.writing_keys = set()
+
+    def get(self, file_path: str | Path, channel: str | None) -> tuple[np.ndarray, dict, list] | None:
+        """
+        Look up the decoded frames of a file.
+
+        Returns
+        -------
+        tuple[np.ndarray, dict, list] or None
+            The memory-mapped frames, the standardised metadata and the channel list, or None on a cache miss.
+        """
+        entry_directory = self._entry_directory(file_path, channel)
+        if entry_directory is None or not entry_directory.is_dir():
+            return None
+
+        try:
+            frames = np.load(entry_directory / FRAMES_FILE_NAME, mmap_mode="r")
+            with open(entry_directory / METADATA_FILE_NAME, "rb") as f:
+                metadata, channels = pickle.load(f)
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Discarding unreadable frame cache entry {entry_directory}: {e}")
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            return None
+
+        # Mark the entry as most recently used
+        os.utime(entry_directory)
+        return frames, metadata, channels
+
+    def put(self, file_path: str | Path, channel: str | None, frames, metadata: dict, channels: list,
+            background: bool = False):
+        """
+        Store the decoded frames of a file.
+
+        Frames are written one at a time, so lazy frame sources are never fully held in memory. Stacks larger than
+        the byte budget are not cached. If background is True the entry is written on a daemon thread, so that
+        decoding a lazy frame source does not block the caller.
+        """
+        if background:
+            threading.Thread(target=self.put, args=(file_path, channel, frames, metadata, channels), daemon=True).start()
+            return
+
+        frames_nbytes = int(np.prod(frames.shape)) * np.dtype(frames.dtype).itemsize
+        if frames_nbytes > self.byte_budget:
+            return
+
+        entry_directory = self._entry_directory(file_path, channel)
+        if entry_directory is None:
+            return
+
+        with self.writing_lock:
+            if entry_directory.name in self.writing_keys:
+                return
+            self.writing_keys.add(entry_directory.name)
+        try:
+            self._write_entry(entry_directory, file_path, frames, metadata, channels)
+        finally:
+            with self.writing_lock:
+                self.writing_keys.discard(entry_directory.name)
+
+        self.evict()
+
+    def _write_entry(self, entry_directory: Path, file_path: str | Path, frames, metadata: dict, channels: list):
+        # Write into a unique temporary directory and rename it, so a partially written entry is never visible
+        temporary_directory = None
+        try:
+            self.cache_directory.mkdir(parents=True, exist_ok=True)
+            temporary_directory = Path(tempfile.mkdtemp(prefix=f"{entry_directory.name}.", suffix=".tmp",
+                                                        dir=self.cache_directory))
+            cached_frames = np.lib.format.open_memmap(temporary_directory / FRAMES_FILE_NAME, mode="w+",
+                                                      dtype=frames.dtype, shape=tuple(frames.shape))
+            if len(frames.shape) == 3:
+                for frame_no in range(frames.shape[0]):
+                    cached_frames[frame_no] = frames[frame_no]
+            else:
+                cached_frames[...] = frames
+            cached_frames.flush()
+            del cached_frames
+
+            with open(temporary_directory / METADATA_FILE_NAME, "wb") as f:
+                pickle.dump((metadata, channels), f)
+
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            os.replace(temporary_directory, entry_directory)
+        except OSError as e:
+            logger.warning(f"Could not write frame cache entry for {file_path}: {e}")
+            if temporary_directory is not None:
+                shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits within the byte budget."""
+        if self.cache_directory.is_dir():
+            for temporary_directory in self.cache_directory.glob("*.tmp"):
+                try:
+                    if time.time() - temporary_directory.stat().st_mtime > STALE_TEMPORARY_ENTRY_SECONDS:
+                        shutil.rmtree(temporary_directory, ignore_errors=True)
+                except OSError:
+                    continue
+
+        entries = []
+        for entry_directory in self._list_entries():
+            try:
+                size = sum(f.stat().st_size for f in entry_directory.iterdir())
+                entries.append((entry_directory.stat().st_mtime, size, entry_directory))
+            except OSError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_directory in sorted(entries):
+            if total_size <= self.byte_budget:
+                break
+            shutil.rmtree(entry_directory, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        for entry_directory in self._list_entries():
+            shutil.rmtree(entry_directory, ignore_errors=True)
+
+    def _list_entries(self) -> list:
+        if not self.cache_directory.is_dir():
+            return []
+        return [path for path in self.cache_directory.iterdir() if path.is_dir() and not path.name.endswith(".tmp")]
+
+    def _entry_directory(self, file_path: str | Path, channel: str | None) -> Path | None:
+        try:
+            key = self.fingerprint(file_path, channel)
+        except OSError:
+            return None
+        return self.cache_directory / key
+
+    @staticmethod
+    def fingerprint(file_path: str | Path, channel: str | None) -> str:
+        """
+        Create the cache key of a file.
+
+        The key combines the resolved path, size, modification time and channel with a hash of the first and last
+        FINGERPRINT_SAMPLE_BYTES of the file. Hashing the whole file would cost as much as decoding it.
+        """
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+
+        content_hash = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as f:
+            content_hash.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+            if stat.st_size > FINGERPRINT_SAMPLE_BYTES:
+                f.seek(max(FINGERPRINT_SAMPLE_BYTES, stat.st_size - FINGERPRINT_SAMPLE_BYTES))
+                content_hash.update(f.read(FINGERPRINT_SAMPLE_BYTES))
+
+        key = f"{file_path}|{stat.st_size}|{stat.st_mtime_ns}|{channel}|{content_hash.hexdigest()}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+
+def select_frames(num_frames: int, frames: slice | None = None, stride: int = 1) -> range:
+    """
+    Frame numbers selected from a stack of num_frames frames.
+
+    Readers use the selection to seek to, or map, only the selected frames rather than slicing them from a full load.
+
+    Parameters
+    ----------
+    num_frames : int
+        The number of frames in the stack.
+    frames : slice, optional
+        Range of frames to select. Defaults to every frame.
+    stride : int
+        Only every stride-th frame of the range is selected. Defaults to 1.
+
+    Returns
+    -------
+    range
+        The selected frame numbers, in order.
+
+    Raises
+    ------
+    ValueError
+        If the stride is less than 1 or no frames are selected.
+    """
+    if stride < 1:
+        raise ValueError(f"The frame stride must be at least 1, not {stride}.")
+    selected = range(num_frames)[frames if frames is not None else slice(None)][::stride]
+    if len(selected) == 0:
+        raise ValueError(f"The frame selection {frames} with stride {stride} selects none of the {num_frames} frames.")
+    return selected
+
+
+def is_frame_selection(frames: slice | None = None, stride: int = 1) -> bool:
+    """Return True if frames and stride select anything other than every frame."""
+    return (frames is not None and frames != slice(None)) or stride != 1
+
+
+def as_slice(selected: range) -> slice:
+    """The slice that indexes the frames of a selection, see select_frames."""
+    # A range counting down to frame 0 stops at -1, which as a slice stop would count from the end
+    return slice(selected.start, selected.stop if selected.stop >= 0 else None, selected.step)
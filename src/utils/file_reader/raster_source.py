@@ -0,0 +1,87 @@
+from __future__ import annotations
+from typing import Callable, Iterator
+import numpy as np
+
+# Number of rows decoded at a time when streaming, chosen so a block of a 8192 pixel wide float64 image is 16 MiB
+ROW_BLOCK_ROWS = 256
+TILE_SHAPE = (512, 512)
+
+
+class RasterFrameSource:
+    """
+    Lazy single frame source over the raw values of a large image, decoded in row blocks or tiles on demand.
+
+    The raw array is usually a memory map of the file, with any orientation fixes (flips, rotations) already applied
+    as numpy views, so neither the raw data nor a reoriented copy is ever held in memory. Only the rows or tiles that
+    are requested are converted to physical units.
+
+    Parameters
+    ----------
+    raw : np.ndarray
+        The raw 2D values in display orientation. Typically a view of an np.memmap.
+    decode : Callable[[np.ndarray], np.ndarray]
+        Converts a block of raw values to physical units. Must be element-wise, so any block can be decoded on its
+        own, and must return a new array.
+    """
+
+    def __init__(self, raw: np.ndarray, decode: Callable[[np.ndarray], np.ndarray]):
+        self.raw = raw
+        self.decode = decode
+        self.shape = (1, *raw.shape)
+        # The decoded dtype depends on the raw dtype and the decode arithmetic, so take it from a decoded sample
+        self.dtype = decode(raw[:1, :1]).dtype
+
+    def __len__(self) -> int:
+        return 1
+
+    def __getitem__(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            if index not in (0, -1):
+                raise IndexError(f"Frame {index} is out of range for 1 frame.")
+            return self.read_rows(0, self.shape[1])
+        frame_numbers = range(*index.indices(1)) if isinstance(index, slice) else np.arange(1)[index]
+        frames = np.empty((len(frame_numbers), *self.shape[1:]), dtype=self.dtype)
+        for i in range(len(frame_numbers)):
+            frames[i] = self.read_rows(0, self.shape[1])
+        return frames
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        frames = self[:]
+        return frames if dtype is None else frames.astype(dtype, copy=False)
+
+    def read_rows(self, start: int, stop: int) -> np.ndarray:
+        """Decode rows start to stop of the frame."""
+        return self.decode(self.raw[start:stop])
+
+    def read_tile(self, rows: slice, cols: slice) -> np.ndarray:
+        """Decode a rectangular region of the frame."""
+        return self.decode(self.raw[rows, cols])
+
+    def iter_row_blocks(self, block_rows: int = ROW_BLOCK_ROWS) -> Iterator[tuple[slice, np.ndarray]]:
+        """
+        Decode the frame in blocks of whole rows.
+
+        Yields
+        ------
+        tuple[slice, np.ndarray]
+            The rows of the frame the block covers and the decoded block.
+        """
+        for start in range(0, self.shape[1], block_rows):
+            stop = min(start + block_rows, self.shape[1])
+            yield slice(start, stop), self.read_rows(start, stop)
+
+    def iter_tiles(self, tile_shape: tuple = TILE_SHAPE) -> Iterator[tuple[tuple[slice, slice], np.ndarray]]:
+        """
+        Decode the frame in tiles, row by row of tiles. Edge tiles are smaller than tile_shape.
+
+        Yields
+        ------
+        tuple[tuple[slice, slice], np.ndarray]
+            The (rows, cols) region of the frame the tile covers and the decoded tile.
+        """
+        tile_rows, tile_cols = tile_shape
+        for row_start in range(0, self.shape[1], tile_rows):
+            rows = slice(row_start, min(row_start + tile_rows, self.shape[1]))
+            for col_start in range(0, self.shape[2], tile_cols):
+                cols = slice(col_start, min(col_start + tile_cols, self.shape[2]))
+                yield (rows, cols), self.read_tile(rows, cols)
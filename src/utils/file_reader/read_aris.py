@@ -5,12 +5,91 @@ from pathlib import Path
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .frame_selection import select_frames
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def open_aris(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+
+def read_image(dataset: h5py.Dataset, out: np.ndarray):
+    """
+    Read an Image dataset into a preallocated float32 frame, with NaN pixels set to 0 and heights converted to nm.
+
+    The dataset is converted to float32 by HDF5 as it is read, and the NaN fill and scaling are applied while the
+    frame is still in cache, so the frame is only written once and never held as float64.
+    """
+    # Images are sometimes stored transposed, (x, y) rather than (y, x). They are read in storage order, as before
+    dataset.read_direct(out.reshape(dataset.shape))
+    out[np.isnan(out)] = 0
+    out *= 1e9
+
+
+class ArisFrameSource:
+    """
+    Lazy stack of the frames of one channel in an .ARIS file.
+
+    The HDF5 file is only opened when the first frame is requested, and each frame is read, NaN filled and
+    converted to nm on access, see read_image.
+
+    Parameters
+    ----------
+    file_path : Path or str
+        Path to the .aris file.
+    dataset_paths : list
+        HDF5 paths of the Image dataset of every frame, in frame order.
+    y_pixels : int
+        The height of each frame in pixels.
+    x_pixels : int
+        The width of each frame in pixels.
+    """
+
+    def __init__(self, file_path: Path | str, dataset_paths: list, y_pixels: int, x_pixels: int):
+        self.file_path = Path(file_path)
+        self.dataset_paths = dataset_paths
+        self.shape = (len(dataset_paths), int(y_pixels), int(x_pixels))
+        self.dtype = np.dtype(np.float32)
+        self._file = None
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __getitem__(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            if not -len(self) <= index < len(self):
+                raise IndexError(f"Frame {index} is out of range for {len(self)} frames.")
+            frame = np.empty(self.shape[1:], dtype=self.dtype)
+            self._read_frame(int(index) % len(self), frame)
+            return frame
+        if isinstance(index, slice):
+            frame_numbers = range(*index.indices(len(self)))
+        else:
+            frame_numbers = np.arange(len(self))[index]
+        frames = np.empty((len(frame_numbers), *self.shape[1:]), dtype=self.dtype)
+        for i, frame_no in enumerate(frame_numbers):
+            self._read_frame(int(frame_no), frames[i])
+        return frames
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        frames = self[:]
+        return frames if dtype is None else frames.astype(dtype, copy=False)
+
+    def _read_frame(self, frame_no: int, out: np.ndarray):
+        if self._file is None:
+            self._file = h5py.File(self.file_path, 'r')
+        read_image(self._file[self.dataset_paths[frame_no]], out)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        self.close()
+
+
+def open_aris(file_path: Path | str, channel: str, lazy: bool = False, frames: slice | None = None,
+              stride: int = 1) -> tuple[np.ndarray | ArisFrameSource, dict, list]:
     """
     Extract image and metadata from the ARIS file.
 
@@ -20,10 +99,17 @@ def open_aris(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, li
         Path to the .aris file.
     channel : str
         Channel name to extract from the .aris file.
+    lazy : bool
+        If True, the frames are returned as an ArisFrameSource that reads each frame on access instead of loading
+        every frame up front. Defaults to False.
+    frames : slice, optional
+        Range of frames to load, e.g. for a quick preview of a long movie. Defaults to every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
 
     Returns
     -------
-    tuple[np.ndarray, dict, list]
+    tuple[np.ndarray | ArisFrameSource, dict, list]
         A tuple containing the image, its metadata, and parameter values.
 
     Raises
@@ -34,139 +120,19 @@ def open_aris(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, li
         If the channel is not found in the .aris file.
     """
     file_path = Path(file_path)
-    
+
     try:
         with h5py.File(file_path, 'r') as file:
-            # Explore file structure to identify where metadata might be stored
-
-            info = file['/DataSet']
-            datainfo = file['/DataSetInfo']
-
-            Framename = [key for key in info['Resolution 0'].keys() if 'Frame ' in key]
-            newStr = [name.split('Frame ')[-1] for name in Framename]
-            X = list(map(int, newStr))
-            M = sorted(range(len(X)), key=lambda k: X[k])
-
-            ch_info = file['/DataSetInfo/Global/Channels']
-            found_ch = False
-            s = {'channels': []}
-            for ch_group in ch_info.keys():
-                ch_name = ch_group.split('/')[-1]
-                s['channels'].append(ch_name)
-                if channel == ch_name:
-                    found_ch = True
-
-            if not found_ch:
-                s['channel'] = 'HeightTrace'
-                channel = 'HeightTrace'
-            else:
-                s['channel'] = channel
-
-            start_dim_scaling = file[f'/DataSetInfo/Global/Channels/{channel}/ImageDims'].attrs['DimScaling']
-
-            if isinstance(start_dim_scaling, np.ndarray):
-                scale0 = start_dim_scaling[0][1]
+            file_metadata, channels, dataset_paths = _read_aris_metadata(file, channel, frames, stride)
+            if lazy:
+                im = ArisFrameSource(file_path, dataset_paths, file_metadata["Y Pixel Dimensions"],
+                                     file_metadata["X Pixel Dimensions"])
             else:
-                scale0 = start_dim_scaling
-
-            scan_size_list = datainfo['Frames']
-            scan_size_frame = []
-            ScanSize = []
-
-            for frame in scan_size_list:
-                try:
-                    if isinstance(frame, h5py.Group):
-                        print(frame)
-                        temp = frame.name.split('Frame ')[-1]
-                        scan_size_frame.append(int(temp))
-                        temp_attrs = frame[f'Channels/[{channel}]/ImageDims'].attrs
-                        print("frame", temp_attrs)
-                        ScanSize.append(temp_attrs['ScanSize'])
-                except Exception as e:
-                    logger.error(f"Error processing frame {frame}: {e}")
-
-            for frame_no in range(len(scan_size_list)):
-                # Formulate the lines needed to access frame metadata
-                frame_name = f"Frame {frame_no}"
-                path_to_metadata = "/DataSetInfo/Frames/{frame_name}"
-
-                # print(f'/DataSetInfo/Frames/{frame_name}/Parameters/Scan'.attrs.get)
-                try:
-                    x_range = file[f'/DataSetInfo/Frames/{frame_name}/Parameters/Scan'].attrs.get("ScanSize", scale0)
-                except KeyError:
-                    x_range = scale0
-
-                ScanSize.append(x_range * 1e9)
-
-            # Attempt to read frame acquisition time from specific parameters
-            s['yPixel'] = datainfo.attrs.get('ScanLines', None)
-            s['xPixel'] = datainfo.attrs.get('ScanPoints', None)
-            
-            # Calculate FPS from frame acquisition time
-            fps = 1
-
-            # Dynamically determine yPixel and xPixel from the first frame's shape
-            if s['yPixel'] is None or s['xPixel'] is None:
-                first_frame_loc = f'/DataSet/Resolution 0/Frame {X[M[0]]}/{channel}/Image'
-                first_frame_shape = file[first_frame_loc].shape
-                s['yPixel'], s['xPixel'] = first_frame_shape
-
-            s['numberofFrames'] = len(M)
-
-            # Load Images and attach timestamps
-            im = np.zeros((s['numberofFrames'], s['yPixel'], s['xPixel']))
-
-            # Calculate timestamps for each frame
-            # Try accessing the Series Time dataset for timing information
-            try:
-                time_series = file['/DataSetInfo/Series/Time']
-                time_stamps = np.array(time_series)
-            except KeyError as e:
-                print(f"Time Series not found: {e}")
-                time_stamps = np.arange(s['numberofFrames'])  # Default to sequential if missing
-
-            # Compute FPS if timestamps are available
-            if len(time_stamps) > 1:
-                frame_interval = time_stamps[1] - time_stamps[0]  # Time difference between the first two frames
-                fps = 1.0 / frame_interval if frame_interval > 0 else 1.0  # Prevent division by zero
-
-            for i in range(len(M)):
-                img_loc = f'/DataSet/Resolution 0/Frame {X[M[i]]}'
-                image_data = file[f'{img_loc}/{channel}/Image'][()]
-                
-                # Check the shape of the image data before transposing
-                if image_data.shape == (s['xPixel'], s['yPixel']):
-                    image_data.shape = (s['yPixel'], s['xPixel'])
-
-                im[i] = image_data
-
-            im[np.isnan(im)] = 0
-
-            im *= 1e9
-
-            # Calculate additional parameters
-            line_rate = s['yPixel'] * fps if s['yPixel'] else 0
-            pixel_to_nanometre_scaling_factor = [s['xPixel'] / ScanSize[frame_no] for frame_no in range(s.get("numberofFrames"))] 
-
-            values = [
-                s.get('numberofFrames', 'N/A'),
-                ScanSize,
-                fps,
-                line_rate,
-                s.get('yPixel', 'N/A'),
-                s.get('xPixel', 'N/A'),
-                pixel_to_nanometre_scaling_factor,
-                channel,
-                time_stamps
-            ]
-
-            if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
-                raise ValueError(f"The length of the values in .ARIS does not match the required metadata keys.")
-
-            # Create the metadata dictionary
-            file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
-
-            channels = s['channels']
+                # Each frame is read straight into its slot of one preallocated float32 buffer
+                im = np.empty((len(dataset_paths), file_metadata["Y Pixel Dimensions"],
+                               file_metadata["X Pixel Dimensions"]), dtype=np.float32)
+                for i, dataset_path in enumerate(dataset_paths):
+                    read_image(file[dataset_path], im[i])
 
     except FileNotFoundError:
         logger.error(f"[{file_path}] File not found: {file_path}")
@@ -180,6 +146,131 @@ def open_aris(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, li
 
     return im, file_metadata, channels
 
+def _read_aris_metadata(file: h5py.File, channel: str, frames: slice | None = None, stride: int = 1,
+                        first_scan_size_only: bool = False) -> tuple[dict, list, list]:
+    """
+    Read the standardised metadata, channel names and Image dataset paths of the selected frames of an open .ARIS file.
+
+    Only the scan parameters of the selected frames are read. With first_scan_size_only True, only those of the
+    first selected frame are, and the X range and scaling lists hold that single frame.
+    """
+    info = file['/DataSet']
+    datainfo = file['/DataSetInfo']
+
+    # Frame groups are sorted by frame number once, then the selected frames are taken from them
+    frame_numbers = sorted(int(key.split('Frame ')[-1]) for key in info['Resolution 0'].keys()
+                           if 'Frame ' in key)
+    selected = select_frames(len(frame_numbers), frames, stride)
+
+    ch_info = file['/DataSetInfo/Global/Channels']
+    found_ch = False
+    s = {'channels': []}
+    for ch_group in ch_info.keys():
+        ch_name = ch_group.split('/')[-1]
+        s['channels'].append(ch_name)
+        if channel == ch_name:
+            found_ch = True
+
+    if not found_ch:
+        s['channel'] = 'HeightTrace'
+        channel = 'HeightTrace'
+    else:
+        s['channel'] = channel
+
+    start_dim_scaling = file[f'/DataSetInfo/Global/Channels/{channel}/ImageDims'].attrs['DimScaling']
+
+    if isinstance(start_dim_scaling, np.ndarray):
+        scale0 = start_dim_scaling[0][1]
+    else:
+        scale0 = start_dim_scaling
+
+    # The scan size of each frame is an attribute of its own group, so only the groups of the frames that are used
+    # are opened
+    ScanSize = []
+    for frame_no in (selected[:1] if first_scan_size_only else selected):
+        # Formulate the lines needed to access frame metadata, frame_no is a position in the sorted frame groups
+        frame_name = f"Frame {frame_numbers[frame_no]}"
+        try:
+            x_range = file[f'/DataSetInfo/Frames/{frame_name}/Parameters/Scan'].attrs.get("ScanSize", scale0)
+        except KeyError:
+            x_range = scale0
+
+        ScanSize.append(x_range * 1e9)
+
+    # Attempt to read frame acquisition time from specific parameters
+    s['yPixel'] = datainfo.attrs.get('ScanLines', None)
+    s['xPixel'] = datainfo.attrs.get('ScanPoints', None)
+
+    # Calculate FPS from frame acquisition time
+    fps = 1
+
+    # Dynamically determine yPixel and xPixel from the first frame's shape
+    if s['yPixel'] is None or s['xPixel'] is None:
+        first_frame_loc = f'/DataSet/Resolution 0/Frame {frame_numbers[0]}/{channel}/Image'
+        first_frame_shape = file[first_frame_loc].shape
+        s['yPixel'], s['xPixel'] = first_frame_shape
+
+    s['numberofFrames'] = len(selected)
+
+    # Calculate timestamps for each frame
+    # Try accessing the Series Time dataset for timing information
+    try:
+        time_series = file['/DataSetInfo/Series/Time']
+        time_stamps = np.array(time_series)
+    except KeyError as e:
+        print(f"Time Series not found: {e}")
+        time_stamps = np.arange(len(frame_numbers))  # Default to sequential if missing
+    if len(time_stamps) < len(frame_numbers):
+        print(f"Time Series has {len(time_stamps)} entries for {len(frame_numbers)} frames, using sequential times")
+        time_stamps = np.arange(len(frame_numbers))
+    time_stamps = time_stamps[np.asarray(selected, dtype=np.intp)]
+
+    # Compute FPS if timestamps are available
+    if len(time_stamps) > 1:
+        frame_interval = time_stamps[1] - time_stamps[0]  # Time difference between the first two frames
+        fps = 1.0 / frame_interval if frame_interval > 0 else 1.0  # Prevent division by zero
+
+    dataset_paths = [f'/DataSet/Resolution 0/Frame {frame_numbers[i]}/{channel}/Image' for i in selected]
+
+    # Calculate additional parameters
+    line_rate = s['yPixel'] * fps if s['yPixel'] else 0
+    pixel_to_nanometre_scaling_factor = [s['xPixel'] / scan_size for scan_size in ScanSize]
+
+    values = [
+        s.get('numberofFrames', 'N/A'),
+        ScanSize,
+        fps,
+        line_rate,
+        s.get('yPixel', 'N/A'),
+        s.get('xPixel', 'N/A'),
+        pixel_to_nanometre_scaling_factor,
+        channel,
+        time_stamps
+    ]
+
+    if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
+        raise ValueError(f"The length of the values in .ARIS does not match the required metadata keys.")
+
+    # Create the metadata dictionary
+    file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+
+    return file_metadata, s['channels'], dataset_paths
+
+def probe_aris(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of an .ARIS file from its HDF5 attributes, without reading any frames.
+
+    Only the scan parameters of the first frame are read, so the X range and scaling lists hold the first frame only.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_aris.
+    """
+    with h5py.File(file_path, 'r') as file:
+        file_metadata, channels, _ = _read_aris_metadata(file, channel, first_scan_size_only=True)
+    return file_metadata, channels
+
 if __name__ == "__main__":
     file_path = 'data/00T2_P3_0000.ARIS'
     channel = 'HeightTrace'  # Replace with the appropriate channel name
@@ -1,5 +1,10 @@
+import os
+import multiprocessing
 from pathlib import Path
 import logging
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from utils.file_reader.read_ibw import open_ibw
 from utils.file_reader.read_jpk import open_jpk
 from utils.file_reader.read_nhf import open_nhf
@@ -7,25 +12,68 @@ from utils.file_reader.read_spm import open_spm
 from utils.file_reader.read_gwy import open_gwy
 import time
 from utils.constants import IMG_EXTS
+from utils.file_reader.frame_selection import select_frames
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# pySPM, gwy and igor2 parse files in pure Python and hold the GIL, so they are spread across processes.
+# h5py (.nhf) and tifffile (.jpk) spend most of their time in C and release the GIL, so threads suffice
+PROCESS_POOL_FORMATS = ['.spm', '.gwy', '.ibw']
+MAX_LOADER_WORKERS = os.cpu_count() or 1
+
+
+def _open_series_file(file_path: str, dominant_format: str) -> tuple:
+    """Open a single file of a folder series. Defined at module level so it can be sent to worker processes."""
+    if dominant_format == '.nhf':
+        return open_nhf(file_path, 'Topography')
+    elif dominant_format == '.jpk':
+        return open_jpk(file_path, "height_trace")
+    elif dominant_format == '.ibw':
+        return open_ibw(file_path, 1)
+    elif dominant_format == '.spm':
+        return open_spm(file_path, "Height")
+    elif dominant_format == '.gwy':
+        return open_gwy(file_path, 1)
+    raise ValueError(f"Unsupported folder series format: {dominant_format}")
+
+
 class ImageLoader:
-    def __init__(self, folder_path: str):
+    """
+    Loads the files of an image series folder as the frames of one movie.
+
+    Parameters
+    ----------
+    folder_path : str
+        The image series folder.
+    frames : slice, optional
+        Range of files to load, in name order. Defaults to every file.
+    stride : int
+        Only load every stride-th file of the range. Defaults to 1. Files that are not selected are never opened, and
+        timestamps are measured from the first file loaded.
+    """
+
+    def __init__(self, folder_path: str, frames: slice | None = None, stride: int = 1):
         self._folder_path = folder_path
         self._dominant_format, self._file_paths = self._check_folder()
-        
+        # Number of files between consecutive loaded files, which sets the time between frames
+        self._frame_step = 1
+
         if self._dominant_format is not None:  # Only proceed if criteria met
-            start_time = time.time()  # Start timing before loading images
+            selected = select_frames(len(self._file_paths), frames, stride)
+            self._file_paths = [self._file_paths[i] for i in selected]
+            self._frame_step = abs(selected.step)
+            start_time = time.perf_counter()  # Start timing before loading images
             self._data_dict = self._load_images()
-            end_time = time.time()  # End timing after loading images
+            end_time = time.perf_counter()  # End timing after loading images
 
             self._load_time = end_time - start_time  # Calculate the duration
+            self._loaded_bytes = sum(os.path.getsize(file_path) for file_path in self._file_paths)
         else:
             self._data_dict = {}
             self._load_time = 0
+            self._loaded_bytes = 0
 
     def _check_folder(self):
         file_list = list(Path(self._folder_path).glob('*'))  # Only look at files directly inside the folder
@@ -49,55 +97,88 @@ class ImageLoader:
 
         return dominant_format, dominant_format_files
     
-    def get_load_time(self):
-        return self._load_time
+    def get_load_time(self) -> dict:
+        """
+        Return how long the folder took to load and the achieved throughput.
+
+        Returns
+        -------
+        dict
+            "Seconds" taken to load every file, and the throughput in "Files/s" and "MB/s".
+        """
+        if self._load_time > 0:
+            files_per_second = len(self._file_paths) / self._load_time
+            mb_per_second = self._loaded_bytes / 1e6 / self._load_time
+        else:
+            files_per_second = 0
+            mb_per_second = 0
+
+        return {"Seconds": self._load_time, "Files/s": files_per_second, "MB/s": mb_per_second}
+
+    def _read_files(self) -> list:
+        """
+        Open every file of the series concurrently.
+
+        Results are returned in the same order as self._file_paths, regardless of the order the workers finish in.
+        """
+        max_workers = max(1, min(MAX_LOADER_WORKERS, len(self._file_paths)))
+
+        if self._dominant_format in PROCESS_POOL_FORMATS:
+            # Send files to the workers in batches to amortise the inter-process overhead
+            chunksize = max(1, len(self._file_paths) // (max_workers * 4))
+            # Folders are loaded on a worker thread of the file load scheduler, and forking a process with other
+            # threads running (Qt, h5py) can deadlock the child, so workers are spawned instead
+            try:
+                with ProcessPoolExecutor(max_workers=max_workers,
+                                         mp_context=multiprocessing.get_context("spawn")) as executor:
+                    return list(executor.map(_open_series_file, self._file_paths, repeat(self._dominant_format), chunksize=chunksize))
+            except BrokenProcessPool as e:
+                logger.warning(f"Process pool failed ({e}), loading {self._folder_path} with threads instead")
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_open_series_file, self._file_paths, repeat(self._dominant_format)))
 
     def _load_images(self):
         data_dict = {}
         time_stamps = []
         elapsed_time = 0
 
-        for file_path in self._file_paths:
+        for file_path, (im, meta, channels) in zip(self._file_paths, self._read_files()):
             if self._dominant_format == '.nhf':
-                im, meta, channels = open_nhf(file_path, 'Topography')
                 # Calculate elapsed time for NHF files
                 fps = meta.get('Speed (FPS)', 0)
                 if fps > 0:
                     meta['Timestamp'] = elapsed_time
-                    elapsed_time += 1 / fps
+                    elapsed_time += self._frame_step / fps
                 else:
                     meta['Timestamp'] = elapsed_time
                 time_stamps.append(meta['Timestamp'])
             elif self._dominant_format == '.jpk':
-                im, meta, channels = open_jpk(file_path, "height_trace")
                 # Calculate elapsed time for JPK files
                 fps = meta.get('Speed (FPS)', 0)
                 if fps > 0:
                     meta['Timestamp'] = elapsed_time
-                    elapsed_time += 1 / fps
+                    elapsed_time += self._frame_step / fps
                 else:
                     meta['Timestamp'] = elapsed_time
                 time_stamps.append(meta['Timestamp'])
             elif self._dominant_format == '.ibw':
-                im, meta, channels = open_ibw(file_path, 1)
                 # Calculate elapsed time for IBW files
                 fps = meta.get('Speed (FPS)', 0)
                 if fps > 0:
                     meta['Timestamp'] = elapsed_time
-                    elapsed_time += 1 / fps
+                    elapsed_time += self._frame_step / fps
                 else:
                     meta['Timestamp'] = elapsed_time
                 time_stamps.append(meta['Timestamp'])
             elif self._dominant_format == '.spm':
-                im, meta, channels = open_spm(file_path, "Height")
                 time_stamps.append(meta['Timestamp'])  # Extract timestamp from metadata
             elif self._dominant_format == '.gwy':
-                im, meta, channels = open_gwy(file_path, 1)
                 # Calculate elapsed time for GWY files
                 fps = meta.get('Speed (FPS)', 0)
                 if fps > 0:
                     meta['Timestamp'] = elapsed_time
-                    elapsed_time += 1 / fps
+                    elapsed_time += self._frame_step / fps
                 else:
                     meta['Timestamp'] = elapsed_time
                 time_stamps.append(meta['Timestamp'])
@@ -1,81 +1,198 @@
 from __future__ import annotations
 from pathlib import Path
+import mmap
 import struct
 import numpy as np
 import logging
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .frame_selection import select_frames
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def read_str(f):
-    result = bytearray()
-    while True:
-        char = f.read(1)
-        if char == b'\x00':
-            break
-        result.extend(char)
-    return result.decode('utf-8')
-
-def read_component(f):
-    name = read_str(f)
-    dtype = f.read(1).decode('utf-8')
-
-    if dtype == 'b':
-        value = struct.unpack('<B', f.read(1))[0]
-    elif dtype == 'c':
-        value = f.read(1).decode('utf-8')
-    elif dtype == 'i':
-        value = struct.unpack('<i', f.read(4))[0]
-    elif dtype == 'q':
-        value = struct.unpack('<q', f.read(8))[0]
-    elif dtype == 'd':
-        value = struct.unpack('<d', f.read(8))[0]
-    elif dtype == 's':
-        value = read_str(f)
-    elif dtype == 'o':
-        sub_obj_name = read_str(f)
-        sub_obj_size = struct.unpack('<I', f.read(4))[0]
-        value = read_object(f, sub_obj_size)
-    elif dtype == 'D':
-        size = struct.unpack('<I', f.read(4))[0]
-        value = np.frombuffer(f.read(size * 8), dtype=np.float64)
-    elif dtype == 'S':  # Handling 'S' type for strings
-        length = struct.unpack('<I', f.read(4))[0]
-        value = f.read(length).decode('utf-8')
-    elif dtype == 'p':  # Handling 'p' type for binary data
-        length = struct.unpack('<I', f.read(4))[0]
-        value = f.read(length)
-    else:
-        raise ValueError(f"Unsupported data type: {dtype}")
-
-    return name, dtype, value
-
-def read_object(f, size):
-    obj = {}
-    start_pos = f.tell()
-    while f.tell() - start_pos < size:
-        name, dtype, value = read_component(f)
-        obj[name] = value
-    return obj
-
-def read_datafield(f, size):
-    datafield = {}
-    start_pos = f.tell()
-    while f.tell() - start_pos < size:
-        name, dtype, value = read_component(f)
-        datafield[name] = value
-
-    xres = datafield['xres']
-    yres = datafield['yres']
-    data = datafield['data'].reshape((yres, xres)).T
-    datafield['data'] = data
-    return datafield
-
-def open_gwy(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+# Formats of the fixed-size component types, and the item formats of the array types (upper case)
+GWY_SCALAR_FORMATS = {'b': '<B', 'c': '<c', 'i': '<i', 'q': '<q', 'd': '<d'}
+GWY_ARRAY_DTYPES = {'C': np.dtype('S1'), 'I': np.dtype('<i4'), 'Q': np.dtype('<i8'), 'D': np.dtype('<f8')}
+
+GWY_MAGIC = b'GWYP'
+GWY_UINT32 = struct.Struct('<I')
+
+
+def read_str(buffer, offset: int) -> tuple[str, int]:
+    """Read a null-terminated string from a buffer, returning it and the offset just after its terminator."""
+    end = buffer.find(b'\x00', offset)
+    if end < 0:
+        raise ValueError("Unterminated string in GWY file")
+    return bytes(buffer[offset:end]).decode('utf-8'), end + 1
+
+
+def read_object_header(buffer, offset: int) -> tuple[str, int, int]:
+    """
+    Read the type name and size of a serialised GWY object.
+
+    Returns
+    -------
+    tuple[str, int, int]
+        The object type name, e.g. 'GwyDataField', the size of its components in bytes and the offset of the first of
+        them.
+    """
+    type_name, offset = read_str(buffer, offset)
+    size = GWY_UINT32.unpack_from(buffer, offset)[0]
+    return type_name, size, offset + 4
+
+
+def index_components(buffer, start: int, end: int) -> dict:
+    """
+    Index the components of a GWY object without decoding them.
+
+    Arrays and nested objects are stepped over using their sizes, so indexing only touches the component names.
+
+    Parameters
+    ----------
+    buffer : bytes or mmap.mmap
+        Buffer holding the serialised object.
+    start, end : int
+        Offsets of the first component of the object and of the end of its last component.
+
+    Returns
+    -------
+    dict
+        (type character, value offset, value end) of each component, keyed by the component name.
+    """
+    components = {}
+    offset = start
+    while offset < end:
+        name, offset = read_str(buffer, offset)
+        dtype = chr(buffer[offset])
+        value_offset = offset + 1
+        offset = _skip_value(buffer, dtype, value_offset)
+        components[name] = (dtype, value_offset, offset)
+    return components
+
+
+def _skip_value(buffer, dtype: str, offset: int) -> int:
+    """Offset just after a component value of type dtype starting at offset."""
+    if dtype in GWY_SCALAR_FORMATS:
+        return offset + struct.calcsize(GWY_SCALAR_FORMATS[dtype])
+    if dtype == 's':
+        return read_str(buffer, offset)[1]
+    if dtype == 'o':
+        _, size, offset = read_object_header(buffer, offset)
+        return offset + size
+
+    count = GWY_UINT32.unpack_from(buffer, offset)[0]
+    offset += 4
+    if dtype in GWY_ARRAY_DTYPES:
+        return offset + count * GWY_ARRAY_DTYPES[dtype].itemsize
+    if dtype == 'S':
+        for _ in range(count):
+            offset = read_str(buffer, offset)[1]
+        return offset
+    if dtype == 'O':
+        for _ in range(count):
+            offset = _skip_value(buffer, 'o', offset)
+        return offset
+    raise ValueError(f"Unsupported data type: {dtype}")
+
+
+def read_value(buffer, dtype: str, offset: int, skip_arrays: bool = False):
+    """
+    Decode a component value of type dtype starting at offset.
+
+    Nested objects are decoded to dictionaries of their components. If skip_arrays is True, arrays are not decoded
+    and their value is None.
+    """
+    if dtype in GWY_SCALAR_FORMATS:
+        value = struct.unpack_from(GWY_SCALAR_FORMATS[dtype], buffer, offset)[0]
+        return value.decode('utf-8') if dtype == 'c' else value
+    if dtype == 's':
+        return read_str(buffer, offset)[0]
+    if dtype == 'o':
+        _, size, offset = read_object_header(buffer, offset)
+        return read_object(buffer, index_components(buffer, offset, offset + size), skip_arrays)
+    if skip_arrays:
+        return None
+
+    count = GWY_UINT32.unpack_from(buffer, offset)[0]
+    offset += 4
+    if dtype in GWY_ARRAY_DTYPES:
+        # Copied out of the buffer, which may be a memory map that is closed once the file has been read
+        return np.frombuffer(buffer, dtype=GWY_ARRAY_DTYPES[dtype], count=count, offset=offset).copy()
+    values = []
+    for _ in range(count):
+        values.append(read_value(buffer, dtype.lower(), offset))
+        offset = _skip_value(buffer, dtype.lower(), offset)
+    return values
+
+
+def read_object(buffer, components: dict, skip_arrays: bool = False) -> dict:
+    """Decode every indexed component of a GWY object, see index_components."""
+    return {name: read_value(buffer, dtype, offset, skip_arrays) for name, (dtype, offset, _) in components.items()}
+
+
+class GwyFile:
+    """
+    Offset index of the components of the root GwyContainer of a .gwy file.
+
+    The file is memory-mapped and indexed once, stepping over the data arrays, so opening a file reads little more
+    than the component names. Data fields are then decoded individually, only when they are requested.
+
+    Parameters
+    ----------
+    file_path : Path or str
+        Path to the .gwy file.
+    """
+
+    def __init__(self, file_path: Path | str):
+        self.file_path = Path(file_path)
+        with open(self.file_path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if self.buffer[:len(GWY_MAGIC)] != GWY_MAGIC:
+                raise ValueError("Not a valid GWY file")
+            root_obj, root_size, root_start = read_object_header(self.buffer, len(GWY_MAGIC))
+            if root_obj != 'GwyContainer':
+                raise ValueError("Not a valid GwyContainer object")
+
+            self.components = index_components(self.buffer, root_start, min(root_start + root_size, len(self.buffer)))
+            self.channels = self._find_data_fields()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self) -> GwyFile:
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.buffer.close()
+
+    def read_data_field(self, name: str, skip_arrays: bool = False) -> dict:
+        """Decode the data field object stored in the component called name."""
+        _, offset, _ = self.components[name]
+        return read_value(self.buffer, 'o', offset, skip_arrays)
+
+    def _find_data_fields(self) -> list:
+        # Data fields are the objects of a numbered channel with a 'data' component. Only their own components are
+        # indexed to find them
+        channels = []
+        for name, (dtype, offset, _) in self.components.items():
+            if dtype != 'o' or not name.split('/')[1:2] or not name.split('/')[1].isdigit():
+                continue
+            _, size, start = read_object_header(self.buffer, offset)
+            if 'data' in index_components(self.buffer, start, start + size):
+                channels.append((int(name.split('/')[1]), name))
+        return channels
+
+
+def open_gwy(file_path: Path | str, channel: str, frames: slice | None = None,
+             stride: int = 1) -> tuple[np.ndarray, dict, list]:
     """
     Extract image and metadata from the GWY file.
 
@@ -85,6 +202,11 @@ def open_gwy(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         Path to the .gwy file.
     channel : str
         Channel name to extract from the .gwy file.
+    frames : slice, optional
+        Range of frames to load. Each data field of the channel is a frame, only the selected ones are decoded.
+        Defaults to every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
 
     Returns
     -------
@@ -102,80 +224,42 @@ def open_gwy(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
     file_path = Path(file_path)
     
     try:
-        with open(file_path, 'rb') as f:
-            header = f.read(4).decode('utf-8')
-            if header != 'GWYP':
-                raise ValueError("Not a valid GWY file")
-
-            root_obj = read_str(f)
-            root_size = struct.unpack('<I', f.read(4))[0]
-            if root_obj != 'GwyContainer':
-                raise ValueError("Not a valid GwyContainer object")
-
-            channels = []
-            channel_meta = []
-            while f.tell() < root_size:
-                name, dtype, value = read_component(f)
-                if dtype == 'o' and isinstance(value, dict) and 'data' in value:
-                    ch_no = int(name.split('/')[1])
-                    channels.append((ch_no, name))
-                    channel_meta.append(value)
+        with GwyFile(file_path) as gwy_file:
+            channels = gwy_file.channels
 
             # logger.info(f"Found channels: {channels}")
 
-            # Ensure correct reshaping of image data
-            for meta in channel_meta:
-                xres = meta['xres']
-                yres = meta['yres']
-                meta['data'] = meta['data'].reshape((yres, xres)).T
-
             # Filter images for the specified channel
             channel_indices = [i for i, (_, name) in enumerate(channels) if f'/{channel}/data' in name]
             if not channel_indices:
                 # logger.warning(f"Channel '{channel}' not found. Using the first available channel instead.")
                 channel_indices = [0]  # Use the first available channel
-            
-            images = [channel_meta[i]['data'] for i in channel_indices]
-            meta = channel_meta[channel_indices[0]] if channel_indices else {}
-            if 'data' in meta:
-                meta.pop('data')
-            meta['channels'] = [channels[channel_indices[0]][1].split('/')[1]]  # Update the channel name
-
-            # Flip the image vertically and convert to nm
-            images = [np.flipud(image) for image in images]
-            images = [np.rot90(image, k=3) for image in images]
-            images = np.array(images) * 1e9
-            
-
-            # Calculate additional values
-            num_frames = len(images)
-            y_pixels, x_pixels = images[0].shape
-            x_range_nm = float(meta['xreal']) * 1e9  # Convert to nm
-            scan_rate = meta.get('scan_rate', 0)
-            fps = 1 / scan_rate if scan_rate != 0 else 0
-            line_rate = y_pixels * fps if y_pixels else 0
-            pixel_to_nanometre_scaling_factor = x_pixels / x_range_nm 
-
-            values = [
-                num_frames,
-                x_range_nm,
-                fps,
-                line_rate,
-                y_pixels,
-                x_pixels,
-                pixel_to_nanometre_scaling_factor,
-                meta['channels'][0],
-                None
-            ]
-
-            if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
-                raise ValueError(f"The length of the values in .gwy does not match the required metadata keys.")
-
-            # Create the metadata dictionary
-            file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
-            
-
-            return images, file_metadata, meta['channels']
+            channel_indices = [channel_indices[i] for i in select_frames(len(channel_indices), frames, stride)]
+
+            # Only the data fields of the channel are decoded
+            channel_meta = [gwy_file.read_data_field(channels[i][1]) for i in channel_indices]
+
+        # Ensure correct reshaping of image data
+        for meta in channel_meta:
+            xres = meta['xres']
+            yres = meta['yres']
+            meta['data'] = meta['data'].reshape((yres, xres)).T
+
+        images = [meta['data'] for meta in channel_meta]
+        meta = channel_meta[0]
+        if 'data' in meta:
+            meta.pop('data')
+        meta['channels'] = [channels[channel_indices[0]][1].split('/')[1]]  # Update the channel name
+
+        # Flip the image vertically and convert to nm
+        images = [np.flipud(image) for image in images]
+        images = [np.rot90(image, k=3) for image in images]
+        images = np.array(images) * 1e9
+
+        y_pixels, x_pixels = images[0].shape
+        file_metadata = _gwy_file_metadata(meta, len(images), y_pixels, x_pixels)
+
+        return images, file_metadata, meta['channels']
 
     except FileNotFoundError:
         logger.error(f"[{file_path}] File not found: {file_path}")
@@ -187,6 +271,56 @@ def open_gwy(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         logger.error(f"Error processing {file_path}: {e}")
         raise
 
+def _gwy_file_metadata(meta: dict, num_frames: int, y_pixels: int, x_pixels: int) -> dict:
+    """Build the standardised metadata dictionary from a GWY data field object."""
+    # Calculate additional values
+    x_range_nm = float(meta['xreal']) * 1e9  # Convert to nm
+    scan_rate = meta.get('scan_rate', 0)
+    fps = 1 / scan_rate if scan_rate != 0 else 0
+    line_rate = y_pixels * fps if y_pixels else 0
+    pixel_to_nanometre_scaling_factor = x_pixels / x_range_nm 
+
+    values = [
+        num_frames,
+        x_range_nm,
+        fps,
+        line_rate,
+        y_pixels,
+        x_pixels,
+        pixel_to_nanometre_scaling_factor,
+        meta['channels'][0],
+        None
+    ]
+
+    if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
+        raise ValueError(f"The length of the values in .gwy does not match the required metadata keys.")
+
+    # Create the metadata dictionary
+    return dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+
+def probe_gwy(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of a .gwy file from the data field of the channel, without decoding its array.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_gwy.
+    """
+    with GwyFile(file_path) as gwy_file:
+        channels = gwy_file.channels
+        channel_indices = [i for i, (_, name) in enumerate(channels) if f'/{channel}/data' in name]
+        if not channel_indices:
+            channel_indices = [0]  # Use the first available channel
+        meta = gwy_file.read_data_field(channels[channel_indices[0]][1], skip_arrays=True)
+
+    meta.pop('data', None)
+    meta['channels'] = [channels[channel_indices[0]][1].split('/')[1]]
+
+    # Images are rotated by 90 degrees when loaded, so yres is the number of rows
+    file_metadata = _gwy_file_metadata(meta, len(channel_indices), meta['yres'], meta['xres'])
+    return file_metadata, meta['channels']
+
 if __name__ == "__main__":
     file_path = 'data/SBS-PS_example_data.gwy'
     channel = 'None'  # Replace with the appropriate channel name
@@ -1,9 +1,19 @@
 from __future__ import annotations
 from pathlib import Path
+import struct
 import numpy as np
 from igor2 import binarywave
 import matplotlib.pyplot as plt
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .frame_selection import select_frames
+
+# Igor binary wave version 5 layout, from Igor Technical Note 003
+IBW_BIN_HEADER_5_FORMAT = "hhllll4l4llll"  # version, checksum, wfmSize, formulaSize, noteSize, dataEUnitsSize,
+                                           # dimEUnitsSize[4], dimLabelsSize[4], sIndicesSize, optionsSize1/2
+IBW_BIN_HEADER_5_SIZE = 64
+IBW_WAVE_HEADER_5_SIZE = 320
+IBW_WAVE_HEADER_5_NDIM_OFFSET = 68
+IBW_DIM_LABEL_BYTES = 32
 
 def _ibw_pixel_to_nm_scaling(scan: dict) -> float:
     """
@@ -19,14 +29,13 @@ def _ibw_pixel_to_nm_scaling(scan: dict) -> float:
     float
         A value corresponding to the real length of a single pixel.
     """
-    notes = {}
-    for line in str(scan["wave"]["note"]).split("\\r"):
-        if ":" in line:
-            key, val = line.split(":", 1)
-            notes[key.strip()] = val.strip()
+    notes = extract_metadata(str(scan["wave"]["note"]))
+    return _notes_pixel_to_nm_scaling(notes, scan["wave"]["wData"].shape)
+
+def _notes_pixel_to_nm_scaling(notes: dict, shape: tuple) -> float:
     return (
-        1/(float(notes["SlowScanSize"]) / scan["wave"]["wData"].shape[0] * 1e9),  # Convert to nm
-        1/(float(notes["FastScanSize"]) / scan["wave"]["wData"].shape[1] * 1e9),  # Convert to nm
+        1/(float(notes["SlowScanSize"]) / shape[0] * 1e9),  # Convert to nm
+        1/(float(notes["FastScanSize"]) / shape[1] * 1e9),  # Convert to nm
     )[0]
 
 def extract_metadata(notes: str) -> dict:
@@ -50,7 +59,8 @@ def extract_metadata(notes: str) -> dict:
             metadata[key.strip()] = val.strip()
     return metadata
 
-def open_ibw(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+def open_ibw(file_path: Path | str, channel: str, frames: slice | None = None,
+             stride: int = 1) -> tuple[np.ndarray, dict, list]:
     """
     Load image from Asylum Research (Igor) .ibw files.
 
@@ -60,6 +70,11 @@ def open_ibw(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         Path to the .ibw file.
     channel : str
         The channel to extract from the .ibw file.
+    frames : slice, optional
+        Range of frames to load. The file holds a single image, so the selection must include frame 0. Defaults to
+        every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
 
     Returns
     -------
@@ -73,6 +88,7 @@ def open_ibw(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
     ValueError
         If the channel is not found in the .ibw file.
     """
+    select_frames(1, frames, stride)
     file_path = Path(file_path)
     scan = binarywave.load(file_path)
     labels = []
@@ -88,6 +104,11 @@ def open_ibw(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
     image = np.flipud(image)
     scaling = _ibw_pixel_to_nm_scaling(scan)
     metadata = extract_metadata(str(scan["wave"]["note"]))
+
+    return image, _ibw_file_metadata(metadata, scaling, channel), labels
+
+def _ibw_file_metadata(metadata: dict, scaling: float, channel: str) -> dict:
+    """Build the standardised metadata dictionary from the note of an .ibw file."""
     metadata['scaling_factor'] = scaling
 
     num_frames = 1  # IBW files are typically single frames
@@ -119,7 +140,78 @@ def open_ibw(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
     # Create the metadata dictionary
     file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
 
-    return image, file_metadata, labels
+    return file_metadata
+
+def probe_ibw(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of an .ibw file without reading the wave data.
+
+    Only the binary headers, the wave note and the dimension labels are read, the wave data is skipped.
+
+    Parameters
+    ----------
+    file_path : Path | str
+        Path to the .ibw file.
+    channel : str, optional
+        The channel reported as the current channel. Defaults to the first channel.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_ibw.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a version 5 binary wave. Earlier versions have no dimension labels to name the channels,
+        and their wave is not decoded just to read the headers.
+    """
+    file_path = Path(file_path)
+    with open(file_path, "rb") as f:
+        bin_header = f.read(IBW_BIN_HEADER_5_SIZE)
+        # The version is always small, so it only reads correctly with the byte order the file was written in
+        byte_order = "<" if struct.unpack_from("<h", bin_header)[0] & 0xFF else ">"
+        version = struct.unpack_from(byte_order + "h", bin_header)[0]
+        if version != 5:
+            raise ValueError(f"Only the headers of version 5 .ibw files can be read, {file_path} is version {version}.")
+
+        header = struct.unpack(byte_order + IBW_BIN_HEADER_5_FORMAT, bin_header)
+        wfm_size, formula_size, note_size, data_e_units_size = header[2:6]
+        dim_e_units_sizes, dim_labels_sizes = header[6:10], header[10:14]
+
+        wave_header = f.read(IBW_WAVE_HEADER_5_SIZE)
+        shape = struct.unpack_from(byte_order + "4l", wave_header, IBW_WAVE_HEADER_5_NDIM_OFFSET)
+
+        # Skip the wave data and dependency formula
+        f.seek(IBW_BIN_HEADER_5_SIZE + wfm_size + formula_size)
+        note = f.read(note_size)
+        f.seek(data_e_units_size + sum(dim_e_units_sizes), 1)
+        dim_labels = f.read(sum(dim_labels_sizes))
+
+    labels = []
+    for label in _split_dim_labels(dim_labels):
+        if label:
+            labels.append(label.decode())
+    if channel not in labels:
+        channel = labels[0]
+
+    # Match the string conversion of the note bytes in open_ibw
+    metadata = extract_metadata(str(note))
+    scaling = _notes_pixel_to_nm_scaling(metadata, shape)
+    return _ibw_file_metadata(metadata, scaling, channel), labels
+
+def _split_dim_labels(dim_labels: bytes) -> list:
+    # Labels are stored as null terminated strings in 32 byte fields, longer labels continue into the next field
+    labels = []
+    label = b""
+    for start in range(0, len(dim_labels) - IBW_DIM_LABEL_BYTES + 1, IBW_DIM_LABEL_BYTES):
+        chunk = dim_labels[start:start + IBW_DIM_LABEL_BYTES]
+        if b"\x00" in chunk:
+            labels.append(label + chunk[:chunk.index(b"\x00")])
+            label = b""
+        else:
+            label += chunk
+    return labels
 
 if __name__ == "__main__":
     file_path = 'data/tops70s14_190g0000.ibw'
@@ -1,7 +1,10 @@
+from functools import partial
 import numpy as np
 from pathlib import Path
 import tifffile
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .raster_source import RasterFrameSource
+from .frame_selection import select_frames
 
 def _jpk_pixel_to_nm_scaling(tiff_page: tifffile.tifffile.TiffPage) -> float:
     length = tiff_page.tags["32834"].value  # Grid-uLength (fast)
@@ -26,70 +29,140 @@ def extract_metadata(tiff_page: tifffile.tifffile.TiffPage) -> dict:
     }
     return metadata
 
-def open_jpk(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+def _jpk_channel_list(tif: tifffile.TiffFile) -> dict:
+    channel_list = {}
+    for i, page in enumerate(tif.pages[1:]):  # [0] is thumbnail
+        available_channel = page.tags["32848"].value  # keys are hexadecimal values
+        tr_rt = "trace" if page.tags["32849"].value == 0 else "retrace"
+        channel_list[f"{available_channel}_{tr_rt}"] = i + 1
+    return channel_list
+
+def _jpk_file_metadata(tif: tifffile.TiffFile, channels: list, channel: str) -> dict:
+    """Build the standardised metadata dictionary from the tags of the first page of a .jpk file."""
+    metadata_page = tif.pages[0]
+    metadata = extract_metadata(metadata_page)
+    scaling_factor = _jpk_pixel_to_nm_scaling(metadata_page)
+    metadata['scaling_factor'] = scaling_factor
+
+    # Extract required values
+    num_frames = int(len(tif.pages[1:]) / len(channels))
+    x_range_nm = float(metadata.get('x_scan_length', '0')) * 1e9
+    y_pixels = int(metadata.get('y_scan_pixels', '0'))
+    x_pixels = int(metadata.get('x_scan_pixels', '0'))
+    scan_rate = float(metadata.get('Scan_Rate', '0'))
+    scan_speed = scan_rate / y_pixels if y_pixels else 0
+    fps = 1 / scan_speed if scan_speed != 0 else 0
+    pixel_to_nanometre_scaling_factor = scaling_factor
+
+    # Add calculated FPS to metadata
+    metadata['fps'] = fps
+
+    values = [
+        num_frames,
+        x_range_nm,
+        fps,
+        scan_rate,
+        y_pixels,
+        x_pixels,
+        pixel_to_nanometre_scaling_factor,
+        channel,
+        None
+    ]
+
+    if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
+        raise ValueError(f"The length of the values in .jpk does not match the required metadata keys.")
+
+    # Create the metadata dictionary
+    return dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+
+def _jpk_page_raw(tif: tifffile.TiffFile, page: tifffile.TiffPage, file_path: Path) -> np.ndarray:
+    """Memory-map the raw values of a page. Compressed or tiled pages cannot be mapped and are decoded instead."""
+    if page.is_memmappable:
+        dtype = np.dtype(tif.byteorder + page.dtype.char)
+        return np.memmap(file_path, dtype=dtype, mode="r", offset=page.dataoffsets[0], shape=page.shape)
+    return page.asarray()
+
+def _decode_jpk(raw: np.ndarray, scaling: float = 1.0, offset: float = 0.0, linear: bool = False) -> np.ndarray:
+    # Apply the page's linear scaling, then convert to nm
+    if linear:
+        return ((raw * scaling) + offset) * 1e9
+    return raw * 1e9
+
+def open_jpk(file_path: Path | str, channel: str, stream: bool = False, frames: slice | None = None,
+             stride: int = 1) -> tuple[np.ndarray | RasterFrameSource, dict, list]:
+    """
+    Extract image and metadata from a JPK .jpk TIFF file.
+
+    Uncompressed pages are memory-mapped, flipped as a view, and converted to nm in a single pass.
+
+    Parameters
+    ----------
+    file_path : Path or str
+        Path to the .jpk file.
+    channel : str
+        Channel name to extract from the .jpk file.
+    stream : bool
+        If True, the image is returned as a RasterFrameSource of shape (1, H, W) that decodes row blocks or tiles on
+        demand instead of the whole image. Defaults to False.
+    frames : slice, optional
+        Range of frames to load. The file holds a single image, so the selection must include frame 0. Defaults to
+        every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
+
+    Returns
+    -------
+    tuple[np.ndarray | RasterFrameSource, dict, list]
+        A tuple containing the image, its metadata, and the channel names.
+    """
+    select_frames(1, frames, stride)
     file_path = Path(file_path)
     with tifffile.TiffFile(file_path) as tif:
-        channel_list = {}
-        for i, page in enumerate(tif.pages[1:]):  # [0] is thumbnail
-            available_channel = page.tags["32848"].value  # keys are hexadecimal values
-            tr_rt = "trace" if page.tags["32849"].value == 0 else "retrace"
-            channel_list[f"{available_channel}_{tr_rt}"] = i + 1
+        channel_list = _jpk_channel_list(tif)
         
         if channel not in channel_list:
             channel = list(channel_list.keys())[0]
 
         channel_idx = channel_list[channel]
         channel_page = tif.pages[channel_idx]
-        image = channel_page.asarray()
         scaling_type = channel_page.tags["33027"].value
         if scaling_type == "LinearScaling":
-            scaling = channel_page.tags["33028"].value
-            offset = channel_page.tags["33029"].value
-            image = (image * scaling) + offset
-        elif scaling_type != "NullScaling":
+            decode = partial(_decode_jpk, scaling=channel_page.tags["33028"].value,
+                             offset=channel_page.tags["33029"].value, linear=True)
+        elif scaling_type == "NullScaling":
+            decode = _decode_jpk
+        else:
             raise ValueError(f"Scaling type {scaling_type} is not 'NullScaling' or 'LinearScaling'")
 
-        metadata_page = tif.pages[0]
-        metadata = extract_metadata(metadata_page)
-        scaling_factor = _jpk_pixel_to_nm_scaling(metadata_page)
-        metadata['scaling_factor'] = scaling_factor
         channels = list(channel_list.keys())
 
-        # Rotate the image 90 degrees clockwise
-        image_flipped = np.flipud(image) * 1e9
-
-        # Extract required values
-        num_frames = int(len(tif.pages[1:]) / len(channels))
-        x_range_nm = float(metadata.get('x_scan_length', '0')) * 1e9
-        y_pixels = int(metadata.get('y_scan_pixels', '0'))
-        x_pixels = int(metadata.get('x_scan_pixels', '0'))
-        scan_rate = float(metadata.get('Scan_Rate', '0'))
-        scan_speed = scan_rate / y_pixels if y_pixels else 0
-        fps = 1 / scan_speed if scan_speed != 0 else 0
-        pixel_to_nanometre_scaling_factor = scaling_factor
-
-        # Add calculated FPS to metadata
-        metadata['fps'] = fps
-
-        values = [
-            num_frames,
-            x_range_nm,
-            fps,
-            scan_rate,
-            y_pixels,
-            x_pixels,
-            pixel_to_nanometre_scaling_factor,
-            channel,
-            None
-        ]
-
-        if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
-            raise ValueError(f"The length of the values in .jpk does not match the required metadata keys.")
-
-        # Create the metadata dictionary
-        file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
-
-    return image_flipped, file_metadata, channels
+        # Flip vertically as a view of the raw page
+        raw = _jpk_page_raw(tif, channel_page, file_path)
+        image = RasterFrameSource(raw[::-1], decode)
+        if not stream:
+            image = image.read_rows(0, raw.shape[0])
+
+        file_metadata = _jpk_file_metadata(tif, channels, channel)
+
+    return image, file_metadata, channels
+
+def probe_jpk(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of a .jpk file from its TIFF tags, without decoding any image data.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_jpk.
+    """
+    file_path = Path(file_path)
+    with tifffile.TiffFile(file_path) as tif:
+        channels = list(_jpk_channel_list(tif).keys())
+        if channel not in channels:
+            channel = channels[0]
+        file_metadata = _jpk_file_metadata(tif, channels, channel)
+
+    return file_metadata, channels
 
 if __name__ == "__main__":
     file_path = 'data/save-2023.02.16-12.08.49.026.jpk'
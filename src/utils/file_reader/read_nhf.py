@@ -4,12 +4,14 @@ import logging
 from pathlib import Path
 import matplotlib.colors as color
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .frame_selection import select_frames
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def open_nhf(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+def open_nhf(file_path: Path | str, channel: str, frames: slice | None = None,
+             stride: int = 1) -> tuple[np.ndarray, dict, list]:
     """
     Extract image and metadata from the NHF file.
 
@@ -19,6 +21,11 @@ def open_nhf(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         Path to the .nhf file.
     channel : str
         Channel name to extract from the .nhf file.
+    frames : slice, optional
+        Range of frames to load. The file holds a single image, so the selection must include frame 0. Defaults to
+        every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
 
     Returns
     -------
@@ -26,6 +33,7 @@ def open_nhf(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         A tuple containing the image, its metadata, and parameter values.
     """
     # logger.info(f"Loading image from: {file_path}")
+    select_frames(1, frames, stride)
     file_path = Path(file_path)
 
     with h5py.File(file_path, 'r') as f:
@@ -83,35 +91,65 @@ def open_nhf(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         im = np.rot90(im, k=1, axes=(0, 1))
         im = np.fliplr(im) * 1e9
 
-        # Extract required values
-        num_frames = 1  # Assuming single frame for NHF
-        x_range_nm = scan_size * 1e9
-        y_pixels = y_pixel
-        x_pixels = x_pixel
-        fps = 1 / frame_acq_time if frame_acq_time != 0 else 0
-        line_rate = y_pixel * fps if y_pixel else 0
-        pixel_to_nanometre_scaling_factor = x_pixels/x_range_nm  # Assuming equal scaling in x and y
-
-        values = [
-            num_frames,
-            x_range_nm,
-            fps,
-            line_rate,
-            y_pixels,
-            x_pixels,
-            pixel_to_nanometre_scaling_factor,
-            channel,
-            None
-        ]
-
-        if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
-            raise ValueError(f"The length of the values in .nhf does not match the required metadata keys.")
-
-        # Create the metadata dictionary
-        file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+        file_metadata = _nhf_file_metadata(scan_size, x_pixel, y_pixel, frame_acq_time, channel)
 
     return im, file_metadata, available_channels
 
+def _nhf_file_metadata(scan_size: float, x_pixel: int, y_pixel: int, frame_acq_time: float, channel: str) -> dict:
+    """Build the standardised metadata dictionary from the scan attributes of a .nhf file."""
+    # Extract required values
+    num_frames = 1  # Assuming single frame for NHF
+    x_range_nm = scan_size * 1e9
+    y_pixels = y_pixel
+    x_pixels = x_pixel
+    fps = 1 / frame_acq_time if frame_acq_time != 0 else 0
+    line_rate = y_pixel * fps if y_pixel else 0
+    pixel_to_nanometre_scaling_factor = x_pixels/x_range_nm  # Assuming equal scaling in x and y
+
+    values = [
+        num_frames,
+        x_range_nm,
+        fps,
+        line_rate,
+        y_pixels,
+        x_pixels,
+        pixel_to_nanometre_scaling_factor,
+        channel,
+        None
+    ]
+
+    if len(values) != len(STANDARDISED_METADATA_DICT_KEYS):
+        raise ValueError(f"The length of the values in .nhf does not match the required metadata keys.")
+
+    # Create the metadata dictionary
+    return dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+
+def probe_nhf(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of a .nhf file from its HDF5 attributes, without reading any datasets.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_nhf.
+    """
+    file_path = Path(file_path)
+
+    with h5py.File(file_path, 'r') as f:
+        scan_attrs = f['/measurement_0'].attrs
+        scan_size = scan_attrs['image_size_x']
+        x_pixel = scan_attrs['image_points_per_line']
+        y_pixel = scan_attrs.get('image_number_of_lines', scan_attrs.get('image_number_of_lines_aquired'))
+        frame_acq_time = y_pixel / scan_attrs['image_line_rate']
+
+        group = f['/measurement_0/segment_0']
+        available_channels = [group[ds].attrs.get('name') for ds in group.keys() if ds.startswith('data')]
+
+    if channel not in available_channels:
+        channel = available_channels[0]
+
+    return _nhf_file_metadata(scan_size, x_pixel, y_pixel, frame_acq_time, channel), available_channels
+
 if __name__ == "__main__":
     file_path = 'data/SBS-PS_example_data.nhf'
     channel = 'Topography'  # Replace with the appropriate channel name
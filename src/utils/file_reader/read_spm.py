@@ -6,11 +6,51 @@ import logging
 import time as time_module
 import matplotlib.colors as colors
 from utils.constants import STANDARDISED_METADATA_DICT_KEYS
+from .raster_source import RasterFrameSource
+from .frame_selection import select_frames
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bruker layers store little endian signed integers, sized by the Bytes/pixel of the layer
+SPM_RAW_DTYPES = {2: "<i2", 4: "<i4", 8: "<i8"}
+
+
+class _MappedLayer:
+    """
+    Stand-in for the pixel data of a Bruker layer.
+
+    Records where the layer is in the file and the scale factors pySPM multiplies the raw values by, so the layer can
+    be memory-mapped and decoded in blocks instead of being unpacked in one go.
+    """
+
+    def __init__(self, offset: int, shape: tuple, dtype: str, factors: tuple = ()):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.factors = factors
+
+    def __mul__(self, factor: float) -> "_MappedLayer":
+        return _MappedLayer(self.offset, self.shape, self.dtype, self.factors + (factor,))
+
+    def decode(self, raw: np.ndarray) -> np.ndarray:
+        """Convert raw layer values the same way pySPM does."""
+        block = raw.astype(np.float64)
+        for factor in self.factors:
+            block *= factor
+        return block
+
+
+class _MappedBruker(pySPM.Bruker):
+    """pySPM Bruker reader whose get_channel returns a _MappedLayer as the pixels instead of reading the layer."""
+
+    def _get_raw_layer(self, i, debug=False, mock_data=False):
+        offset = int(self._get_layer_val(i, "Data offset"))
+        cols, rows = self._get_res(i)
+        bytes_per_pixel = int(self._get_layer_val(i, "Data length")) // (rows * cols)
+        return _MappedLayer(offset, (rows, cols), SPM_RAW_DTYPES[bytes_per_pixel])
+
 def spm_pixel_to_nm_scaling(filename: str, channel_data: pySPM.SPM.SPM_image) -> float:
     """
     Extract pixel to nm scaling from the SPM image metadata.
@@ -70,20 +110,32 @@ def extract_timestamp_from_file(file_path: Path) -> str:
         logger.error(f"Error extracting timestamp: {e}")
         return "Unknown"
 
-def open_spm(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, list]:
+def open_spm(file_path: Path | str, channel: str, stream: bool = False, frames: slice | None = None,
+             stride: int = 1) -> tuple[np.ndarray | RasterFrameSource, dict, list]:
     """
     Extract image and pixel to nm scaling from the Bruker .spm file.
 
+    The image is read through a memory map of the layer, flipped as a view, and converted to physical units in a
+    single pass.
+
     Parameters
     ----------
     file_path : Path or str
         Path to the .spm file.
     channel : str
         Channel name to extract from the .spm file.
+    stream : bool
+        If True, the image is returned as a RasterFrameSource of shape (1, H, W) that decodes row blocks or tiles on
+        demand instead of the whole image. Defaults to False.
+    frames : slice, optional
+        Range of frames to load. The file holds a single image, so the selection must include frame 0. Defaults to
+        every frame.
+    stride : int
+        Only load every stride-th frame of the range. Defaults to 1.
 
     Returns
     -------
-    tuple[np.ndarray, dict, list]
+    tuple[np.ndarray | RasterFrameSource, dict, list]
         A tuple containing the image, its metadata including pixel to nanometre scaling value, and parameter values.
 
     Raises
@@ -93,22 +145,23 @@ def open_spm(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
     ValueError
         If the channel is not found in the .spm file.
     """
+    select_frames(1, frames, stride)
     file_path = Path(file_path)
     filename = file_path.stem
     try:
-        scan = pySPM.Bruker(file_path)
-        labels = []
-        for layer in scan.layers:
-            for data in layer.get(b"@2:Image Data", []):
-                raw_channel_name = data.decode("latin1", errors="ignore")
-                channel_name = raw_channel_name.split('"')[1] if '"' in raw_channel_name else raw_channel_name
-                labels.append(channel_name)
+        scan = _MappedBruker(file_path)
+        labels = _spm_channel_labels(scan)
 
         if channel not in labels:
             channel = labels[0]
 
         channel_data = scan.get_channel(channel)
-        image = np.flipud(np.array(channel_data.pixels))
+        layer = channel_data.pixels
+        raw = np.memmap(file_path, dtype=layer.dtype, mode="r", offset=layer.offset, shape=layer.shape)
+        # Flip vertically as a view of the memory map
+        image = RasterFrameSource(raw[::-1], layer.decode)
+        if not stream:
+            image = image.read_rows(0, layer.shape[0])
     except FileNotFoundError:
         logger.error(f"[{filename}] File not found : {file_path}")
         raise
@@ -118,7 +171,23 @@ def open_spm(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
             raise ValueError(f"{channel} not in {file_path.suffix} channel list: {labels}") from e
         raise e
 
-    scaling_factor = spm_pixel_to_nm_scaling(filename, channel_data)
+    file_metadata = _spm_file_metadata(file_path, scan, channel_data, layer.shape, channel, labels)
+
+    return image, file_metadata, labels
+
+def _spm_channel_labels(scan: pySPM.Bruker) -> list:
+    labels = []
+    for layer in scan.layers:
+        for data in layer.get(b"@2:Image Data", []):
+            raw_channel_name = data.decode("latin1", errors="ignore")
+            channel_name = raw_channel_name.split('"')[1] if '"' in raw_channel_name else raw_channel_name
+            labels.append(channel_name)
+    return labels
+
+def _spm_file_metadata(file_path: Path, scan: pySPM.Bruker, channel_data: pySPM.SPM.SPM_image, image_shape: tuple,
+                       channel: str, labels: list) -> dict:
+    """Build the standardised metadata dictionary from the header of a .spm file."""
+    scaling_factor = spm_pixel_to_nm_scaling(file_path.stem, channel_data)
     timestamp = extract_timestamp_from_file(file_path)
     metadata = {
         'scaling_factor': scaling_factor,
@@ -129,7 +198,7 @@ def open_spm(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
 
     # Extract required values
     num_frames = 1  # Assuming single frame for SPM
-    y_pixels, x_pixels = image.shape
+    y_pixels, x_pixels = image_shape
     x_range_nm = x_pixels / scaling_factor
 
     # Attempt to extract the scan rate from available metadata
@@ -162,9 +231,26 @@ def open_spm(file_path: Path | str, channel: str) -> tuple[np.ndarray, dict, lis
         raise ValueError(f"The length of the values in .spm does not match the required metadata keys.")
 
     # Create the metadata dictionary
-    file_metadata = dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
+    return dict(zip(STANDARDISED_METADATA_DICT_KEYS, values))
 
-    return image, file_metadata, labels
+def probe_spm(file_path: Path | str, channel: str = None) -> tuple[dict, list]:
+    """
+    Read the metadata and channel list of a .spm file from its text header, without reading any image data.
+
+    Returns
+    -------
+    tuple[dict, list]
+        The standardised metadata and the channel names, as returned by open_spm.
+    """
+    file_path = Path(file_path)
+    # pySPM only parses the header on construction, and _MappedBruker never reads the layer from disk
+    scan = _MappedBruker(file_path)
+    labels = _spm_channel_labels(scan)
+    if channel not in labels:
+        channel = labels[0]
+
+    channel_data = scan.get_channel(channel)
+    return _spm_file_metadata(file_path, scan, channel_data, channel_data.pixels.shape, channel, labels), labels
 
 if __name__ == "__main__":
     file_path = 'data/0.0_00014.spm'